@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.backends.signals import connection_created
 
 
 class B2BrokerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "b2broker"
+
+    def ready(self):
+        from b2broker import cache, metrics
+
+        connection_created.connect(metrics.install_query_timer)
+        checks.register(cache.check_shared_cache, checks.Tags.caches)
@@ -0,0 +1,534 @@
+"""
+Async read endpoints for the ASGI entry point.
+
+They serve the same JSON:API documents as the ``list`` and ``retrieve``
+actions of ``WalletViewSet`` and ``TransactionViewSet`` but use Django's
+async ORM, so one worker can keep many slow or long-polling clients waiting
+without holding a thread each. Supported query parameters are
+``filter[<field>]`` on the viewset's ``filterset_fields``, ``sort`` on the
+viewset's ordering fields and ``page[number]`` / ``page[size]``. Sparse
+fieldsets, ``include`` and cursor pagination are rejected with a 400 rather
+than ignored.
+
+``transaction_stream`` pushes the new transactions and the balance of a
+wallet as Server-Sent Events. ``StreamApplication`` serves the same streams
+outside of Django's request handler, which would keep a thread busy for the
+life of every stream.
+"""
+
+import asyncio
+import io
+import json
+import math
+import re
+from decimal import Decimal, InvalidOperation
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework_json_api.django_filters import DjangoFilterBackend
+from rest_framework_json_api.filters import QueryParameterValidationFilter
+
+from b2broker.documents import (
+    TRANSACTION_VALUES,
+    WALLET_VALUES,
+    ResourceURL,
+    error_document,
+    page_number_document,
+    render,
+    transaction_resource,
+    wallet_resource,
+)
+from b2broker.filters import with_tiebreaker
+from b2broker.models import Wallet, Transaction
+from b2broker.notifier import notifier
+from b2broker.pagination import JsonApiPagination
+from b2broker.views import TransactionViewSet, WalletViewSet
+
+CONTENT_TYPE = "application/vnd.api+json"
+
+# Transactions sent per query while a stream catches up.
+STREAM_BATCH_SIZE = 100
+DEFAULT_STREAM_POLL_SECONDS = 15
+
+
+class InvalidQuery(Exception):
+    def __init__(self, status, detail, code, pointer="/data"):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+        self.code = code
+        self.pointer = pointer
+
+
+def json_api_response(document, status=200):
+    return HttpResponse(render(document), status=status, content_type=CONTENT_TYPE)
+
+
+def viewset_filters(viewset):
+    """
+    Return the ``filterset_fields`` of ``viewset`` as a field -> lookups
+    mapping.
+    """
+    fields = viewset.filterset_fields
+    if isinstance(fields, dict):
+        return fields
+    return {field: ("exact",) for field in fields}
+
+
+WALLET_FILTERS = viewset_filters(WalletViewSet)
+TRANSACTION_FILTERS = viewset_filters(TransactionViewSet)
+WALLET_SORT = WalletViewSet.ordering_fields
+TRANSACTION_SORT = TransactionViewSet.ordering_fields
+
+
+def filter_keys(filters):
+    """
+    Return the ``filter[...]`` keys the viewset's filterset accepts, once
+    ``.`` is replaced by ``__``.
+    """
+    return {
+        field if lookup == "exact" else f"{field}__{lookup}"
+        for field, lookups in filters.items()
+        for lookup in lookups
+    }
+
+
+def parse_filters(request, filters):
+    """
+    Return the ``{key: value}`` filters of the request, with the 400 errors
+    the viewsets raise for malformed, unknown and empty filters.
+    """
+    keys = filter_keys(filters)
+    parsed = {}
+    for param, values in request.GET.lists():
+        match = DjangoFilterBackend.filter_regex.match(param)
+        if not match:
+            continue
+        if not match["assoc"] or match["ldelim"] != "[" or match["rdelim"] != "]":
+            raise InvalidQuery(400, f"invalid query parameter: {param}", "invalid")
+        if not all(values):
+            raise InvalidQuery(
+                400, f"missing value for query parameter {param}", "invalid"
+            )
+        key = match["assoc"].replace(".", "__")
+        if key not in keys:
+            raise InvalidQuery(400, f"invalid filter[{key}]", "invalid")
+        parsed[key] = values[-1]
+    return parsed
+
+
+async def apply_query(request, queryset, filters, sort_fields):
+    for param in request.GET:
+        match = QueryParameterValidationFilter.query_regex.match(param)
+        if not match:
+            raise InvalidQuery(400, f"invalid query parameter: {param}", "invalid")
+        if param == "include" or param.startswith("fields["):
+            raise InvalidQuery(
+                400, f"{param} is not supported by the async endpoints", "invalid"
+            )
+    if JsonApiPagination.cursor_query_param in request.GET:
+        raise InvalidQuery(
+            400, "cursor pagination is not supported by the async endpoints", "invalid"
+        )
+
+    for key, value in parse_filters(request, filters).items():
+        if key == "wallet":
+            if (
+                not value.isdigit()
+                or not await Wallet.objects.filter(pk=value).aexists()
+            ):
+                raise InvalidQuery(
+                    400,
+                    "Select a valid choice. That choice is not one of the "
+                    "available choices.",
+                    "invalid_choice",
+                    pointer="/data/relationships/wallet",
+                )
+            queryset = queryset.filter(wallet_id=value)
+            continue
+        if key == "id" and not value.isdigit():
+            raise InvalidQuery(
+                400, "Enter a number.", "invalid", pointer=f"/data/attributes/{key}"
+            )
+        if key.startswith("balance__"):
+            try:
+                value = Decimal(value)
+            except InvalidOperation:
+                value = None
+            if value is None or not value.is_finite():
+                raise InvalidQuery(
+                    400,
+                    "Enter a number.",
+                    "invalid",
+                    pointer=f"/data/attributes/{key}",
+                )
+        queryset = queryset.filter(**{key: value})
+
+    ordering = []
+    for term in filter(None, request.GET.get("sort", "").split(",")):
+        field = term.lstrip("-")
+        if field not in sort_fields:
+            raise InvalidQuery(400, f"invalid sort parameter: {field}", "invalid")
+        ordering.append(term)
+    return queryset.order_by(*(with_tiebreaker(ordering) or ["id"]))
+
+
+def get_page_size(request):
+    page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+    try:
+        requested = int(request.GET[JsonApiPagination.page_size_query_param])
+    except (KeyError, ValueError):
+        return page_size
+    if requested <= 0:
+        return page_size
+    return min(requested, JsonApiPagination.max_page_size)
+
+
+async def paginated_response(request, queryset, values, build_resource, url):
+    page_size = get_page_size(request)
+    count = await queryset.acount()
+    pages = max(1, math.ceil(count / page_size))
+    page = request.GET.get(JsonApiPagination.page_query_param, "1")
+    if not page.isdigit() or not 1 <= int(page) <= pages:
+        raise InvalidQuery(404, "Invalid page.", "not_found")
+    page = int(page)
+
+    offset = (page - 1) * page_size
+    resources = [
+        build_resource(row, url)
+        async for row in queryset.values(*values)[offset : offset + page_size]
+    ]
+    return json_api_response(
+        page_number_document(
+            resources,
+            request,
+            JsonApiPagination.page_query_param,
+            page,
+            pages,
+            count,
+        )
+    )
+
+
+async def detail_response(queryset, pk, values, build_resource, url):
+    row = (
+        await queryset.filter(pk=pk).values(*values).afirst() if pk.isdigit() else None
+    )
+    if row is None:
+        return json_api_response(
+            error_document(404, "Not found.", "not_found", pointer=None), status=404
+        )
+    return json_api_response({"data": build_resource(row, url)})
+
+
+def handle_invalid_query(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except InvalidQuery as exc:
+            return json_api_response(
+                error_document(exc.status, exc.detail, exc.code, exc.pointer),
+                status=exc.status,
+            )
+
+    return wrapper
+
+
+@require_safe
+@handle_invalid_query
+async def wallet_list(request):
+    queryset = await apply_query(
+        request, Wallet.objects.all(), WALLET_FILTERS, WALLET_SORT
+    )
+    url = ResourceURL(request, "wallet-detail")
+    return await paginated_response(
+        request, queryset, WALLET_VALUES, wallet_resource, url
+    )
+
+
+@require_safe
+@handle_invalid_query
+async def wallet_detail(request, pk):
+    url = ResourceURL(request, "wallet-detail")
+    # The viewsets filter and validate the query of detail requests too.
+    queryset = await apply_query(
+        request, Wallet.objects.all(), WALLET_FILTERS, WALLET_SORT
+    )
+    return await detail_response(queryset, pk, WALLET_VALUES, wallet_resource, url)
+
+
+@require_safe
+@handle_invalid_query
+async def transaction_list(request):
+    queryset = await apply_query(
+        request,
+        Transaction.objects.all(),
+        TRANSACTION_FILTERS,
+        TRANSACTION_SORT,
+    )
+    url = ResourceURL(request, "transaction-detail")
+    return await paginated_response(
+        request, queryset, TRANSACTION_VALUES, transaction_resource, url
+    )
+
+
+@require_safe
+@handle_invalid_query
+async def transaction_detail(request, pk):
+    url = ResourceURL(request, "transaction-detail")
+    queryset = await apply_query(
+        request, Transaction.objects.all(), TRANSACTION_FILTERS, TRANSACTION_SORT
+    )
+    return await detail_response(
+        queryset, pk, TRANSACTION_VALUES, transaction_resource, url
+    )
+
+
+def get_stream_poll_seconds():
+    return getattr(
+        settings, "B2BROKER_STREAM_POLL_SECONDS", DEFAULT_STREAM_POLL_SECONDS
+    )
+
+
+def server_sent_event(event, data, id=None):
+    lines = [f"id: {id}"] if id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def stream_query(function):
+    """
+    Run ``function`` for a stream on the shared executor and close its
+    database connection afterwards.
+
+    The async ORM would run it on the thread Django dedicates to the request
+    for its whole life, together with a connection kept open between polls,
+    so every open stream would hold a thread and a database connection.
+    """
+
+    @wraps(function)
+    def closing(*args):
+        try:
+            return function(*args)
+        finally:
+            connection.close()
+
+    return sync_to_async(closing, thread_sensitive=False)
+
+
+@stream_query
+def last_transaction_id(wallet_id):
+    """
+    Return the id of the last transaction of the wallet, 0 if it has none,
+    or ``None`` if the wallet does not exist.
+    """
+    if not Wallet.objects.filter(pk=wallet_id).exists():
+        return None
+    return (
+        Transaction.objects.filter(wallet_id=wallet_id)
+        .order_by("-pk")
+        .values_list("pk", flat=True)
+        .first()
+    ) or 0
+
+
+@stream_query
+def poll_wallet(wallet_id, last_id):
+    """
+    Return up to ``STREAM_BATCH_SIZE`` transactions of the wallet after
+    ``last_id`` and the wallet row, ``None`` once it is deleted.
+    """
+    rows = list(
+        Transaction.objects.filter(wallet_id=wallet_id, pk__gt=last_id)
+        .order_by("pk")
+        .values(*TRANSACTION_VALUES)[:STREAM_BATCH_SIZE]
+    )
+    wallet = Wallet.objects.filter(pk=wallet_id).values(*WALLET_VALUES).first()
+    return rows, wallet
+
+
+async def transaction_events(request, wallet_id, last_id):
+    """
+    Yield a ``balance`` event with the current balance, then a
+    ``transaction`` event (whose id is the transaction id) for every
+    transaction of the wallet after ``last_id`` and a ``balance`` event
+    whenever the balance changes, until the wallet is deleted.
+
+    Commits made by this process wake the stream up through the notifier;
+    those of other processes are picked up by re-querying every
+    ``B2BROKER_STREAM_POLL_SECONDS``, when a keep-alive comment is sent.
+    Between polls the stream holds no database connection.
+    """
+    transaction_url = ResourceURL(request, "transaction-detail")
+    wallet_url = ResourceURL(request, "wallet-detail")
+    poll_seconds = get_stream_poll_seconds()
+    balance = None
+    with notifier.subscribe(wallet_id) as subscription:
+        while True:
+            subscription.clear()
+            rows, wallet = await poll_wallet(wallet_id, last_id)
+            for row in rows:
+                resource = transaction_resource(row, transaction_url)
+                yield server_sent_event("transaction", resource, id=row["id"])
+                last_id = row["id"]
+
+            if wallet is None:
+                return
+            if wallet["balance"] != balance:
+                balance = wallet["balance"]
+                resource = wallet_resource(wallet, wallet_url, fields={"balance"})
+                yield server_sent_event("balance", resource)
+
+            if len(rows) == STREAM_BATCH_SIZE:
+                continue
+            if not await subscription.wait(poll_seconds):
+                yield ": keep-alive\n\n"
+
+
+STREAM_HEADERS = {
+    "Content-Type": "text/event-stream",
+    "Cache-Control": "no-cache",
+    # Keep reverse proxies from buffering the events.
+    "X-Accel-Buffering": "no",
+}
+
+
+async def open_stream(request, pk):
+    """
+    Return the events of the stream ``request`` asks for, or raise
+    ``InvalidQuery``.
+    """
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id is not None and not last_event_id.isdigit():
+        raise InvalidQuery(
+            400, "Last-Event-ID must be a transaction id.", "invalid", pointer=None
+        )
+    last_id = await last_transaction_id(int(pk)) if pk.isdigit() else None
+    if last_id is None:
+        raise InvalidQuery(404, "Not found.", "not_found", pointer=None)
+    if last_event_id is not None:
+        last_id = int(last_event_id)
+    return transaction_events(request, int(pk), last_id)
+
+
+@require_safe
+@handle_invalid_query
+async def transaction_stream(request, pk):
+    """
+    ``text/event-stream`` of the transactions committed to a wallet, starting
+    after the transaction id in the ``Last-Event-ID`` header, or with the
+    next new transaction when there is none. Only served from the ASGI
+    entry point: a WSGI worker would be taken for the life of the stream.
+    """
+    if not isinstance(request, ASGIRequest):
+        raise InvalidQuery(
+            501,
+            "Transaction streams are only served from the ASGI entry point.",
+            "not_implemented",
+            pointer=None,
+        )
+    return StreamingHttpResponse(await open_stream(request, pk), headers=STREAM_HEADERS)
+
+
+STREAM_PATH = re.compile(r"^/wallets/(?P<pk>[^/]+)/transactions/stream$")
+
+
+class StreamApplication:
+    """
+    ASGI application serving the transaction streams and handing every other
+    request to ``application``, Django's ASGI handler.
+
+    Django runs each request in a thread sensitive context, whose thread
+    stays reserved until the response is sent, i.e. for the whole life of a
+    stream. Here a stream is only a task: its queries run on the shared
+    executor (see ``stream_query``) and an idle stream holds neither a thread
+    nor a database connection. Middleware is not run for streams.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            path = scope["path"].removeprefix(scope.get("root_path", ""))
+            match = STREAM_PATH.match(path)
+            if match:
+                return await self.stream(scope, receive, send, match["pk"])
+        await self.application(scope, receive, send)
+
+    async def stream(self, scope, receive, send, pk):
+        if scope["method"] not in ("GET", "HEAD"):
+            return await self.respond(send, 405, {"Allow": "GET, HEAD"}, b"")
+        request = ASGIRequest(scope, io.BytesIO())
+        try:
+            # Resolved lazily by the event URLs otherwise, mid-stream.
+            request.get_host()
+            events = await open_stream(request, pk)
+        except DisallowedHost:
+            return await self.respond(send, 400, {}, b"")
+        except InvalidQuery as exc:
+            document = error_document(exc.status, exc.detail, exc.code, exc.pointer)
+            return await self.respond(
+                send, exc.status, {"Content-Type": CONTENT_TYPE}, render(document)
+            )
+        if scope["method"] == "HEAD":
+            await events.aclose()
+            return await self.respond(send, 200, STREAM_HEADERS, b"")
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": encode_headers(STREAM_HEADERS),
+            }
+        )
+
+        async def send_events():
+            async for event in events:
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": event.encode(),
+                        "more_body": True,
+                    }
+                )
+            await send({"type": "http.response.body", "body": b""})
+
+        async def wait_for_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        sender = asyncio.create_task(send_events())
+        listener = asyncio.create_task(wait_for_disconnect())
+        try:
+            await asyncio.wait((sender, listener), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sender.cancel()
+            listener.cancel()
+            await asyncio.gather(sender, listener, return_exceptions=True)
+            await events.aclose()
+        if not sender.cancelled() and sender.exception() is not None:
+            raise sender.exception()
+
+    @staticmethod
+    async def respond(send, status, headers, body):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": encode_headers(headers),
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def encode_headers(headers):
+    return [(name.lower().encode(), value.encode()) for name, value in headers.items()]
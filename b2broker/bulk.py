@@ -0,0 +1,197 @@
+from collections import defaultdict
+from decimal import Decimal
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from b2broker.cache import bump_versions, wallet_scope
+from b2broker.models import (
+    BalanceCheckpoint,
+    OutboxEvent,
+    Wallet,
+    WalletDailyRollup,
+    Transaction,
+)
+from b2broker.notifier import notify_wallets
+from b2broker.parsers import type_conflict
+from b2broker.serializers import TransactionIngestSerializer
+
+DEFAULT_CHUNK_SIZE = 1000
+
+RESOURCE_TYPE = "transactions"
+
+DUPLICATE_TXID = "transaction with this txid already exists."
+UNKNOWN_WALLET = 'Invalid pk "{pk}" - object does not exist.'
+
+
+def get_chunk_size():
+    return getattr(settings, "B2BROKER_BULK_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def error_status(index, status, detail, field=None):
+    error = {"status": str(status), "detail": str(detail)}
+    if field == "type":
+        error["source"] = {"pointer": f"/data/{index}/type"}
+    elif field is not None:
+        pointer = "relationships" if field == "wallet" else "attributes"
+        error["source"] = {"pointer": f"/data/{index}/{pointer}/{field}"}
+    return error
+
+
+def ingest_transactions(resources, chunk_size=None):
+    """
+    Validate and insert many transactions at once.
+
+    Returns one result dict per input resource, in input order. Accepted
+    resources get a ``201`` status and the id of the inserted row; rejected
+    ones carry JSON:API error objects. Resource objects that are not
+    ``transactions`` get the same ``409`` as on the single create endpoint.
+
+    Every accepted row and the matching wallet balance changes are written in
+    a single database transaction.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    results = [None] * len(resources)
+    accepted = {}
+
+    for index, resource in enumerate(resources):
+        if resource.get("type") != RESOURCE_TYPE:
+            conflict = type_conflict(resource, RESOURCE_TYPE)
+            results[index] = {
+                "status": str(conflict.status_code),
+                "errors": [
+                    error_status(index, conflict.status_code, conflict.detail, "type")
+                ],
+            }
+            continue
+        serializer = TransactionIngestSerializer(data=resource)
+        if not serializer.is_valid():
+            results[index] = {
+                "status": "400",
+                "errors": [
+                    error_status(index, 400, detail, field)
+                    for field, details in serializer.errors.items()
+                    for detail in details
+                ],
+            }
+            continue
+        data = serializer.validated_data
+        if data["txid"] in accepted:
+            results[index] = {
+                "status": "409",
+                "errors": [error_status(index, 409, DUPLICATE_TXID, "txid")],
+            }
+            continue
+        accepted[data["txid"]] = (index, data)
+
+    insert_transactions(accepted, results, chunk_size)
+    return results
+
+
+def insert_transactions(accepted, results, chunk_size=None):
+    """
+    Insert already validated transactions in a single database transaction.
+
+    ``accepted`` maps each txid to ``(index, data)``, where ``data`` holds the
+    ``wallet`` id and the ``amount``. The outcome of every item is stored at
+    its index in ``results``, like ``ingest_transactions`` returns them.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    for attempt in range(2):
+        try:
+            inserted = _insert(accepted, results, chunk_size)
+        except IntegrityError:
+            # A concurrent writer inserted one of our txids after the
+            # uniqueness check; the rejected rows are picked up on retry.
+            if attempt:
+                raise
+        else:
+            break
+
+    for txid, pk in inserted.items():
+        index, _ = accepted[txid]
+        results[index] = {"status": "201", "id": str(pk)}
+
+
+def _insert(accepted, results, chunk_size):
+    txids = list(accepted)
+    wallet_ids = {data["wallet"] for _, data in accepted.values()}
+
+    with transaction.atomic():
+        existing_wallets = set()
+        for wallet_chunk in chunked(sorted(wallet_ids), chunk_size):
+            existing_wallets.update(
+                Wallet.objects.filter(pk__in=wallet_chunk).values_list("pk", flat=True)
+            )
+        existing_txids = set()
+        for txid_chunk in chunked(txids, chunk_size):
+            existing_txids.update(
+                Transaction.objects.filter(txid__in=txid_chunk).values_list(
+                    "txid", flat=True
+                )
+            )
+
+        rows = []
+        deltas = defaultdict(Decimal)
+        for txid in txids:
+            index, data = accepted[txid]
+            if data["wallet"] not in existing_wallets:
+                results[index] = {
+                    "status": "400",
+                    "errors": [
+                        error_status(
+                            index,
+                            400,
+                            UNKNOWN_WALLET.format(pk=data["wallet"]),
+                            "wallet",
+                        )
+                    ],
+                }
+            elif txid in existing_txids:
+                results[index] = {
+                    "status": "409",
+                    "errors": [error_status(index, 409, DUPLICATE_TXID, "txid")],
+                }
+            else:
+                amount = data["amount"] or Decimal("0.0")
+                rows.append(
+                    Transaction(wallet_id=data["wallet"], txid=txid, amount=amount)
+                )
+                deltas[data["wallet"]] += amount
+
+        Transaction.objects.bulk_create(rows, batch_size=chunk_size)
+        Wallet.apply_balance_deltas(deltas)
+
+        if not connection.features.can_return_rows_from_bulk_insert:
+            for row_chunk in chunked(rows, chunk_size):
+                pks = dict(
+                    Transaction.objects.filter(
+                        txid__in=[row.txid for row in row_chunk]
+                    ).values_list("txid", "pk")
+                )
+                for row in row_chunk:
+                    row.pk = pks[row.txid]
+        BalanceCheckpoint.cover_inserted(rows)
+        WalletDailyRollup.apply_changes(
+            (row.wallet_id, row.amount, row.created_at, 1) for row in rows
+        )
+        OutboxEvent.objects.bulk_create(
+            (
+                OutboxEvent.for_transaction(
+                    OutboxEvent.CREATED, row.pk, row.wallet_id, row.txid, row.amount
+                )
+                for row in rows
+            ),
+            batch_size=chunk_size,
+        )
+        transaction.on_commit(
+            partial(bump_versions, [wallet_scope(wallet_id) for wallet_id in deltas])
+        )
+        transaction.on_commit(partial(notify_wallets, list(deltas)))
+        return {row.txid: row.pk for row in rows}
@@ -0,0 +1,270 @@
+"""
+Versioned response cache and ETags for the read endpoints.
+
+Every read response belongs to a *scope* (one wallet, one transaction or the
+whole ledger) whose version number lives in the cache. Writes bump the
+versions of the scopes they touch once they commit. Cached responses are
+stored under the version they were built from, which makes the stale ones
+unreachable (the cache backend's own size bound evicts them eventually), and
+the same version is the weak ETag of the response.
+
+Versions are only seen by every process when the cache is shared. The
+response cache is therefore never used with a per-process backend, and ETags
+are only sent with a shared backend unless ``B2BROKER_ETAGS`` says otherwise.
+"""
+
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+
+from b2broker.db_routers import read_alias
+
+GLOBAL_SCOPE = "ledger"
+
+
+def wallet_scope(wallet_id):
+    return f"wallet:{wallet_id}"
+
+
+def transaction_scope(transaction_id):
+    return f"transaction:{transaction_id}"
+
+
+# Bumped when a wallet is deleted together with all of its transactions,
+# rather than the scope of every one of them.
+DELETED_WALLETS_SCOPE = "wallets:deleted"
+
+
+DEFAULT_TIMEOUT = 300
+
+# Backends whose versions other processes (workers, management commands)
+# cannot bump.
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def get_cache():
+    return caches[getattr(settings, "B2BROKER_CACHE_ALIAS", "default")]
+
+
+def is_shared():
+    alias = getattr(settings, "B2BROKER_CACHE_ALIAS", "default")
+    return settings.CACHES[alias]["BACKEND"] not in PROCESS_LOCAL_BACKENDS
+
+
+def is_enabled():
+    # A per-process cache would keep serving the responses that writes of
+    # other processes invalidated until they time out.
+    return getattr(settings, "B2BROKER_RESPONSE_CACHE", False) and is_shared()
+
+
+def etags_enabled():
+    enabled = getattr(settings, "B2BROKER_ETAGS", None)
+    if enabled is None:
+        enabled = is_shared()
+    return enabled
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Warn when the response cache or ETags are turned on with a per-process
+    ``B2BROKER_CACHE_ALIAS``: the former stays off, the latter would not
+    change on writes made by other processes.
+    """
+    if is_shared():
+        return []
+    alias = getattr(settings, "B2BROKER_CACHE_ALIAS", "default")
+    backend = settings.CACHES[alias]["BACKEND"]
+    hint = "Point B2BROKER_CACHE_ALIAS at a shared cache, e.g. set REDIS_URL."
+    warnings = []
+    if getattr(settings, "B2BROKER_RESPONSE_CACHE", False):
+        warnings.append(
+            checks.Warning(
+                f"B2BROKER_RESPONSE_CACHE is ignored with the {backend} backend.",
+                hint=hint,
+                id="b2broker.W001",
+            )
+        )
+    if getattr(settings, "B2BROKER_ETAGS", None):
+        warnings.append(
+            checks.Warning(
+                f"B2BROKER_ETAGS with the {backend} backend sends ETags that "
+                "writes of other processes do not change.",
+                hint=hint,
+                id="b2broker.W002",
+            )
+        )
+    return warnings
+
+
+def _version_key(scope):
+    return f"b2broker:version:{scope}"
+
+
+def get_version(scope):
+    """
+    Return the current version of a scope, initialising it if needed.
+    """
+    cache = get_cache()
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        # Start from a timestamp rather than 1 so that a version evicted from
+        # the cache can never come back with a number that was already used.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_versions(scopes):
+    cache = get_cache()
+    for scope in {*scopes, GLOBAL_SCOPE}:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def request_fingerprint(request):
+    return hashlib.sha256(
+        "\n".join(
+            (request.build_absolute_uri(), request.META.get("HTTP_ACCEPT", ""))
+        ).encode()
+    ).hexdigest()
+
+
+def response_key(scope, version, request):
+    return f"b2broker:response:{scope}:{version}:{request_fingerprint(request)}"
+
+
+def response_etag(version, request):
+    """
+    Weak ETag of a read response; it changes whenever the scope is written.
+    """
+    return "W/" + quote_etag(f"{version}-{request_fingerprint(request)[:16]}")
+
+
+def etag_matches(etag, request):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    # If-None-Match uses the weak comparison function.
+    candidates = {candidate.removeprefix("W/") for candidate in parse_etags(header)}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+def cached_headers(response):
+    """
+    The headers the view set on ``response`` (``Content-Type``, ``Vary``,
+    ``Allow``), to serve again with the cached content. The ETag depends on
+    the version the hit is served under.
+    """
+    return {name: value for name, value in response.items() if name != "ETag"}
+
+
+class CacheStats:
+    """
+    Thread safe hit/miss counters of the response cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+stats = CacheStats()
+
+
+class CachedReadMixin:
+    """
+    Adds a version based ETag to ``list`` and ``retrieve`` responses and
+    answers a matching ``If-None-Match`` with ``304 Not Modified`` without
+    running the view when ETags are enabled, and serves the responses from
+    the cache when ``B2BROKER_RESPONSE_CACHE`` is enabled.
+    """
+
+    def get_cache_scope(self):
+        """
+        Return the scope whose writes invalidate the current response, a
+        tuple of scopes, or ``None`` to bypass the cache.
+        """
+        return GLOBAL_SCOPE
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        scope = self.get_cache_scope()
+        send_etags = etags_enabled()
+        cache = get_cache() if is_enabled() else None
+        if scope is None or not (send_etags or cache):
+            return handler(request, *args, **kwargs)
+
+        # Read the version *before* the response is built, so a write
+        # committed meanwhile leaves both the ETag and the cached entry stale
+        # rather than wrongly fresh.
+        if isinstance(scope, tuple):
+            version = "-".join(str(get_version(part)) for part in scope)
+            scope = "+".join(scope)
+        else:
+            version = get_version(scope)
+        etag = response_etag(version, request)
+        if send_etags and etag_matches(etag, request):
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+
+        if cache is not None:
+            key = response_key(scope, version, request)
+            cached = cache.get(key)
+            if cached is not None:
+                stats.hit()
+                content, headers = cached
+                response = HttpResponse(content, headers=headers)
+                if send_etags:
+                    response["ETag"] = etag
+                return response
+            stats.miss()
+
+        response = handler(request, *args, **kwargs)
+        # A replica may lag behind the version read above, so only responses
+        # read from the primary are tagged and cached.
+        if response.status_code == 200 and read_alias.get() is None:
+            if send_etags:
+                response["ETag"] = etag
+            if cache is not None:
+                timeout = getattr(
+                    settings, "B2BROKER_RESPONSE_CACHE_TIMEOUT", DEFAULT_TIMEOUT
+                )
+                response.add_post_render_callback(
+                    lambda rendered: cache.set(
+                        key, (rendered.content, cached_headers(rendered)), timeout
+                    )
+                )
+        return response
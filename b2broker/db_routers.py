@@ -0,0 +1,135 @@
+"""
+Read replica routing.
+
+``ReplicaPinMiddleware`` picks one of the ``B2BROKER_READ_REPLICAS`` database
+aliases for each safe (GET, HEAD, OPTIONS) request and ``ReplicaRouter``
+sends the reads of the ``b2broker`` models made while handling it there.
+Everything else, writes, reads inside write requests, management commands
+and background threads, uses the primary.
+
+A client that has just written is pinned to the primary for
+``B2BROKER_REPLICA_PIN_SECONDS`` with a cookie, so it reads its own writes
+while the replicas catch up.
+"""
+
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = "b2broker_primary_pin"
+DEFAULT_PIN_SECONDS = 5
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# The replica alias the current request reads from, if any.
+read_alias = ContextVar("b2broker_read_alias", default=None)
+
+
+def get_replicas():
+    return getattr(settings, "B2BROKER_READ_REPLICAS", ())
+
+
+def bind_read_alias(chunks, alias):
+    """
+    Iterate ``chunks`` reading from ``alias``. Streaming responses are
+    consumed after the middleware returns, so their queries would otherwise
+    run on the primary.
+    """
+    chunks = iter(chunks)
+    while True:
+        token = read_alias.set(alias)
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            read_alias.reset(token)
+        yield chunk
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if alias is None or model._meta.app_label != "b2broker":
+            return None
+        # Reads in a transaction on the primary must see its writes.
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """
+    Routes the reads of safe requests to a replica, unless the client wrote
+    recently, and pins writing clients to the primary.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        alias = self.choose_alias(request)
+        token = read_alias.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        return self.process_response(request, response, alias)
+
+    async def __acall__(self, request):
+        alias = self.choose_alias(request)
+        token = read_alias.set(alias)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        return self.process_response(request, response, alias)
+
+    def choose_alias(self, request):
+        replicas = get_replicas()
+        if (
+            replicas
+            and request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES
+        ):
+            return random.choice(replicas)
+        return None
+
+    def process_response(self, request, response, alias):
+        # Async streams (the transaction streams) are woken up by commits on
+        # the primary and keep reading from it.
+        if alias is not None and response.streaming and not response.is_async:
+            response.streaming_content = bind_read_alias(
+                response.streaming_content, alias
+            )
+
+        if get_replicas() and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=getattr(
+                    settings, "B2BROKER_REPLICA_PIN_SECONDS", DEFAULT_PIN_SECONDS
+                ),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
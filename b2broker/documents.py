@@ -0,0 +1,131 @@
+"""
+JSON:API documents built straight from ``QuerySet.values()`` rows.
+
+The output is byte for byte what ``WalletSerializer`` and
+``TransactionSerializer`` produce through the JSON:API renderer, without
+instantiating serializer fields per row.
+"""
+
+import decimal
+import json
+from decimal import Decimal
+
+from django.urls import reverse
+from rest_framework.utils.urls import replace_query_param
+
+WALLET_VALUES = ("id", "label", "balance")
+TRANSACTION_VALUES = ("id", "wallet_id", "txid", "amount")
+
+# Column each serializer field of a resource is read from.
+WALLET_COLUMNS = {"label": "label", "balance": "balance"}
+TRANSACTION_COLUMNS = {"wallet": "wallet_id", "txid": "txid", "amount": "amount"}
+
+# Same precision and scale as ``DecimalField(max_digits=36, decimal_places=18)``.
+AMOUNT_EXPONENT = Decimal(1).scaleb(-18)
+AMOUNT_CONTEXT = decimal.Context(prec=36)
+
+
+def format_amount(value):
+    """
+    Format an amount exactly like ``TransactionSerializer`` does, in a single
+    quantize and format step.
+    """
+    return format(value.quantize(AMOUNT_EXPONENT, context=AMOUNT_CONTEXT), "f")
+
+
+class ResourceURL:
+    """
+    Builds absolute detail URLs of one resource type from a prefix resolved
+    once per request, instead of reversing the route for every row.
+    """
+
+    placeholder = "__pk__"
+
+    def __init__(self, request, view_name):
+        url = request.build_absolute_uri(
+            reverse(view_name, kwargs={"pk": self.placeholder})
+        )
+        self.prefix, _, self.suffix = url.partition(self.placeholder)
+
+    def __call__(self, pk):
+        return f"{self.prefix}{pk}{self.suffix}"
+
+
+def sparse_columns(columns, fields):
+    """
+    Return the ``values()`` columns needed for the ``fields`` fieldset, or
+    for every field when it is ``None``.
+    """
+    return ("id",) + tuple(
+        column for field, column in columns.items() if fields is None or field in fields
+    )
+
+
+def wallet_resource(row, url, fields=None):
+    attributes = {}
+    if fields is None or "label" in fields:
+        attributes["label"] = row["label"]
+    if fields is None or "balance" in fields:
+        attributes["balance"] = str(row["balance"] or Decimal("0.0"))
+    return {
+        "type": "wallets",
+        "id": str(row["id"]),
+        "attributes": attributes,
+        "links": {"self": url(row["id"])},
+    }
+
+
+def transaction_resource(row, url, fields=None):
+    attributes = {}
+    if fields is None or "txid" in fields:
+        attributes["txid"] = row["txid"]
+    if fields is None or "amount" in fields:
+        attributes["amount"] = format_amount(row["amount"])
+    resource = {"type": "transactions", "id": str(row["id"]), "attributes": attributes}
+    if fields is None or "wallet" in fields:
+        resource["relationships"] = {
+            "wallet": {"data": {"type": "wallets", "id": str(row["wallet_id"])}}
+        }
+    resource["links"] = {"self": url(row["id"])}
+    return resource
+
+
+def page_number_document(resources, request, page_query_param, page, pages, count):
+    """
+    Wrap a page of resources the way ``JsonApiPageNumberPagination`` does.
+    """
+    base_url = request.build_absolute_uri()
+
+    def link(number):
+        if not number:
+            return None
+        return replace_query_param(base_url, page_query_param, number)
+
+    return {
+        "links": {
+            "first": link(1),
+            "last": link(pages),
+            "next": link(page + 1 if page < pages else None),
+            "prev": link(page - 1 if page > 1 else None),
+        },
+        "data": resources,
+        "meta": {"pagination": {"page": page, "pages": pages, "count": count}},
+    }
+
+
+def error_document(status, detail, code, pointer="/data"):
+    error = {"detail": detail, "status": str(status)}
+    if pointer is not None:
+        error["source"] = {"pointer": pointer}
+    error["code"] = code
+    return {"errors": [error]}
+
+
+def render(document):
+    """
+    Encode a document exactly like the JSON:API renderer does.
+    """
+    content = json.dumps(document, ensure_ascii=False, separators=(",", ":"))
+    # Same escaping as rest_framework.renderers.JSONRenderer.
+    content = content.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
+    return content.encode()
@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+from decimal import Decimal
+
+from django.conf import settings
+
+from b2broker.documents import format_amount
+from b2broker.models import Wallet
+
+DEFAULT_CHUNK_SIZE = 2000
+
+CSV_HEADER = ("id", "wallet", "txid", "amount")
+BALANCE_CSV_HEADER = ("id", "balance")
+
+
+def get_chunk_size():
+    return getattr(settings, "B2BROKER_EXPORT_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+
+
+def iter_transaction_rows(queryset, chunk_size=None):
+    """
+    Yield ``(id, wallet_id, txid, amount)`` tuples in primary key order.
+
+    Rows are read in keyset chunks (``id > last_id ORDER BY id LIMIT n``)
+    so only one chunk is held in memory at a time, whether or not the
+    database driver buffers whole result sets client-side.
+    """
+    return iter_keyset(
+        queryset.values_list("pk", "wallet_id", "txid", "amount"), chunk_size
+    )
+
+
+def iter_wallet_balances(queryset, chunk_size=None):
+    """
+    Yield the ``(id, balance)`` of every wallet of the queryset in primary
+    key order, in keyset chunks like ``iter_transaction_rows``.
+    """
+    return iter_keyset(queryset.values_list("pk", "balance"), chunk_size)
+
+
+def iter_balances_by_id(wallet_ids, chunk_size=None):
+    """
+    Yield the ``(id, balance)`` of the wallets with the given ids, looked up
+    with one ``IN`` query per chunk of ids. Unknown ids are left out.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    for start in range(0, len(wallet_ids), chunk_size):
+        chunk = wallet_ids[start : start + chunk_size]
+        yield from Wallet.objects.filter(pk__in=chunk).order_by("pk").values_list(
+            "pk", "balance"
+        )
+
+
+def iter_keyset(queryset, chunk_size=None):
+    """
+    Yield the rows of a ``values_list()`` queryset starting with the primary
+    key, in primary key order and keyset chunks.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    queryset = queryset.order_by("pk")
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+def ndjson_lines(rows):
+    for pk, wallet_id, txid, amount in rows:
+        resource = {
+            "type": "transactions",
+            "id": str(pk),
+            "attributes": {
+                "txid": txid,
+                "amount": format_amount(amount),
+            },
+            "relationships": {
+                "wallet": {"data": {"type": "wallets", "id": str(wallet_id)}}
+            },
+        }
+        yield json.dumps(resource) + "\n"
+
+
+def balance_ndjson_lines(rows):
+    for pk, balance in rows:
+        resource = {
+            "type": "wallets",
+            "id": str(pk),
+            "attributes": {"balance": str(balance or Decimal("0.0"))},
+        }
+        yield json.dumps(resource) + "\n"
+
+
+def csv_lines(rows):
+    return _csv_lines(
+        CSV_HEADER,
+        (
+            (pk, wallet_id, txid, format_amount(amount))
+            for pk, wallet_id, txid, amount in rows
+        ),
+    )
+
+
+def balance_csv_lines(rows):
+    return _csv_lines(
+        BALANCE_CSV_HEADER,
+        ((pk, str(balance or Decimal("0.0"))) for pk, balance in rows),
+    )
+
+
+def _csv_lines(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(header)
+    yield flush()
+    for row in rows:
+        writer.writerow(row)
+        yield flush()
@@ -0,0 +1,62 @@
+"""
+Sparse fieldsets and compound documents without extra queries.
+
+``fields[<type>]`` already prunes the serializer fields; ``SparseFieldsetsMixin``
+also restricts the columns the queryset selects to the requested ones, and
+``include`` is served from the ``select_for_includes`` /
+``prefetch_for_includes`` of ``PreloadIncludesMixin``, so a compound document
+costs a constant number of queries.
+"""
+
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_json_api.utils import get_included_resources
+
+
+def get_fieldset(request, resource_type):
+    """
+    Return the set of fields requested with ``fields[<resource_type>]``, or
+    ``None`` when the request does not restrict them.
+    """
+    value = request.query_params.get(f"fields[{resource_type}]")
+    if value is None:
+        return None
+    return set(value.split(","))
+
+
+def get_included_fields(request):
+    """
+    Return the first level relationships named by the ``include`` parameter.
+    """
+    return {path.split(".")[0] for path in get_included_resources(request)}
+
+
+class SparseFieldsetsMixin:
+    """
+    Loads only the columns of the fields requested with ``fields[...]`` on
+    reads. ``fieldset_columns`` maps each serializer field to the column it
+    reads; the primary key is always loaded, and so are the relationships
+    being included.
+    """
+
+    resource_type = None
+    fieldset_columns = None
+
+    def get_fieldset(self):
+        return get_fieldset(self.request, self.resource_type)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        fields = self.get_fieldset()
+        if fields is None:
+            return queryset
+        fields |= get_included_fields(self.request)
+        return queryset.only(
+            "id",
+            *(
+                column
+                for field, column in self.fieldset_columns.items()
+                if field in fields
+            ),
+        )
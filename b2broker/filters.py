@@ -0,0 +1,27 @@
+"""
+Filter backends of the JSON:API viewsets.
+"""
+
+from rest_framework_json_api import filters
+
+
+def with_tiebreaker(ordering):
+    """
+    Append ``id`` to ``ordering`` unless it already sorts by it, in the
+    direction of the last term so that a ``(column, id)`` index can still be
+    scanned in one direction.
+    """
+    if not ordering or any(term.lstrip("-") in ("id", "pk") for term in ordering):
+        return ordering
+    return [*ordering, "-id" if ordering[-1].startswith("-") else "id"]
+
+
+class OrderingFilter(filters.OrderingFilter):
+    """
+    ``sort`` with ``id`` as the last key. Rows sharing a balance or a label
+    otherwise come back in any order, and OFFSET pagination repeats some and
+    skips others between pages.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        return with_tiebreaker(super().get_ordering(request, queryset, view))
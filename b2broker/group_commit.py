@@ -0,0 +1,231 @@
+"""
+Group commit of single transaction creates.
+
+With ``B2BROKER_GROUP_COMMIT`` enabled, ``POST /transactions/`` validates the
+request as usual but, instead of committing its own database transaction,
+queues the row for a background flusher. The flusher inserts everything
+queued within ``B2BROKER_GROUP_COMMIT_INTERVAL_MS`` milliseconds (or as soon
+as ``B2BROKER_GROUP_COMMIT_MAX_ROWS`` rows are waiting) through the bulk
+ingestion path, in one database transaction, so that many requests share
+one commit. Each request blocks until the batch holding its row has
+committed, for at most ``B2BROKER_GROUP_COMMIT_TIMEOUT`` seconds, after which
+it fails with a 503; its row may still be committed later.
+
+The queue is per process, so batching only happens between the requests a
+process serves concurrently (threaded or ASGI workers).
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from b2broker import metrics
+from b2broker.bulk import DUPLICATE_TXID, insert_transactions
+from b2broker.models import Transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_MS = 5
+DEFAULT_MAX_ROWS = 500
+DEFAULT_TIMEOUT = 30
+
+batch_size = metrics.register(
+    metrics.Histogram(
+        "b2broker_group_commit_batch_size",
+        "Number of transactions written per group commit.",
+        (),
+        (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+    )
+)
+flush_duration = metrics.register(
+    metrics.Histogram(
+        "b2broker_group_commit_flush_duration_seconds",
+        "Time spent inserting and committing one group commit batch.",
+        (),
+        metrics.LATENCY_BUCKETS,
+    )
+)
+
+
+def is_enabled():
+    return getattr(settings, "B2BROKER_GROUP_COMMIT", False)
+
+
+def get_timeout():
+    return getattr(settings, "B2BROKER_GROUP_COMMIT_TIMEOUT", DEFAULT_TIMEOUT)
+
+
+class CommitTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The transaction was not committed in time, try again later."
+    default_code = "commit_timeout"
+
+
+class GroupCommitter:
+    """
+    Queues validated transactions and writes them in batches from a
+    background thread. ``submit`` returns a future resolved with the bulk
+    ingestion result of the row once its batch has committed.
+    """
+
+    def __init__(self, interval, max_rows):
+        self.interval = interval
+        self.max_rows = max_rows
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="b2broker-group-commit", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def alive(self):
+        return self._thread.is_alive()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def submit(self, data):
+        future = Future()
+        self._queue.put((data, future))
+        return future
+
+    def stop(self):
+        """
+        Flush what is queued, then stop the flusher thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.interval
+                while len(batch) < self.max_rows:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                try:
+                    self._flush(batch)
+                except Exception as exc:
+                    # Fail this batch only; the next one gets a new chance,
+                    # e.g. once the database is reachable again.
+                    logger.exception(
+                        "Group commit of %d transaction(s) failed", len(batch)
+                    )
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(exc)
+        finally:
+            connection.close()
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        results = [None] * len(batch)
+        accepted = {}
+        for index, (data, _) in enumerate(batch):
+            if data["txid"] in accepted:
+                results[index] = {"status": "409"}
+            else:
+                accepted[data["txid"]] = (index, data)
+        try:
+            # Same connection hygiene as around a request.
+            connection.close_if_unusable_or_obsolete()
+            insert_transactions(accepted, results)
+        finally:
+            flush_duration.observe(time.perf_counter() - started)
+            batch_size.observe(len(batch))
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+_committer = None
+_committer_lock = threading.Lock()
+
+
+def get_committer():
+    global _committer
+    with _committer_lock:
+        # Replace a flusher that died, rather than queue rows nobody writes.
+        if _committer is None or not _committer.alive:
+            _committer = GroupCommitter(
+                interval=getattr(
+                    settings, "B2BROKER_GROUP_COMMIT_INTERVAL_MS", DEFAULT_INTERVAL_MS
+                )
+                / 1000,
+                max_rows=getattr(
+                    settings, "B2BROKER_GROUP_COMMIT_MAX_ROWS", DEFAULT_MAX_ROWS
+                ),
+            )
+        return _committer
+
+
+def shutdown():
+    """
+    Stop the process wide committer, if it was started.
+    """
+    global _committer
+    with _committer_lock:
+        if _committer is not None:
+            _committer.stop()
+            _committer = None
+
+
+metrics.register(
+    metrics.Gauge(
+        "b2broker_group_commit_queue_depth",
+        "Transactions waiting for the next group commit.",
+        lambda: _committer.depth if _committer is not None else 0,
+    )
+)
+
+
+def create_transaction(validated_data):
+    """
+    Queue a transaction validated by ``TransactionSerializer`` and wait until
+    it is committed. Returns the created ``Transaction``.
+    """
+    amount = validated_data.get("amount") or Decimal("0.0")
+    data = {
+        "wallet": validated_data["wallet"].pk,
+        "txid": validated_data["txid"],
+        "amount": amount,
+    }
+    try:
+        result = get_committer().submit(data).result(timeout=get_timeout())
+    except TimeoutError:
+        raise CommitTimeout()
+    if result["status"] == "409":
+        # Taken since the request was validated.
+        raise ValidationError({"txid": [DUPLICATE_TXID]})
+    if result["status"] != "201":
+        raise ValidationError(
+            {"wallet": [error["detail"] for error in result["errors"]]}
+        )
+    return Transaction(
+        pk=int(result["id"]),
+        wallet=validated_data["wallet"],
+        txid=data["txid"],
+        amount=amount,
+    )
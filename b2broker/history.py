@@ -0,0 +1,80 @@
+import datetime
+from decimal import Decimal
+
+from django.db.models import Sum
+from rest_framework.fields import DecimalField
+
+from b2broker.models import WalletDailyRollup
+
+INTERVALS = ("day", "week", "month")
+
+amount_field = DecimalField(max_digits=36, decimal_places=18)
+
+
+def bucket_start(day, interval):
+    if interval == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    return day
+
+
+def balance_history(wallet_id, interval="day", start=None, end=None):
+    """
+    Return the per ``interval`` totals of a wallet together with the running
+    balance at the end of each bucket, read from the daily rollups with one
+    range scan over the (wallet, day) index. Buckets without transactions are
+    omitted.
+    """
+    rollups = WalletDailyRollup.objects.filter(wallet_id=wallet_id).order_by("day")
+    balance = Decimal("0.0")
+    if start is not None:
+        # Weeks and months are aligned to their first day.
+        start = bucket_start(start, interval)
+        balance += (
+            rollups.filter(day__lt=start).aggregate(Sum("net_amount"))[
+                "net_amount__sum"
+            ]
+            or 0
+        )
+        rollups = rollups.filter(day__gte=start)
+    if end is not None:
+        rollups = rollups.filter(day__lte=end)
+
+    buckets = []
+    current = None
+    for rollup in rollups.values(
+        "day",
+        "net_amount",
+        "credit_total",
+        "debit_total",
+        "credit_count",
+        "debit_count",
+    ).iterator():
+        day = bucket_start(rollup["day"], interval)
+        if current is None or current["start"] != day:
+            current = {
+                "start": day,
+                "net_amount": Decimal("0.0"),
+                "credit_total": Decimal("0.0"),
+                "debit_total": Decimal("0.0"),
+                "credit_count": 0,
+                "debit_count": 0,
+            }
+            buckets.append(current)
+        for field in (
+            "net_amount",
+            "credit_total",
+            "debit_total",
+            "credit_count",
+            "debit_count",
+        ):
+            current[field] += rollup[field]
+
+    for bucket in buckets:
+        balance += bucket["net_amount"]
+        bucket["start"] = bucket["start"].isoformat()
+        bucket["balance"] = amount_field.to_representation(balance)
+        for field in ("net_amount", "credit_total", "debit_total"):
+            bucket[field] = amount_field.to_representation(bucket[field])
+    return buckets
@@ -0,0 +1,319 @@
+"""
+Chunked, resumable import of transaction files.
+
+Reads the NDJSON and CSV formats the export endpoint writes, one record at a
+time, and inserts them with ``bulk_create`` in chunks, each in its own
+database transaction. Stored balances, checkpoints and daily rollups are not
+maintained row by row: the balances and rollups of the imported wallets are
+rebuilt once the whole share is in.
+
+The work can be split between worker processes by wallet (``wallet id %
+workers``). Each worker records the number of the last record it committed in
+a small progress file, so an interrupted import resumes after it; records
+committed after the last progress write are recognised by their txid and
+skipped.
+"""
+
+import csv
+import datetime
+import json
+import os
+import time
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from b2broker.bulk import chunked, get_chunk_size
+from b2broker.cache import bump_versions, wallet_scope
+from b2broker.models import Wallet, Transaction
+from b2broker.notifier import notify_wallets
+from b2broker.parsers import parse_resource_object
+
+FORMATS = ("ndjson", "csv")
+
+# Invalid records reported in detail per worker; the rest are only counted.
+MAX_REPORTED_ERRORS = 20
+
+
+class InvalidRecord(Exception):
+    pass
+
+
+class ProgressMismatch(Exception):
+    pass
+
+
+class ImportRecord:
+    __slots__ = ("number", "wallet_id", "txid", "amount", "created_at")
+
+    def __init__(self, number, wallet_id, txid, amount, created_at=None):
+        self.number = number
+        self.wallet_id = wallet_id
+        self.txid = txid
+        self.amount = amount
+        self.created_at = created_at
+
+
+class ImportResult:
+    """
+    Counters of one worker's share of an import, added up with ``merge``.
+    """
+
+    COUNTERS = (
+        "read",
+        "resumed",
+        "imported",
+        "duplicates",
+        "unknown_wallets",
+        "invalid",
+        "wallets",
+    )
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        # (record number, reason) of the first rejected records.
+        self.errors = []
+        self.seconds = 0.0
+
+    def merge(self, other):
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.errors.extend(other.errors)
+        self.seconds = max(self.seconds, other.seconds)
+
+
+def guess_format(path):
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def read_ndjson(path):
+    """
+    Yield ``(record number, fields)`` for every non blank line holding a
+    JSON:API resource object.
+    """
+    with open(path, encoding="utf-8") as stream:
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                resource = json.loads(line, parse_float=Decimal)
+            except ValueError as exc:
+                yield number, InvalidRecord(f"invalid JSON: {exc}")
+                continue
+            if not isinstance(resource, dict):
+                yield number, InvalidRecord("not a resource object")
+                continue
+            fields = parse_resource_object(resource)
+            wallet = fields.get("wallet")
+            fields["wallet"] = wallet.get("id") if isinstance(wallet, dict) else None
+            yield number, fields
+
+
+def read_csv(path):
+    """
+    Yield ``(record number, fields)`` for every row of a CSV file with a
+    ``wallet,txid,amount[,created_at]`` header; other columns are ignored.
+    """
+    with open(path, encoding="utf-8", newline="") as stream:
+        for number, row in enumerate(csv.DictReader(stream), start=1):
+            yield number, row
+
+
+READERS = {"ndjson": read_ndjson, "csv": read_csv}
+
+amount_field = Transaction._meta.get_field("amount")
+
+
+def parse_record(number, fields):
+    if isinstance(fields, InvalidRecord):
+        raise fields
+    try:
+        wallet_id = int(fields.get("wallet"))
+    except (TypeError, ValueError):
+        raise InvalidRecord("wallet must be a wallet id")
+    txid = fields.get("txid")
+    if not isinstance(txid, str) or not 0 < len(txid) <= 100:
+        raise InvalidRecord("txid must be a string of 1 to 100 characters")
+    amount = fields.get("amount")
+    try:
+        amount = amount_field.clean(amount, None) if amount not in (None, "") else 0
+    except ValidationError as exc:
+        raise InvalidRecord(f"amount: {' '.join(exc.messages)}")
+    created_at = fields.get("created_at") or None
+    if created_at is not None:
+        try:
+            created_at = parse_datetime(created_at)
+        except (TypeError, ValueError):
+            created_at = None
+        if created_at is None:
+            raise InvalidRecord("created_at must be an ISO 8601 datetime")
+        if timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at, datetime.UTC)
+    return ImportRecord(number, wallet_id, txid, Decimal(amount), created_at)
+
+
+def progress_path(state, worker):
+    return f"{state}.{worker}"
+
+
+def load_progress(state, worker, workers):
+    """
+    Return the number of the last record the worker committed in a previous
+    run, 0 when starting afresh.
+    """
+    try:
+        with open(progress_path(state, worker)) as stream:
+            progress = json.load(stream)
+    except FileNotFoundError:
+        return 0
+    if progress["workers"] != workers:
+        raise ProgressMismatch(
+            f"the import was started with {progress['workers']} worker(s), "
+            "resume it with the same number"
+        )
+    return progress["record"]
+
+
+def save_progress(state, worker, workers, record):
+    path = progress_path(state, worker)
+    with open(f"{path}.tmp", "w") as stream:
+        json.dump({"workers": workers, "record": record}, stream)
+    os.replace(f"{path}.tmp", path)
+
+
+def clear_progress(state, workers):
+    for worker in range(workers):
+        try:
+            os.remove(progress_path(state, worker))
+        except FileNotFoundError:
+            pass
+
+
+def insert_records(records, result):
+    """
+    Insert a chunk of records in one database transaction, skipping txids
+    already stored or seen earlier in the chunk and unknown wallets.
+    """
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                rows, duplicates, unknown = _new_rows(records)
+                Transaction.objects.bulk_create(rows)
+        except IntegrityError:
+            # Another worker inserted the same txid for a different wallet
+            # meanwhile; the retry sees it as a duplicate.
+            if attempt:
+                raise
+        else:
+            break
+    result.imported += len(rows)
+    result.duplicates += duplicates
+    result.unknown_wallets += len(unknown)
+    for record in unknown[: MAX_REPORTED_ERRORS - len(result.errors)]:
+        result.errors.append((record.number, f"unknown wallet {record.wallet_id}"))
+
+
+def _new_rows(records):
+    by_txid = {}
+    for record in records:
+        by_txid.setdefault(record.txid, record)
+    duplicates = len(records) - len(by_txid)
+    existing_txids = set(
+        Transaction.objects.filter(txid__in=list(by_txid)).values_list(
+            "txid", flat=True
+        )
+    )
+    wallet_ids = {record.wallet_id for record in by_txid.values()}
+    existing_wallets = set(
+        Wallet.objects.filter(pk__in=wallet_ids).values_list("pk", flat=True)
+    )
+
+    rows = []
+    unknown = []
+    for txid, record in by_txid.items():
+        if txid in existing_txids:
+            duplicates += 1
+        elif record.wallet_id not in existing_wallets:
+            unknown.append(record)
+        else:
+            row = Transaction(
+                wallet_id=record.wallet_id, txid=txid, amount=record.amount
+            )
+            if record.created_at is not None:
+                row.created_at = record.created_at
+            rows.append(row)
+    return rows, duplicates, unknown
+
+
+def rebuild_wallets(wallet_ids, chunk_size):
+    """
+    Rebuild the balances and rollups of the given wallets. Returns the number
+    of wallets that exist.
+    """
+    rebuilt = 0
+    for wallet_chunk in chunked(sorted(wallet_ids), chunk_size):
+        with transaction.atomic():
+            wallets = Wallet.objects.filter(pk__in=wallet_chunk)
+            rebuilt += wallets.rebuild_balances()
+            wallets.rebuild_rollups()
+    bump_versions([wallet_scope(wallet_id) for wallet_id in wallet_ids])
+    notify_wallets(wallet_ids)
+    return rebuilt
+
+
+def import_share(
+    path, format, worker=0, workers=1, chunk_size=None, state=None, progress=None
+):
+    """
+    Import the records of ``path`` whose wallet belongs to ``worker`` and
+    rebuild the balances of those wallets. Returns an ``ImportResult``.
+
+    ``progress`` is called with the result after every committed chunk.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    started = time.perf_counter()
+    result = ImportResult()
+    resume_after = load_progress(state, worker, workers) if state else 0
+    wallet_ids = set()
+    records = []
+
+    def flush(last_number):
+        insert_records(records, result)
+        records.clear()
+        if state:
+            save_progress(state, worker, workers, last_number)
+        if progress is not None:
+            progress(result)
+
+    last_number = 0
+    for number, fields in READERS[format](path):
+        try:
+            record = parse_record(number, fields)
+        except InvalidRecord as exc:
+            # Counted once, by the first worker.
+            if worker == 0 and number > resume_after:
+                result.invalid += 1
+                if len(result.errors) < MAX_REPORTED_ERRORS:
+                    result.errors.append((number, str(exc)))
+            continue
+        if record.wallet_id % workers != worker:
+            continue
+        wallet_ids.add(record.wallet_id)
+        if number <= resume_after:
+            result.resumed += 1
+            continue
+        result.read += 1
+        records.append(record)
+        last_number = number
+        if len(records) >= chunk_size:
+            flush(last_number)
+    if records:
+        flush(last_number)
+
+    result.wallets = rebuild_wallets(wallet_ids, chunk_size)
+    result.seconds = time.perf_counter() - started
+    return result
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from b2broker.models import BalanceCheckpoint, Wallet
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold the transactions written since each wallet's last balance "
+        "checkpoint into the checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--wallet",
+            action="append",
+            type=int,
+            dest="wallets",
+            help="Only advance the checkpoint of the given wallet id (may be repeated).",
+        )
+
+    def handle(self, *args, wallets=None, **options):
+        wallet_ids = Wallet.objects.order_by("pk").values_list("pk", flat=True)
+        if wallets:
+            wallet_ids = wallet_ids.filter(pk__in=wallets)
+
+        advanced = 0
+        for wallet_id in list(wallet_ids):
+            BalanceCheckpoint.advance(wallet_id)
+            advanced += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Advanced {advanced} balance checkpoint(s).")
+        )
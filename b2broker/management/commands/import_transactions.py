@@ -0,0 +1,131 @@
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from b2broker import imports
+
+
+def report_progress(worker, result):
+    sys.stdout.write(
+        f"worker {worker}: {result.read} record(s) read, "
+        f"{result.imported} imported\n"
+    )
+    sys.stdout.flush()
+
+
+def import_share(options):
+    worker = options["worker"]
+    progress = partial(report_progress, worker) if options.pop("verbose") else None
+    return imports.import_share(progress=progress, **options)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import transactions from an NDJSON or CSV file, in the formats the "
+        "export endpoint writes, and rebuild the balances of the imported "
+        "wallets."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import.")
+        parser.add_argument(
+            "--format",
+            choices=imports.FORMATS,
+            help="Input format, guessed from the file extension by default.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            help="Records inserted per database transaction.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Worker processes, each importing the wallets whose id modulo "
+            "the number of workers is its index.",
+        )
+        parser.add_argument(
+            "--state",
+            help="Progress file prefix, <path>.progress by default. An "
+            "interrupted import started with the same file resumes from it.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore the progress of a previous run.",
+        )
+
+    def handle(
+        self,
+        *args,
+        path,
+        format=None,
+        chunk_size=None,
+        workers=1,
+        state=None,
+        restart=False,
+        **options,
+    ):
+        if workers < 1:
+            raise CommandError("--workers must be at least 1.")
+        if chunk_size is not None and chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        state = state or f"{path}.progress"
+        if restart:
+            imports.clear_progress(state, workers)
+        shares = [
+            {
+                "path": path,
+                "format": format or imports.guess_format(path),
+                "worker": worker,
+                "workers": workers,
+                "chunk_size": chunk_size,
+                "state": state,
+                "verbose": options["verbosity"] > 1,
+            }
+            for worker in range(workers)
+        ]
+
+        started = time.perf_counter()
+        try:
+            if workers == 1:
+                results = [import_share(shares[0])]
+            else:
+                # The workers are forked and open their own connections.
+                connections.close_all()
+                with ProcessPoolExecutor(
+                    workers, mp_context=multiprocessing.get_context("fork")
+                ) as executor:
+                    results = list(executor.map(import_share, shares))
+        except FileNotFoundError as exc:
+            raise CommandError(f"Cannot read {exc.filename}.")
+        except imports.ProgressMismatch as exc:
+            raise CommandError(f"Cannot resume: {exc}.")
+        elapsed = time.perf_counter() - started
+
+        total = imports.ImportResult()
+        for result in results:
+            total.merge(result)
+        for number, reason in sorted(total.errors):
+            self.stderr.write(f"record {number}: {reason}")
+        if total.resumed:
+            self.stdout.write(
+                f"Resumed after {total.resumed} record(s) of a previous run."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {total.imported} transaction(s) into {total.wallets} "
+                f"wallet(s) in {elapsed:.1f}s "
+                f"({total.read / max(elapsed, 1e-9):.0f} records/s); skipped "
+                f"{total.duplicates} duplicate txid(s), "
+                f"{total.unknown_wallets} unknown wallet(s) and "
+                f"{total.invalid} invalid record(s)."
+            )
+        )
+        imports.clear_progress(state, workers)
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from b2broker import partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Show, apply, resize or remove the hash partitioning of the "
+        "transaction table by wallet (MySQL only)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            help=(
+                "Partition the table into this many partitions, or add or "
+                "coalesce partitions to reach it when already partitioned."
+            ),
+        )
+        parser.add_argument(
+            "--remove",
+            action="store_true",
+            help="Restore the unpartitioned layout.",
+        )
+
+    def handle(self, *args, partitions=None, remove=False, **options):
+        if not partitioning.is_supported():
+            raise CommandError("Partitioning is only supported on MySQL.")
+        if partitions is not None and partitions < 1:
+            raise CommandError("--partitions must be at least 1.")
+        if partitions is not None and remove:
+            raise CommandError("--partitions and --remove are exclusive.")
+
+        current = partitioning.get_partitions()
+        if remove:
+            if current:
+                partitioning.unpartition()
+            self.stdout.write(self.style.SUCCESS("Transaction table unpartitioned."))
+        elif partitions is not None:
+            if current:
+                partitioning.resize(partitions)
+            else:
+                partitioning.partition(partitions)
+            self.stdout.write(
+                self.style.SUCCESS(f"Transaction table has {partitions} partition(s).")
+            )
+        elif not current:
+            self.stdout.write("Transaction table is not partitioned.")
+        else:
+            for name, rows in current:
+                self.stdout.write(f"{name}: ~{rows} row(s)")
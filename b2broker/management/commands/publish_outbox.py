@@ -0,0 +1,111 @@
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from b2broker import outbox
+
+
+def publish_in_thread(*args, **kwargs):
+    try:
+        return outbox.publish(*args, **kwargs)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver the ledger change events of the outbox to a sink, in "
+        "batches, until interrupted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sink",
+            default=getattr(settings, "B2BROKER_OUTBOX_SINK", None),
+            help="Sink URL: file:///path, unix:///path or http(s)://host/path. "
+            "B2BROKER_OUTBOX_SINK by default.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=outbox.get_batch_size(),
+            help="Events delivered per database transaction.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Batches delivered at the same time, by as many threads.",
+        )
+        parser.add_argument(
+            "--poll-seconds",
+            type=float,
+            default=outbox.get_poll_seconds(),
+            help="Wait between polls of an empty outbox and after a failed "
+            "delivery.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the outbox is empty, failing on delivery errors.",
+        )
+
+    def handle(
+        self,
+        *args,
+        sink=None,
+        batch_size=None,
+        concurrency=1,
+        poll_seconds=None,
+        once=False,
+        **options,
+    ):
+        if not sink:
+            raise CommandError("Pass --sink or set B2BROKER_OUTBOX_SINK.")
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        if concurrency < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        try:
+            sink = outbox.get_sink(sink)
+        except (ValueError, OSError) as exc:
+            raise CommandError(f"Cannot open the sink: {exc}.")
+
+        stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        arguments = (sink, batch_size, stop, poll_seconds, once)
+        started = time.perf_counter()
+        try:
+            if concurrency == 1:
+                published = outbox.publish(*arguments)
+            else:
+                with ThreadPoolExecutor(concurrency) as executor:
+                    futures = [
+                        executor.submit(publish_in_thread, *arguments)
+                        for _ in range(concurrency)
+                    ]
+                    try:
+                        published = sum(future.result() for future in futures)
+                    except BaseException:
+                        # Let the other workers finish their batch and exit.
+                        stop.set()
+                        raise
+        except KeyboardInterrupt:
+            return
+        except outbox.DeliveryError as exc:
+            raise CommandError(str(exc))
+        finally:
+            sink.close()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Published {published} event(s) in {elapsed:.1f}s "
+                f"({published / max(elapsed, 1e-9):.0f} events/s)."
+            )
+        )
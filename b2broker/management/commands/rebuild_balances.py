@@ -0,0 +1,48 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from b2broker.cache import bump_versions, wallet_scope
+from b2broker.models import Wallet
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the stored wallet balances and daily rollups from the "
+        "transaction ledger."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--wallet",
+            action="append",
+            type=int,
+            dest="wallets",
+            help="Only rebuild the given wallet id (may be repeated).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of wallets updated per database transaction.",
+        )
+
+    def handle(self, *args, wallets=None, batch_size=1000, **options):
+        wallet_ids = Wallet.objects.order_by("pk").values_list("pk", flat=True)
+        if wallets:
+            wallet_ids = wallet_ids.filter(pk__in=wallets)
+        wallet_ids = list(wallet_ids)
+
+        updated = 0
+        for start in range(0, len(wallet_ids), batch_size):
+            batch_ids = wallet_ids[start : start + batch_size]
+            with transaction.atomic():
+                batch = Wallet.objects.filter(pk__in=batch_ids)
+                updated += batch.rebuild_balances()
+                batch.rebuild_rollups()
+                transaction.on_commit(
+                    partial(bump_versions, [wallet_scope(pk) for pk in batch_ids])
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {updated} wallet balance(s)."))
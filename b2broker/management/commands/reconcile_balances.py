@@ -0,0 +1,67 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from b2broker.cache import bump_versions, wallet_scope
+from b2broker.models import Wallet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the stored wallet balances with the ledger balance, read from "
+        "the balance checkpoints and the transactions written since."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--wallet",
+            action="append",
+            type=int,
+            dest="wallets",
+            help="Only check the given wallet id (may be repeated).",
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Rebuild the balances that do not match from the ledger.",
+        )
+
+    def handle(self, *args, wallets=None, fix=False, **options):
+        wallet_ids = Wallet.objects.order_by("pk").values_list("pk", flat=True)
+        if wallets:
+            wallet_ids = wallet_ids.filter(pk__in=wallets)
+
+        mismatched = []
+        for wallet_id in list(wallet_ids):
+            with transaction.atomic():
+                # Writers hold the wallet row until they commit, so the stored
+                # balance and the ledger are read at the same point.
+                wallet = Wallet.objects.select_for_update().filter(pk=wallet_id).first()
+                if wallet is None:
+                    continue
+                ledger_balance = wallet.ledger_balance
+            if wallet.balance != ledger_balance:
+                mismatched.append(wallet_id)
+                self.stdout.write(
+                    f"Wallet {wallet_id}: stored balance {wallet.balance}, "
+                    f"ledger balance {ledger_balance}."
+                )
+
+        if mismatched and fix:
+            with transaction.atomic():
+                Wallet.objects.filter(pk__in=mismatched).rebuild_balances()
+                transaction.on_commit(
+                    partial(bump_versions, [wallet_scope(pk) for pk in mismatched])
+                )
+            self.stdout.write(
+                self.style.SUCCESS(f"Rebuilt {len(mismatched)} wallet balance(s).")
+            )
+        elif mismatched:
+            raise CommandError(
+                f"{len(mismatched)} wallet balance(s) do not match the ledger."
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS("All wallet balances match the ledger.")
+            )
@@ -0,0 +1,352 @@
+"""
+Per request SQL and timing instrumentation, exposed in the Prometheus text
+format.
+
+``MetricsMiddleware`` counts and times the SQL queries of every request with
+an execute wrapper installed on every database connection, times the rendering of the
+response with a post-render callback and records them, along with the total
+latency, in histograms labelled by route and action. ``metrics_view`` serves them.
+
+The request being measured is held in a context variable, which follows it
+into the threads ``sync_to_async`` runs the queries of async views in.
+
+The collectors live in process memory and are guarded by locks, so they are
+safe under threaded workers. Each worker process exposes its own numbers.
+"""
+
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+
+from b2broker import cache
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    return ",".join(f'{name}="{escape_label(value)}"' for name, value in labels)
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_sample(name, labels, value):
+    if not labels:
+        return f"{name} {format_value(value)}"
+    return f"{name}{{{format_labels(labels)}}} {format_value(value)}"
+
+
+class Histogram:
+    """
+    A labelled Prometheus histogram.
+    """
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [per bucket counts, sum, count]
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def get(self, *label_values):
+        """
+        Return ``(sum, count)`` of one series.
+        """
+        with self._lock:
+            series = self._series.get(label_values)
+            return (series[1], series[2]) if series else (0, 0)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def collect(self):
+        with self._lock:
+            series = {
+                labels: (list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            }
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for label_values, (counts, total, count) in sorted(series.items()):
+            labels = tuple(zip(self.label_names, label_values))
+            cumulative = 0
+            for bucket, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = format_labels(labels + (("le", format_value(bucket)),))
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            bucket_labels = format_labels(labels + (("le", "+Inf"),))
+            lines.append(f"{self.name}_bucket{{{bucket_labels}}} {count}")
+            lines.append(format_sample(f"{self.name}_sum", labels, total))
+            lines.append(format_sample(f"{self.name}_count", labels, count))
+        return lines
+
+
+class Gauge:
+    """
+    An unlabelled Prometheus gauge whose value is read from ``callback`` at
+    collection time.
+    """
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def collect(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+            format_sample(self.name, (), self.callback()),
+        ]
+
+
+LABELS = ("route", "action")
+
+request_duration = Histogram(
+    "b2broker_request_duration_seconds",
+    "Total time spent handling the request.",
+    LABELS,
+    LATENCY_BUCKETS,
+)
+sql_queries = Histogram(
+    "b2broker_request_sql_queries",
+    "Number of SQL queries run by the request.",
+    LABELS,
+    QUERY_COUNT_BUCKETS,
+)
+sql_duration = Histogram(
+    "b2broker_request_sql_duration_seconds",
+    "Time spent in SQL queries by the request.",
+    LABELS,
+    LATENCY_BUCKETS,
+)
+render_duration = Histogram(
+    "b2broker_request_render_duration_seconds",
+    "Time spent serializing and rendering the response body.",
+    LABELS,
+    LATENCY_BUCKETS,
+)
+
+COLLECTORS = [request_duration, sql_queries, sql_duration, render_duration]
+
+
+def register(collector):
+    """
+    Add a histogram or gauge of another module to the ``/metrics`` output.
+    """
+    COLLECTORS.append(collector)
+    return collector
+
+
+def collect():
+    """
+    Return every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for collector in COLLECTORS:
+        lines.extend(collector.collect())
+    for name, documentation, value in (
+        (
+            "b2broker_response_cache_hits_total",
+            "Responses served from the response cache.",
+            cache.stats.hits,
+        ),
+        (
+            "b2broker_response_cache_misses_total",
+            "Cacheable responses that had to be built.",
+            cache.stats.misses,
+        ),
+    ):
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    for collector in COLLECTORS:
+        if isinstance(collector, Histogram):
+            collector.reset()
+
+
+class QueryTimer:
+    """
+    Execute wrapper counting and timing the queries run for a request.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # Async views may run queries in several threads at once.
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            with self._lock:
+                self.duration += duration
+                self.count += 1
+
+
+class RequestMetrics:
+    """
+    What ``MetricsMiddleware`` measured about the request being handled.
+    """
+
+    def __init__(self):
+        self.route = "unmatched"
+        self.action = None
+        self.queries = QueryTimer()
+        self.render_started = None
+        self.render_duration = 0.0
+
+
+# The metrics of the request being handled, if any.
+current_request = ContextVar("b2broker_request_metrics", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.queries(execute, sql, params, many, context)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver adding ``record_query`` to every
+    connection. It goes first, as ``execute_wrapper()`` pops the last one.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class MetricsMiddleware:
+    """
+    Records the SQL query count, SQL time, render time and total latency of
+    every request, per route and action.
+
+    With ``B2BROKER_SERVER_TIMING`` enabled the same numbers are sent back in
+    a ``Server-Timing`` header. The body of streaming responses is produced
+    after the middleware returns and is not included.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = request.b2broker_metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.record(request, response, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics = request.b2broker_metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.record(request, response, time.perf_counter() - started)
+
+    def record(self, request, response, duration):
+        metrics = request.b2broker_metrics
+
+        labels = (metrics.route, metrics.action or request.method.lower())
+        request_duration.observe(duration, *labels)
+        sql_queries.observe(metrics.queries.count, *labels)
+        sql_duration.observe(metrics.queries.duration, *labels)
+        render_duration.observe(metrics.render_duration, *labels)
+
+        if getattr(settings, "B2BROKER_SERVER_TIMING", False):
+            queries = metrics.queries
+            response["Server-Timing"] = (
+                f'db;dur={queries.duration * 1000:.3f};desc="{queries.count} queries", '
+                f"render;dur={metrics.render_duration * 1000:.3f}, "
+                f"total;dur={duration * 1000:.3f}"
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = request.b2broker_metrics
+        metrics.route = request.resolver_match.view_name
+        # DRF viewsets map the HTTP method to the action they dispatch to.
+        actions = getattr(view_func, "actions", None)
+        if actions:
+            metrics.action = actions.get(request.method.lower())
+
+    def process_template_response(self, request, response):
+        # Called right before the response is rendered, the callback right
+        # after.
+        metrics = request.b2broker_metrics
+        metrics.render_started = time.perf_counter()
+
+        def rendered(response):
+            metrics.render_duration = time.perf_counter() - metrics.render_started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+@require_safe
+def metrics_view(request):
+    return HttpResponse(collect(), content_type=PROMETHEUS_CONTENT_TYPE)
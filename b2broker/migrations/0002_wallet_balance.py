@@ -0,0 +1,53 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:54
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_balances(apps, schema_editor):
+    Wallet = apps.get_model("b2broker", "Wallet")
+    Transaction = apps.get_model("b2broker", "Transaction")
+    ledger = (
+        Transaction.objects.filter(wallet=OuterRef("pk"))
+        .values("wallet")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    Wallet.objects.update(
+        balance=Coalesce(
+            Subquery(ledger),
+            Value(Decimal("0.0")),
+            output_field=DecimalField(max_digits=36, decimal_places=18),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("b2broker", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wallet",
+            name="balance",
+            field=models.DecimalField(
+                decimal_places=18, default=Decimal("0.0"), editable=False, max_digits=36
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="wallet",
+            field=models.ForeignKey(
+                db_column="wallet_id",
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="transactions",
+                to="b2broker.wallet",
+            ),
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("b2broker", "0002_wallet_balance"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["wallet", "id"], name="b2broker_tx_wallet_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["wallet", "amount"], name="b2broker_tx_wallet_amount_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wallet",
+            index=models.Index(fields=["label"], name="b2broker_wallet_label_idx"),
+        ),
+    ]
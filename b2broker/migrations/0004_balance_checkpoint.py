@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:00
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("b2broker", "0003_transaction_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BalanceCheckpoint",
+            fields=[
+                (
+                    "wallet",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="balance_checkpoint",
+                        serialize=False,
+                        to="b2broker.wallet",
+                    ),
+                ),
+                ("last_transaction_id", models.BigIntegerField(default=0)),
+                (
+                    "balance",
+                    models.DecimalField(
+                        decimal_places=18, default=Decimal("0.0"), max_digits=36
+                    ),
+                ),
+            ],
+        ),
+    ]
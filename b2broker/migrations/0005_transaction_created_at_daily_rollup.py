@@ -0,0 +1,111 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:01
+
+import datetime
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def populate_rollups(apps, schema_editor):
+    Transaction = apps.get_model("b2broker", "Transaction")
+    WalletDailyRollup = apps.get_model("b2broker", "WalletDailyRollup")
+    credit = Q(amount__gte=0)
+    rollups = (
+        Transaction.objects.values(
+            "wallet_id", day=TruncDate("created_at", tzinfo=datetime.UTC)
+        )
+        .annotate(
+            net_amount=Sum("amount"),
+            credit_total=Coalesce(Sum("amount", filter=credit), Decimal("0.0")),
+            debit_total=Coalesce(Sum("amount", filter=~credit), Decimal("0.0")),
+            credit_count=Count("pk", filter=credit),
+            debit_count=Count("pk", filter=~credit),
+        )
+        .order_by()
+    )
+    WalletDailyRollup.objects.bulk_create(
+        (WalletDailyRollup(**rollup) for rollup in rollups.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Add ``Transaction.created_at`` and the daily rollups behind the wallet
+    history endpoint.
+
+    The creation time of the transactions that already exist is not known:
+    the ``AddField`` stamps all of them with the time the migration runs, so
+    the rollups, and the history, put the whole existing ledger in that one
+    day. Deployments that know the real times can write them to
+    ``created_at`` afterwards and run ``rebuild_balances``, which rebuilds the
+    rollups.
+    """
+
+    dependencies = [
+        ("b2broker", "0004_balance_checkpoint"),
+    ]
+
+    operations = [
+        # Existing rows get the time of the migration, see above.
+        migrations.AddField(
+            model_name="transaction",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+        migrations.CreateModel(
+            name="WalletDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "net_amount",
+                    models.DecimalField(
+                        decimal_places=18, default=Decimal("0.0"), max_digits=36
+                    ),
+                ),
+                (
+                    "credit_total",
+                    models.DecimalField(
+                        decimal_places=18, default=Decimal("0.0"), max_digits=36
+                    ),
+                ),
+                (
+                    "debit_total",
+                    models.DecimalField(
+                        decimal_places=18, default=Decimal("0.0"), max_digits=36
+                    ),
+                ),
+                ("credit_count", models.BigIntegerField(default=0)),
+                ("debit_count", models.BigIntegerField(default=0)),
+                (
+                    "wallet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to="b2broker.wallet",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="walletdailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("wallet", "day"), name="b2broker_rollup_wallet_day_uniq"
+            ),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
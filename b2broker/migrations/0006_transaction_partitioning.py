@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db import migrations
+
+from b2broker import partitioning
+
+
+def partition_transactions(apps, schema_editor):
+    partitions = getattr(settings, "B2BROKER_TRANSACTION_PARTITIONS", 0)
+    connection = schema_editor.connection
+    if partitions and partitioning.is_supported(connection):
+        partitioning.partition(partitions, connection)
+
+
+def unpartition_transactions(apps, schema_editor):
+    connection = schema_editor.connection
+    if partitioning.is_supported(connection) and partitioning.get_partitions(
+        connection
+    ):
+        partitioning.unpartition(connection)
+
+
+class Migration(migrations.Migration):
+    """
+    Switch the transaction table to the hash partitioned layout of
+    ``b2broker.partitioning`` when ``B2BROKER_TRANSACTION_PARTITIONS`` is set
+    on MySQL. Existing deployments can do it later with the
+    ``partition_transactions`` command.
+    """
+
+    atomic = False
+
+    dependencies = [
+        ("b2broker", "0005_transaction_created_at_daily_rollup"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_transactions, unpartition_transactions),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("b2broker", "0006_transaction_partitioning"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="wallet",
+            index=models.Index(fields=["balance"], name="b2broker_wallet_balance_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("b2broker", "0008_outbox_event"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(fields=["amount"], name="b2broker_tx_amount_idx"),
+        ),
+    ]
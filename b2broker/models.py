@@ -1,20 +1,150 @@
+import datetime
+from collections import defaultdict
 from decimal import Decimal
+from functools import partial
 
-from django.db import models
-from django.db.models import Sum
+from django.db import IntegrityError, models, transaction
+from django.db.models import (
+    Count,
+    DecimalField,
+    F,
+    Max,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from b2broker.cache import (
+    DELETED_WALLETS_SCOPE,
+    bump_versions,
+    transaction_scope,
+    wallet_scope,
+)
+from b2broker.documents import format_amount
+from b2broker.notifier import notify_wallets
+
+
+class WalletQuerySet(models.QuerySet):
+    def rebuild_balances(self):
+        """
+        Recompute the stored balance of every wallet in the queryset from its
+        transactions. Returns the number of wallets updated.
+        """
+        ledger = (
+            Transaction.objects.filter(wallet=OuterRef("pk"))
+            .values("wallet")
+            .annotate(total=Sum("amount"))
+            .values("total")
+        )
+        return self.update(
+            balance=Coalesce(
+                Subquery(ledger),
+                Value(Decimal("0.0")),
+                output_field=DecimalField(max_digits=36, decimal_places=18),
+            )
+        )
+
+    def rebuild_rollups(self):
+        """
+        Recreate the daily rollups of every wallet in the queryset from its
+        transactions.
+        """
+        wallet_ids = list(self.values_list("pk", flat=True))
+        WalletDailyRollup.objects.filter(wallet_id__in=wallet_ids).delete()
+        credit = Q(amount__gte=0)
+        rollups = (
+            Transaction.objects.filter(wallet_id__in=wallet_ids)
+            .values("wallet_id", day=TruncDate("created_at", tzinfo=datetime.UTC))
+            .annotate(
+                net_amount=Sum("amount"),
+                credit_total=Coalesce(Sum("amount", filter=credit), Decimal("0.0")),
+                debit_total=Coalesce(Sum("amount", filter=~credit), Decimal("0.0")),
+                credit_count=Count("pk", filter=credit),
+                debit_count=Count("pk", filter=~credit),
+            )
+            .order_by()
+        )
+        WalletDailyRollup.objects.bulk_create(
+            WalletDailyRollup(**rollup) for rollup in rollups
+        )
 
 
 class Wallet(models.Model):
     label = models.CharField(max_length=100)
+    balance = models.DecimalField(
+        max_digits=36, decimal_places=18, default=Decimal("0.0"), editable=False
+    )
 
-    @property
-    def balance(self):
-        return (
-            Transaction.objects.filter(wallet=self).aggregate(Sum("amount"))[
-                "amount__sum"
+    objects = WalletQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["label"], name="b2broker_wallet_label_idx"),
+            # Top-N by balance and balance range filters.
+            models.Index(fields=["balance"], name="b2broker_wallet_balance_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # The in-memory balance may predate transactions committed since
+            # the wallet was loaded; balances only move through F() updates.
+            kwargs["update_fields"] = [
+                field.attname
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "balance"
             ]
-            or Decimal("0.0")
+        super().save(*args, **kwargs)
+        transaction.on_commit(partial(bump_versions, [wallet_scope(self.pk)]))
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            # The cascade deletes the transactions with one query, without
+            # loading them; one event stands for all of them.
+            OutboxEvent.for_wallet(OutboxEvent.WALLET_DELETED, pk, self.label).save()
+        transaction.on_commit(
+            partial(bump_versions, [wallet_scope(pk), DELETED_WALLETS_SCOPE])
         )
+        transaction.on_commit(partial(notify_wallets, [pk]))
+        return result
+
+    @classmethod
+    def add_to_balance(cls, wallet_id, amount):
+        """
+        Atomically shift the stored balance of a wallet by ``amount``.
+        """
+        if amount:
+            cls.objects.filter(pk=wallet_id).update(balance=F("balance") + amount)
+
+    @classmethod
+    def apply_balance_deltas(cls, deltas):
+        """
+        Apply a ``{wallet_id: amount}`` mapping of balance changes.
+        """
+        # Lock wallets in a stable order so that concurrent writers touching
+        # the same set of wallets cannot deadlock.
+        for wallet_id in sorted(deltas):
+            cls.add_to_balance(wallet_id, deltas[wallet_id])
+
+    @property
+    def ledger_balance(self):
+        """
+        The balance as recorded by the ledger: the last checkpoint plus the sum
+        of the transactions written after it. Its cost is bounded by the
+        activity since the checkpoint was advanced.
+        """
+        last_transaction_id, balance = BalanceCheckpoint.objects.filter(
+            wallet_id=self.pk
+        ).values_list("last_transaction_id", "balance").first() or (0, Decimal("0.0"))
+        recent = Transaction.objects.filter(
+            wallet_id=self.pk, pk__gt=last_transaction_id
+        ).aggregate(Sum("amount"))["amount__sum"]
+        return balance + (recent or 0)
 
 
 class Transaction(models.Model):
@@ -28,3 +158,326 @@ class Transaction(models.Model):
     amount = models.DecimalField(
         max_digits=36, decimal_places=18, default=Decimal("0.0")
     )
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # "transactions of wallet X" in id order, both directions, and the
+            # keyset pagination/export scans.
+            models.Index(fields=["wallet", "id"], name="b2broker_tx_wallet_id_idx"),
+            # Covering index for SUM(amount) ... GROUP BY wallet_id.
+            models.Index(
+                fields=["wallet", "amount"], name="b2broker_tx_wallet_amount_idx"
+            ),
+            # sort=amount across wallets, with the id tiebreaker from the
+            # primary key every secondary index ends with.
+            models.Index(fields=["amount"], name="b2broker_tx_amount_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Balances are shifted by the in-memory amount, which may have been
+        # assigned as a string or an int.
+        self.amount = self._meta.get_field("amount").to_python(self.amount)
+        with transaction.atomic():
+            previous = self._lock_stored_row() if self.pk is not None else None
+            super().save(*args, **kwargs)
+            changes = [(self.wallet_id, self.amount, self.created_at, 1)]
+            if previous is not None:
+                changes.append((*previous[:3], -1))
+            self._apply_changes(self.pk, changes)
+            OutboxEvent.for_transaction(
+                OutboxEvent.CREATED if previous is None else OutboxEvent.UPDATED,
+                self.pk,
+                self.wallet_id,
+                self.txid,
+                self.amount,
+                previous=previous,
+            ).save()
+        self._refresh_cached_wallet()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            pk = self.pk
+            previous = self._lock_stored_row()
+            result = super().delete(*args, **kwargs)
+            if previous is not None:
+                wallet_id, amount, created_at, txid = previous
+                self._apply_changes(pk, [(wallet_id, amount, created_at, -1)])
+                OutboxEvent.for_transaction(
+                    OutboxEvent.DELETED, pk, wallet_id, txid, amount
+                ).save()
+        self._refresh_cached_wallet()
+        return result
+
+    @staticmethod
+    def _apply_changes(pk, changes):
+        """
+        Propagate ``(wallet_id, amount, created_at, sign)`` changes of the row
+        ``pk`` to the stored balances, the checkpoints already covering it and
+        the daily rollups. ``sign`` is 1 for the new state of the row and -1
+        for the state it replaces.
+        """
+        deltas = defaultdict(Decimal)
+        for wallet_id, amount, created_at, sign in changes:
+            deltas[wallet_id] += sign * amount
+        Wallet.apply_balance_deltas(deltas)
+        for wallet_id in sorted(deltas):
+            BalanceCheckpoint.cover_change(wallet_id, pk, deltas[wallet_id])
+        WalletDailyRollup.apply_changes(changes)
+        scopes = [transaction_scope(pk)]
+        scopes.extend(wallet_scope(wallet_id) for wallet_id in deltas)
+        transaction.on_commit(partial(bump_versions, scopes))
+        transaction.on_commit(partial(notify_wallets, list(deltas)))
+
+    def _lock_stored_row(self):
+        # The balance delta has to be computed from the committed row, not from
+        # the in-memory instance, which may be stale or already modified.
+        return (
+            Transaction.objects.select_for_update()
+            .filter(pk=self.pk)
+            .values_list("wallet_id", "amount", "created_at", "txid")
+            .first()
+        )
+
+    def _refresh_cached_wallet(self):
+        if Transaction.wallet.is_cached(self):
+            self.wallet.refresh_from_db(fields=["balance"])
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    The balance of a wallet over all of its transactions up to and including
+    ``last_transaction_id``.
+
+    Checkpoints are advanced by the ``advance_balance_checkpoints`` command
+    and read by ``reconcile_balances``, which checks the stored balances
+    against them.
+    When a transaction the checkpoint already covers is created, updated or
+    deleted, the change is applied to the checkpoint balance as a delta, so
+    the checkpoint never has to be invalidated.
+    """
+
+    wallet = models.OneToOneField(
+        Wallet,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="balance_checkpoint",
+    )
+    last_transaction_id = models.BigIntegerField(default=0)
+    balance = models.DecimalField(
+        max_digits=36, decimal_places=18, default=Decimal("0.0")
+    )
+
+    @classmethod
+    def cover_change(cls, wallet_id, transaction_id, amount):
+        """
+        Shift the checkpoint of ``wallet_id`` by ``amount`` if it covers the
+        transaction ``transaction_id``.
+        """
+        # Lock the checkpoint even when it does not cover the transaction, as
+        # advance() does before reading the ledger: an UPDATE matching no row
+        # would not keep the lock under READ COMMITTED, and advance() could
+        # then move past this uncommitted id.
+        checkpoint = (
+            cls.objects.select_for_update()
+            .filter(wallet_id=wallet_id)
+            .values_list("last_transaction_id", flat=True)
+            .first()
+        )
+        if checkpoint is not None and checkpoint >= transaction_id:
+            cls.objects.filter(wallet_id=wallet_id).update(
+                balance=F("balance") + amount
+            )
+
+    @classmethod
+    def cover_inserted(cls, rows):
+        """
+        Apply bulk inserted ``Transaction`` rows to the checkpoints that
+        already cover their ids. Issues one query per touched wallet.
+        """
+        by_wallet = defaultdict(list)
+        for row in rows:
+            by_wallet[row.wallet_id].append(row)
+        for wallet_id in sorted(by_wallet):
+            checkpoint = (
+                cls.objects.select_for_update()
+                .filter(wallet_id=wallet_id)
+                .values_list("last_transaction_id", flat=True)
+                .first()
+            )
+            if checkpoint is None:
+                continue
+            covered = sum(
+                (row.amount for row in by_wallet[wallet_id] if row.pk <= checkpoint),
+                Decimal("0.0"),
+            )
+            if covered:
+                cls.objects.filter(wallet_id=wallet_id).update(
+                    balance=F("balance") + covered
+                )
+
+    @classmethod
+    def advance(cls, wallet_id):
+        """
+        Fold every transaction written since the checkpoint of ``wallet_id``
+        into it. Returns the number of the last covered transaction.
+        """
+        with transaction.atomic():
+            # Writers hold the wallet row lock from their balance update until
+            # they commit, including those that ran before the checkpoint
+            # existed. Take it, in the same order as they do, so that the
+            # ledger read below sees every id they inserted.
+            list(
+                Wallet.objects.select_for_update()
+                .filter(pk=wallet_id)
+                .values_list("pk", flat=True)
+            )
+            cls.objects.get_or_create(wallet_id=wallet_id)
+            # Lock the checkpoint before reading the ledger so that the
+            # snapshot we sum includes every writer that already touched it.
+            checkpoint = cls.objects.select_for_update().get(wallet_id=wallet_id)
+            recent = Transaction.objects.filter(
+                wallet_id=wallet_id, pk__gt=checkpoint.last_transaction_id
+            ).aggregate(total=Sum("amount"), last=Max("pk"))
+            if recent["last"] is not None:
+                checkpoint.balance = checkpoint.balance + recent["total"]
+                checkpoint.last_transaction_id = recent["last"]
+                checkpoint.save(update_fields=["balance", "last_transaction_id"])
+        return checkpoint.last_transaction_id
+
+
+class WalletDailyRollup(models.Model):
+    """
+    Per wallet and UTC day totals of the ledger, kept up to date on write.
+    Credits are transactions with a non-negative amount, debits the rest.
+    """
+
+    wallet = models.ForeignKey(
+        Wallet, on_delete=models.CASCADE, related_name="daily_rollups"
+    )
+    day = models.DateField()
+    net_amount = models.DecimalField(
+        max_digits=36, decimal_places=18, default=Decimal("0.0")
+    )
+    credit_total = models.DecimalField(
+        max_digits=36, decimal_places=18, default=Decimal("0.0")
+    )
+    debit_total = models.DecimalField(
+        max_digits=36, decimal_places=18, default=Decimal("0.0")
+    )
+    credit_count = models.BigIntegerField(default=0)
+    debit_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["wallet", "day"], name="b2broker_rollup_wallet_day_uniq"
+            ),
+        ]
+
+    @staticmethod
+    def day_of(created_at):
+        return created_at.astimezone(datetime.UTC).date()
+
+    @classmethod
+    def apply_changes(cls, changes):
+        """
+        Fold ``(wallet_id, amount, created_at, sign)`` changes into the
+        rollups, with one upsert per touched wallet and day.
+        """
+        totals = defaultdict(lambda: defaultdict(int))
+        for wallet_id, amount, created_at, sign in changes:
+            bucket = totals[(wallet_id, cls.day_of(created_at))]
+            bucket["net_amount"] += sign * amount
+            if amount >= 0:
+                bucket["credit_total"] += sign * amount
+                bucket["credit_count"] += sign
+            else:
+                bucket["debit_total"] += sign * amount
+                bucket["debit_count"] += sign
+        for wallet_id, day in sorted(totals):
+            bucket = totals[(wallet_id, day)]
+            if any(bucket.values()):
+                cls._upsert(wallet_id, day, bucket)
+
+    @classmethod
+    def _upsert(cls, wallet_id, day, bucket):
+        rollup = cls.objects.filter(wallet_id=wallet_id, day=day)
+        increments = {field: F(field) + value for field, value in bucket.items()}
+        if rollup.update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(wallet_id=wallet_id, day=day, **bucket)
+        except IntegrityError:
+            # Another writer created the row first.
+            rollup.update(**increments)
+
+
+def transaction_state(wallet_id, txid, amount):
+    return {
+        "attributes": {"txid": txid, "amount": format_amount(amount)},
+        "relationships": {
+            "wallet": {"data": {"type": "wallets", "id": str(wallet_id)}}
+        },
+    }
+
+
+class OutboxEvent(models.Model):
+    """
+    A ledger change waiting to be delivered by the ``publish_outbox`` command.
+
+    Events are written in the database transaction of the change they
+    describe, so they exist if and only if it committed, and are deleted
+    once delivered. ``payload`` is the JSON:API resource of the transaction,
+    as it was after a create or update and before a delete; update events
+    also carry the state before the update in ``meta.previous``.
+
+    Deleting a wallet deletes its transactions without an event for each of
+    them: a single ``wallet.deleted`` event, whose payload is the wallet
+    resource, stands for all of them.
+    """
+
+    CREATED = "transaction.created"
+    UPDATED = "transaction.updated"
+    DELETED = "transaction.deleted"
+    WALLET_DELETED = "wallet.deleted"
+
+    event_type = models.CharField(max_length=32)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def for_transaction(cls, event_type, pk, wallet_id, txid, amount, previous=None):
+        """
+        ``previous`` is the ``(wallet_id, amount, created_at, txid)`` of the
+        row before an update.
+        """
+        payload = {
+            "type": "transactions",
+            "id": str(pk),
+            **transaction_state(wallet_id, txid, amount),
+        }
+        if previous is not None:
+            previous_wallet_id, previous_amount, _, previous_txid = previous
+            payload["meta"] = {
+                "previous": transaction_state(
+                    previous_wallet_id, previous_txid, previous_amount
+                )
+            }
+        return cls(event_type=event_type, payload=payload)
+
+    @classmethod
+    def for_wallet(cls, event_type, pk, label):
+        return cls(
+            event_type=event_type,
+            payload={"type": "wallets", "id": str(pk), "attributes": {"label": label}},
+        )
+
+    def as_message(self):
+        return {
+            "id": self.pk,
+            "type": self.event_type,
+            "created_at": self.created_at.isoformat(),
+            "data": self.payload,
+        }
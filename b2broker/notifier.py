@@ -0,0 +1,95 @@
+"""
+In-process notifications of committed wallet changes.
+
+Writers call ``notify_wallets()`` once their transaction has committed;
+``subscribe()`` gives asyncio code (the transaction streams served from the
+ASGI entry point) an event that is set from whichever thread committed. Only
+writes made by the same process are seen, so subscribers must still poll
+now and then for the writes of other processes.
+"""
+
+import asyncio
+import threading
+from collections import defaultdict
+
+
+class Subscription:
+    def __init__(self, notifier, wallet_id):
+        self.notifier = notifier
+        self.wallet_id = wallet_id
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def __enter__(self):
+        self.notifier._add(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.notifier._remove(self)
+
+    def clear(self):
+        """
+        Forget the notifications received so far. Call it before reading the
+        state the notifications are about, so none can be missed.
+        """
+        self.event.clear()
+
+    async def wait(self, timeout):
+        """
+        Wait up to ``timeout`` seconds for a notification. Returns whether
+        one arrived.
+        """
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except TimeoutError:
+            return False
+        return True
+
+
+class Notifier:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, wallet_id):
+        """
+        Return a context manager subscribing the running event loop to the
+        changes of ``wallet_id``.
+        """
+        return Subscription(self, int(wallet_id))
+
+    def subscribers(self, wallet_id):
+        with self._lock:
+            return len(self._subscriptions.get(int(wallet_id), ()))
+
+    def notify(self, wallet_ids):
+        with self._lock:
+            subscriptions = [
+                subscription
+                for wallet_id in set(wallet_ids)
+                for subscription in self._subscriptions.get(int(wallet_id), ())
+            ]
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.event.set)
+            except RuntimeError:
+                # The loop is closed, the subscriber is going away.
+                pass
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscriptions[subscription.wallet_id].add(subscription)
+
+    def _remove(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions[subscription.wallet_id]
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.wallet_id]
+
+
+notifier = Notifier()
+
+
+def notify_wallets(wallet_ids):
+    notifier.notify(wallet_ids)
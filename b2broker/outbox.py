@@ -0,0 +1,199 @@
+"""
+Delivery of the ``OutboxEvent`` rows written with every ledger change.
+
+``publish_batch`` locks the oldest undelivered events with
+``SELECT ... FOR UPDATE SKIP LOCKED``, hands them to a sink and deletes them
+in the same database transaction, so concurrent publishers never deliver the
+same batch and a failed delivery leaves it in the outbox. Events are
+delivered at least once: a batch the sink accepted is sent again if the
+commit that deletes it fails. Consumers should deduplicate by event ``id``;
+with several publishers batches may also arrive out of ``id`` order.
+
+Sinks are chosen by the scheme of a URL:
+
+* ``file:///var/log/ledger.ndjson`` appends one JSON message per line,
+* ``unix:///run/ledger.sock`` writes the same lines to a Unix socket,
+* ``http://`` and ``https://`` URLs receive every batch as a JSON
+  ``{"events": [...]}`` POST.
+
+``B2BROKER_OUTBOX_SINKS`` maps more schemes to the dotted path of a ``Sink``
+subclass.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import urllib.request
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from b2broker.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_POLL_SECONDS = 1.0
+WEBHOOK_TIMEOUT = 10
+
+SINKS = {
+    "file": "b2broker.outbox.FileSink",
+    "unix": "b2broker.outbox.SocketSink",
+    "http": "b2broker.outbox.WebhookSink",
+    "https": "b2broker.outbox.WebhookSink",
+}
+
+
+def get_batch_size():
+    return getattr(settings, "B2BROKER_OUTBOX_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+
+
+def get_poll_seconds():
+    return getattr(settings, "B2BROKER_OUTBOX_POLL_SECONDS", DEFAULT_POLL_SECONDS)
+
+
+class DeliveryError(Exception):
+    pass
+
+
+def encode(message):
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class Sink:
+    """
+    Delivers batches of outbox messages. ``send`` raises ``DeliveryError``
+    when a batch was not delivered. One sink is shared by all the worker
+    threads of a publisher.
+    """
+
+    def __init__(self, url):
+        self.url = url
+
+    def send(self, messages):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileSink(Sink):
+    def __init__(self, url):
+        super().__init__(url)
+        self.path = urlsplit(url).path
+        self._lock = threading.Lock()
+        self._file = open(self.path, "ab")
+
+    def send(self, messages):
+        content = b"".join(encode(message) + b"\n" for message in messages)
+        try:
+            with self._lock:
+                self._file.write(content)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+        except OSError as exc:
+            raise DeliveryError(f"cannot write to {self.path}: {exc}") from exc
+
+    def close(self):
+        self._file.close()
+
+
+class SocketSink(Sink):
+    def __init__(self, url):
+        super().__init__(url)
+        self.path = urlsplit(url).path
+        self._lock = threading.Lock()
+        self._socket = None
+
+    def send(self, messages):
+        content = b"".join(encode(message) + b"\n" for message in messages)
+        with self._lock:
+            try:
+                if self._socket is None:
+                    self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self._socket.connect(self.path)
+                self._socket.sendall(content)
+            except OSError as exc:
+                # Reconnect for the next batch, the peer may have restarted.
+                self._close()
+                raise DeliveryError(f"cannot write to {self.path}: {exc}") from exc
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class WebhookSink(Sink):
+    def send(self, messages):
+        request = urllib.request.Request(
+            self.url,
+            data=encode({"events": messages}),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=WEBHOOK_TIMEOUT):
+                pass
+        except OSError as exc:
+            raise DeliveryError(f"cannot POST to {self.url}: {exc}") from exc
+
+
+def get_sink(url):
+    """
+    Return the sink for ``url``. Raises ``ValueError`` for unknown schemes.
+    """
+    sinks = {**SINKS, **getattr(settings, "B2BROKER_OUTBOX_SINKS", {})}
+    scheme = urlsplit(url).scheme
+    if scheme not in sinks:
+        raise ValueError(f"no sink for {scheme!r} URLs")
+    return import_string(sinks[scheme])(url)
+
+
+def publish_batch(sink, batch_size):
+    """
+    Deliver and delete up to ``batch_size`` of the oldest events not locked
+    by another publisher. Returns the number of events delivered.
+    """
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True).order_by("pk")[
+                :batch_size
+            ]
+        )
+        if events:
+            sink.send([event.as_message() for event in events])
+            OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).delete()
+    return len(events)
+
+
+def publish(sink, batch_size, stop, poll_seconds, once=False):
+    """
+    Publish batches until ``stop`` is set or, with ``once``, until there is
+    nothing left to publish. Waits ``poll_seconds`` whenever the outbox runs
+    dry or a delivery fails. Returns the number of events delivered.
+    """
+    published = 0
+    while not stop.is_set():
+        try:
+            count = publish_batch(sink, batch_size)
+        except DeliveryError:
+            if once:
+                raise
+            logger.warning("Outbox delivery failed", exc_info=True)
+            stop.wait(poll_seconds)
+            continue
+        published += count
+        if count < batch_size:
+            if once:
+                break
+            stop.wait(poll_seconds)
+    return published
@@ -0,0 +1,78 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import Response
+from rest_framework_json_api.pagination import JsonApiPageNumberPagination
+
+
+class JsonApiCursorPagination(CursorPagination):
+    """
+    A JSON:API compatible keyset pagination format.
+
+    Pages are addressed by an opaque ``page[cursor]`` and fetched with a
+    ``WHERE id > <last id> ORDER BY id LIMIT n`` query, so deep pages cost the
+    same as the first one. The total count is only computed when the client
+    asks for it with ``page[count]=true``.
+    """
+
+    cursor_query_param = "page[cursor]"
+    page_size_query_param = "page[size]"
+    count_query_param = "page[count]"
+    max_page_size = 100
+    ordering = "id"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ("1", "true"):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def decode_cursor(self, request):
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+    def get_first_link(self):
+        return replace_query_param(self.base_url, self.cursor_query_param, "")
+
+    def get_paginated_response(self, data):
+        pagination = {}
+        if self.count is not None:
+            pagination["count"] = self.count
+        return Response(
+            {
+                "results": data,
+                "meta": {"pagination": pagination},
+                "links": {
+                    "first": self.get_first_link(),
+                    "next": self.get_next_link(),
+                    "prev": self.get_previous_link(),
+                },
+            }
+        )
+
+
+class JsonApiPagination(JsonApiPageNumberPagination):
+    """
+    Page number pagination that switches to keyset pagination when the
+    request carries a ``page[cursor]`` parameter (start with an empty one).
+    """
+
+    cursor_query_param = JsonApiCursorPagination.cursor_query_param
+    cursor_pagination_class = JsonApiCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
@@ -0,0 +1,78 @@
+import json
+from types import SimpleNamespace
+
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+from rest_framework_json_api.exceptions import Conflict
+from rest_framework_json_api.parsers import JSONParser
+
+
+def parse_resource_object(resource):
+    """
+    Flatten a JSON:API resource object into the attribute/relationship dict
+    DRF serializers expect, the same way ``JSONParser`` does for a single one.
+    """
+    if not isinstance(resource, dict):
+        raise ParseError("Received data is not a valid JSON:API Resource Object")
+    parsed = {"id": resource.get("id")} if "id" in resource else {}
+    parsed["type"] = resource.get("type")
+    parsed.update(JSONParser.parse_attributes(resource))
+    parsed.update(JSONParser.parse_relationships(resource))
+    return parsed
+
+
+def type_conflict(resource, resource_type):
+    """
+    Return the ``Conflict`` error ``JSONParser`` raises on the single resource
+    endpoints when ``resource`` is not of ``resource_type``, or ``None``.
+    """
+    context = {
+        "request": SimpleNamespace(method="POST"),
+        "view": SimpleNamespace(resource_name=resource_type),
+    }
+    try:
+        JSONParser().parse_data({"data": resource}, context)
+    except Conflict as exc:
+        return exc
+    return None
+
+
+class JSONAPIBulkParser(parsers.JSONParser):
+    """
+    Parses a JSON:API document whose primary data is an array of resource
+    objects into a list of flattened resources.
+    """
+
+    media_type = "application/vnd.api+json"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(
+            stream, media_type=media_type, parser_context=parser_context
+        )
+        if not isinstance(result, dict) or not isinstance(result.get("data"), list):
+            raise ParseError("Received document does not contain an array of data")
+        return [parse_resource_object(resource) for resource in result["data"]]
+
+
+class NDJSONParser(parsers.BaseParser):
+    """
+    Parses newline delimited JSON where every line holds one JSON:API resource
+    object.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", "utf-8")
+        resources = []
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                resource = json.loads(line.decode(encoding))
+            except ValueError as exc:
+                raise ParseError(f"NDJSON parse error on line {line_number}: {exc}")
+            resources.append(parse_resource_object(resource))
+        return resources
@@ -0,0 +1,145 @@
+"""
+Hash partitioned layout of the transaction table on MySQL.
+
+The table is split with ``PARTITION BY LINEAR HASH(wallet_id)``, so every
+per-wallet query (``filter[wallet]``, the ledger balance, checkpoints and
+rollup rebuilds) is pruned to a single partition.
+
+MySQL does not allow foreign keys on partitioned tables and requires every
+unique key to contain the partitioning column. The layout therefore:
+
+* extends the primary key to ``(id, wallet_id)``,
+* replaces the unique ``txid`` index with a plain one, and
+* replaces the ``wallet_id`` foreign key with a ``b2broker_transaction_txid``
+  guard table keyed by txid and referencing the wallet, kept in sync by
+  triggers, so txids stay globally unique and rows keep pointing to
+  existing wallets.
+
+None of it is visible to the ORM: the Django model is unchanged, and a
+duplicate txid still raises ``IntegrityError``.
+"""
+
+from django.db import connection as default_connection
+
+TABLE = "b2broker_transaction"
+GUARD_TABLE = "b2broker_transaction_txid"
+TXID_INDEX = "b2broker_tx_txid_idx"
+WALLET_FK = "b2broker_transaction_wallet_id_fk"
+GUARD_WALLET_FK = "b2broker_transaction_txid_wallet_id_fk"
+
+TRIGGERS = {
+    "b2broker_transaction_txid_insert": (
+        f"BEFORE INSERT ON {TABLE} FOR EACH ROW "
+        f"INSERT INTO {GUARD_TABLE} (txid, wallet_id) VALUES (NEW.txid, NEW.wallet_id)"
+    ),
+    "b2broker_transaction_txid_update": (
+        f"BEFORE UPDATE ON {TABLE} FOR EACH ROW "
+        f"UPDATE {GUARD_TABLE} SET txid = NEW.txid, wallet_id = NEW.wallet_id "
+        f"WHERE txid = OLD.txid"
+    ),
+    "b2broker_transaction_txid_delete": (
+        f"AFTER DELETE ON {TABLE} FOR EACH ROW "
+        f"DELETE FROM {GUARD_TABLE} WHERE txid = OLD.txid"
+    ),
+}
+
+
+def is_supported(connection=default_connection):
+    return connection.vendor == "mysql"
+
+
+def get_partitions(connection=default_connection):
+    """
+    Return ``[(partition name, approximate rows)]`` of the transaction table,
+    empty when it is not partitioned.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT partition_name, table_rows FROM information_schema.partitions "
+            "WHERE table_schema = DATABASE() AND table_name = %s "
+            "AND partition_name IS NOT NULL ORDER BY partition_ordinal_position",
+            [TABLE],
+        )
+        return cursor.fetchall()
+
+
+def _constraint_names(cursor, constraint_type, column):
+    cursor.execute(
+        "SELECT tc.constraint_name FROM information_schema.table_constraints tc "
+        "JOIN information_schema.key_column_usage kcu "
+        "ON kcu.constraint_schema = tc.constraint_schema "
+        "AND kcu.constraint_name = tc.constraint_name "
+        "AND kcu.table_name = tc.table_name "
+        "WHERE tc.table_schema = DATABASE() AND tc.table_name = %s "
+        "AND tc.constraint_type = %s AND kcu.column_name = %s",
+        [TABLE, constraint_type, column],
+    )
+    return [name for (name,) in cursor.fetchall()]
+
+
+def partition(partitions, connection=default_connection):
+    """
+    Switch the transaction table to the partitioned layout with
+    ``partitions`` partitions.
+    """
+    with connection.cursor() as cursor:
+        for name in _constraint_names(cursor, "FOREIGN KEY", "wallet_id"):
+            cursor.execute(f"ALTER TABLE {TABLE} DROP FOREIGN KEY {name}")
+        unique_txid = _constraint_names(cursor, "UNIQUE", "txid")
+
+        cursor.execute(
+            f"CREATE TABLE {GUARD_TABLE} ("
+            "txid varchar(100) NOT NULL PRIMARY KEY, "
+            "wallet_id bigint NOT NULL, "
+            f"CONSTRAINT {GUARD_WALLET_FK} FOREIGN KEY (wallet_id) "
+            "REFERENCES b2broker_wallet (id))"
+        )
+        cursor.execute(
+            f"INSERT INTO {GUARD_TABLE} (txid, wallet_id) "
+            f"SELECT txid, wallet_id FROM {TABLE}"
+        )
+        for name, definition in TRIGGERS.items():
+            cursor.execute(f"CREATE TRIGGER {name} {definition}")
+
+        alterations = [f"ADD INDEX {TXID_INDEX} (txid)"]
+        alterations.extend(f"DROP INDEX {name}" for name in unique_txid)
+        alterations.extend(["DROP PRIMARY KEY", "ADD PRIMARY KEY (id, wallet_id)"])
+        cursor.execute(f"ALTER TABLE {TABLE} {', '.join(alterations)}")
+        cursor.execute(
+            f"ALTER TABLE {TABLE} PARTITION BY LINEAR HASH (wallet_id) "
+            f"PARTITIONS {int(partitions)}"
+        )
+
+
+def resize(partitions, connection=default_connection):
+    """
+    Add or coalesce partitions until there are ``partitions`` of them. With
+    linear hashing only the partitions being split or merged are rewritten.
+    """
+    current = len(get_partitions(connection))
+    with connection.cursor() as cursor:
+        if partitions > current:
+            cursor.execute(
+                f"ALTER TABLE {TABLE} ADD PARTITION PARTITIONS {partitions - current}"
+            )
+        elif partitions < current:
+            cursor.execute(
+                f"ALTER TABLE {TABLE} COALESCE PARTITION {current - partitions}"
+            )
+
+
+def unpartition(connection=default_connection):
+    """
+    Restore the unpartitioned layout the Django model describes.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TABLE} REMOVE PARTITIONING")
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE {GUARD_TABLE}")
+        cursor.execute(
+            f"ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id), "
+            f"DROP INDEX {TXID_INDEX}, ADD UNIQUE INDEX {TABLE}_txid_uniq (txid), "
+            f"ADD CONSTRAINT {WALLET_FK} FOREIGN KEY (wallet_id) "
+            "REFERENCES b2broker_wallet (id)"
+        )
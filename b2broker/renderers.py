@@ -0,0 +1,40 @@
+import json
+
+from rest_framework import renderers
+from rest_framework_json_api.exceptions import rendered_with_json_api
+from rest_framework_json_api.renderers import JSONRenderer
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Newline delimited JSON. Streaming views write their own body; this
+    renderer only takes part in content negotiation.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data).encode(self.charset) + b"\n"
+
+
+class CSVRenderer(NDJSONRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class JSONAPIErrorsMixin:
+    """
+    Renders the errors of the actions that only have NDJSON or CSV renderers
+    (the exports) as JSON:API error documents, like every other endpoint.
+    """
+
+    def handle_exception(self, exc):
+        if not rendered_with_json_api(self):
+            self.renderer_classes = [JSONRenderer, *self.renderer_classes]
+            self.request.accepted_renderer = JSONRenderer()
+            self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
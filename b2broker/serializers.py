@@ -1,20 +1,52 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from rest_framework import serializers as drf_serializers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework_json_api import serializers
 from rest_framework_json_api.relations import ResourceRelatedField
 from rest_framework_json_api.views import RelationshipView
 
+from b2broker.fieldsets import get_included_fields
 from b2broker.models import Wallet, Transaction
 
 
 class WalletSerializer(serializers.ModelSerializer):
+    """
+    ``transactions`` holds the wallet's most recent transactions, prefetched
+    by the viewset into ``recent_transactions``. It is only part of reads
+    that ``include`` it.
+    """
+
     balance = serializers.SerializerMethodField()
+    transactions = ResourceRelatedField(
+        many=True, read_only=True, model=Transaction, source="recent_transactions"
+    )
+
+    included_serializers = {
+        "transactions": "b2broker.serializers.TransactionSerializer",
+    }
 
     class Meta:
         model = Wallet
-        fields = ["id", "label", "balance", "url"]
+        fields = ["id", "label", "balance", "transactions", "url"]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        if (
+            request is None
+            or request.method not in SAFE_METHODS
+            or "transactions" not in get_included_fields(request)
+        ):
+            del fields["transactions"]
+        return fields
 
     @staticmethod
     def get_balance(obj):
-        return str(obj.balance)
+        return str(obj.balance or Decimal("0.0"))
 
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -22,6 +54,93 @@ class TransactionSerializer(serializers.ModelSerializer):
         max_digits=36, decimal_places=18, default=0, allow_null=True
     )
 
+    included_serializers = {
+        "wallet": WalletSerializer,
+    }
+
     class Meta:
         model = Transaction
         fields = ["id", "wallet", "txid", "amount", "url"]
+
+
+class TransactionConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = (
+        "transaction with this txid and different attributes already exists."
+    )
+    default_code = "conflict"
+
+
+class IdempotentTransactionSerializer(TransactionSerializer):
+    """
+    Creates a transaction, or returns the stored one when its txid is taken
+    by a transaction with identical attributes, so that retried requests are
+    safe. ``created`` tells which one happened.
+
+    The txid is not checked up front: the insert is attempted in a savepoint
+    and only a unique constraint violation leads to fetching the stored row.
+    """
+
+    txid = serializers.CharField(max_length=100)
+
+    def validate_txid(self, value):
+        key = self.context["request"].headers.get("Idempotency-Key")
+        if key is not None and key != value:
+            raise serializers.ValidationError(
+                "txid must match the Idempotency-Key header."
+            )
+        return value
+
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                instance = super().create(validated_data)
+        except IntegrityError:
+            instance = Transaction.objects.filter(txid=validated_data["txid"]).first()
+            if instance is None:
+                raise
+            amount = Transaction._meta.get_field("amount").to_python(
+                validated_data.get("amount")
+            )
+            identical = (
+                instance.wallet_id == validated_data["wallet"].pk
+                and instance.amount == amount
+            )
+            if not identical:
+                raise TransactionConflict(
+                    {"txid": [TransactionConflict.default_detail]}
+                )
+            self.created = False
+            return instance
+        self.created = True
+        return instance
+
+
+class WalletIdentifierField(drf_serializers.Field):
+    default_error_messages = {
+        "invalid": "Expected a wallets resource identifier object.",
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, dict) or data.get("type") != "wallets":
+            self.fail("invalid")
+        try:
+            return int(data.get("id"))
+        except (TypeError, ValueError):
+            self.fail("invalid")
+
+    def to_representation(self, value):
+        return {"type": "wallets", "id": str(value)}
+
+
+class TransactionIngestSerializer(drf_serializers.Serializer):
+    """
+    Validates one item of a bulk ingestion request without touching the
+    database; wallet existence and txid uniqueness are checked per batch.
+    """
+
+    wallet = WalletIdentifierField()
+    txid = drf_serializers.CharField(max_length=100)
+    amount = drf_serializers.DecimalField(
+        max_digits=36, decimal_places=18, default=0, allow_null=True
+    )
@@ -1,9 +1,21 @@
+from django.urls import path
 from rest_framework import routers
 
-from b2broker import views
+from b2broker import async_views, metrics, views
 
 router = routers.DefaultRouter()
 router.register(r"wallets", views.WalletViewSet)
 router.register(r"transactions", views.TransactionViewSet)
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path("async/wallets/", async_views.wallet_list),
+    path("async/wallets/<str:pk>/", async_views.wallet_detail),
+    path("async/transactions/", async_views.transaction_list),
+    path("async/transactions/<str:pk>/", async_views.transaction_detail),
+    path(
+        "wallets/<str:pk>/transactions/stream",
+        async_views.transaction_stream,
+        name="wallet-transaction-stream",
+    ),
+    path("metrics", metrics.metrics_view, name="metrics"),
+]
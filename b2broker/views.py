@@ -1,24 +1,192 @@
 from django.shortcuts import render
 
 # Create your views here.
-from rest_framework import viewsets
-from rest_framework_json_api.views import RelationshipView
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import ListField
+from rest_framework.response import Response
+from rest_framework_json_api.views import PreloadIncludesMixin, RelationshipView
 
+from b2broker import group_commit
+from b2broker.bulk import ingest_transactions
+from b2broker.cache import (
+    DELETED_WALLETS_SCOPE,
+    GLOBAL_SCOPE,
+    CachedReadMixin,
+    transaction_scope,
+    wallet_scope,
+)
+from b2broker.documents import (
+    TRANSACTION_COLUMNS,
+    WALLET_COLUMNS,
+    transaction_resource,
+    wallet_resource,
+)
+from b2broker.export import (
+    balance_csv_lines,
+    balance_ndjson_lines,
+    csv_lines,
+    iter_balances_by_id,
+    iter_transaction_rows,
+    iter_wallet_balances,
+    ndjson_lines,
+)
+from b2broker.fast_list import FastListMixin
+from b2broker.fieldsets import SparseFieldsetsMixin
+from b2broker.history import INTERVALS, balance_history
 from b2broker.models import Wallet, Transaction
-from b2broker.serializers import WalletSerializer, TransactionSerializer
+from b2broker.parsers import JSONAPIBulkParser, NDJSONParser
+from b2broker.renderers import CSVRenderer, JSONAPIErrorsMixin, NDJSONRenderer
+from b2broker.serializers import (
+    IdempotentTransactionSerializer,
+    WalletIdentifierField,
+    WalletSerializer,
+    TransactionSerializer,
+)
 
+# Number of transactions ``include=transactions`` embeds per wallet.
+RECENT_TRANSACTIONS = 10
 
-class WalletViewSet(viewsets.ModelViewSet):
+
+def lookup_pk(model, value):
+    """
+    Return the primary key a lookup by ``value`` finds, so that ``01`` and
+    ``1`` share a cache scope, or ``None`` if ``value`` is not a valid key.
+    """
+    try:
+        return model._meta.pk.to_python(value)
+    except DjangoValidationError:
+        return None
+
+
+class WalletViewSet(
+    JSONAPIErrorsMixin,
+    CachedReadMixin,
+    FastListMixin,
+    SparseFieldsetsMixin,
+    PreloadIncludesMixin,
+    viewsets.ModelViewSet,
+):
     """
     API endpoint that allows wallets to be viewed or edited.
+
+    ``?include=transactions`` embeds the most recent transactions of every
+    wallet, fetched with one extra query for the whole page. Wallets can be
+    sorted by ``balance`` and filtered with ``filter[balance.gte]=`` and the
+    other ``gt`` / ``lt`` / ``lte`` bounds, answered from the balance index.
     """
 
     queryset = Wallet.objects.all()
     serializer_class = WalletSerializer
-    filterset_fields = ("id", "label")
+    filterset_fields = {
+        "id": ("exact",),
+        "label": ("exact",),
+        "balance": ("gt", "gte", "lt", "lte"),
+    }
+    ordering_fields = ("id", "label", "balance")
+    ordering = ("id",)
+    resource_type = "wallets"
+    fieldset_columns = WALLET_COLUMNS
+    prefetch_for_includes = {
+        "transactions": [
+            Prefetch(
+                "transactions",
+                queryset=Transaction.objects.order_by("-id")[:RECENT_TRANSACTIONS],
+                to_attr="recent_transactions",
+            )
+        ],
+    }
+    fast_resource = staticmethod(wallet_resource)
+    fast_view_name = "wallet-detail"
+
+    def get_cache_scope(self):
+        if self.action == "retrieve":
+            pk = lookup_pk(Wallet, self.kwargs[self.lookup_field])
+            return None if pk is None else wallet_scope(pk)
+        return GLOBAL_SCOPE
+
+    @action(detail=True, methods=["get"], filter_backends=[], pagination_class=None)
+    def history(self, request, pk=None):
+        """
+        Balance over time of a wallet, bucketed by ``?interval=day|week|month``
+        and optionally bounded with ``?start=`` / ``?end=`` ISO dates.
+        """
+        interval = request.query_params.get("interval", "day")
+        if interval not in INTERVALS:
+            raise ValidationError(f"interval must be one of: {', '.join(INTERVALS)}")
+        bounds = {}
+        for param in ("start", "end"):
+            value = request.query_params.get(param)
+            if value is not None:
+                try:
+                    bounds[param] = parse_date(value)
+                except ValueError:
+                    bounds[param] = None
+                if bounds[param] is None:
+                    raise ValidationError(f"{param} must be an ISO 8601 date")
+
+        wallet = self.get_object()
+        self.resource_name = False
+        return Response(
+            {
+                "meta": {
+                    "interval": interval,
+                    "buckets": balance_history(wallet.pk, interval, **bounds),
+                }
+            }
+        )
+
+    @action(
+        detail=False,
+        methods=["get", "post"],
+        renderer_classes=[NDJSONRenderer, CSVRenderer],
+        parser_classes=[JSONAPIBulkParser, NDJSONParser],
+        pagination_class=None,
+    )
+    def balances(self, request, format=None):
+        """
+        Stream the balances of many wallets as NDJSON (default) or CSV, in id
+        order.
 
+        A GET returns every wallet matching the ``filter[...]`` parameters. A
+        POST returns the wallets whose ``wallets`` resource identifiers it
+        sends, either as a JSON:API document whose ``data`` is an array or as
+        NDJSON; ids that do not exist are left out.
+        """
+        if request.method == "POST":
+            identifiers = ListField(child=WalletIdentifierField())
+            wallet_ids = sorted(set(identifiers.run_validation(request.data)))
+            rows = iter_balances_by_id(wallet_ids)
+        else:
+            rows = iter_wallet_balances(self.filter_queryset(self.get_queryset()))
+        renderer = request.accepted_renderer
+        lines = (
+            balance_csv_lines(rows)
+            if renderer.format == "csv"
+            else balance_ndjson_lines(rows)
+        )
+        response = StreamingHttpResponse(
+            lines, content_type=f"{renderer.media_type}; charset=utf-8"
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="balances.{renderer.format}"'
+        )
+        return response
 
-class TransactionViewSet(viewsets.ModelViewSet):
+
+class TransactionViewSet(
+    JSONAPIErrorsMixin,
+    CachedReadMixin,
+    FastListMixin,
+    SparseFieldsetsMixin,
+    PreloadIncludesMixin,
+    viewsets.ModelViewSet,
+):
     """
     API endpoint that allows transactions to be viewed or edited.
     """
@@ -26,3 +194,112 @@ class TransactionViewSet(viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     filterset_fields = ("id", "wallet", "txid")
+    ordering_fields = ("id", "wallet", "txid", "amount")
+    ordering = ("id",)
+    resource_type = "transactions"
+    fieldset_columns = TRANSACTION_COLUMNS
+    select_for_includes = {"wallet": ["wallet"]}
+    fast_resource = staticmethod(transaction_resource)
+    fast_view_name = "transaction-detail"
+
+    def get_serializer_class(self):
+        if self.action == "create" and "Idempotency-Key" in self.request.headers:
+            return IdempotentTransactionSerializer
+        return super().get_serializer_class()
+
+    def create(self, request, *args, **kwargs):
+        """
+        Create a transaction. With an ``Idempotency-Key: <txid>`` header, a
+        retry of a request that already created the transaction gets it back
+        with ``200 OK``; a different payload for the same txid gets
+        ``409 Conflict``.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        if not getattr(serializer, "created", True):
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        headers = self.get_success_headers(serializer.data)
+        return Response(
+            serializer.data, status=status.HTTP_201_CREATED, headers=headers
+        )
+
+    def perform_create(self, serializer):
+        if group_commit.is_enabled() and not isinstance(
+            serializer, IdempotentTransactionSerializer
+        ):
+            serializer.instance = group_commit.create_transaction(
+                serializer.validated_data
+            )
+        else:
+            super().perform_create(serializer)
+
+    def get_cache_scope(self):
+        if self.action == "retrieve":
+            # The included wallet changes without the transaction changing.
+            if "include" in self.request.query_params:
+                return GLOBAL_SCOPE
+            pk = lookup_pk(Transaction, self.kwargs[self.lookup_field])
+            if pk is None:
+                return None
+            return (transaction_scope(pk), DELETED_WALLETS_SCOPE)
+        wallets = self.request.query_params.getlist("filter[wallet]")
+        if len(wallets) == 1:
+            pk = lookup_pk(Wallet, wallets[0])
+            if pk is not None:
+                return wallet_scope(pk)
+        return GLOBAL_SCOPE
+
+    @action(
+        detail=False,
+        methods=["post"],
+        parser_classes=[JSONAPIBulkParser, NDJSONParser],
+    )
+    def bulk(self, request):
+        """
+        Create many transactions in one request.
+
+        Accepts either a JSON:API document whose ``data`` is an array of
+        transaction resource objects, or an ``application/x-ndjson`` body with
+        one resource object per line. Responds with one status per item.
+        """
+        results = ingest_transactions(request.data)
+        created = sum(1 for result in results if result["status"] == "201")
+        # The per-item results are not resources, so skip JSON:API rendering.
+        self.resource_name = False
+        return Response(
+            {
+                "meta": {
+                    "created": created,
+                    "failed": len(results) - created,
+                    "results": results,
+                }
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @action(
+        detail=False,
+        methods=["get"],
+        renderer_classes=[NDJSONRenderer, CSVRenderer],
+        pagination_class=None,
+    )
+    def export(self, request, format=None):
+        """
+        Stream every transaction matching the ``filter[...]`` parameters as
+        NDJSON (default) or CSV, in id order.
+
+        Pick the format with the ``Accept`` header or a ``.ndjson`` / ``.csv``
+        suffix, e.g. ``/transactions/export.csv?filter[wallet]=1``.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = iter_transaction_rows(queryset)
+        renderer = request.accepted_renderer
+        lines = csv_lines(rows) if renderer.format == "csv" else ndjson_lines(rows)
+        response = StreamingHttpResponse(
+            lines, content_type=f"{renderer.media_type}; charset=utf-8"
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="transactions.{renderer.format}"'
+        )
+        return response
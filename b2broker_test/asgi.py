@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "b2broker_test.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up.
+from b2broker.async_views import StreamApplication  # noqa: E402
+
+# Transaction streams are served without going through Django's handler.
+application = StreamApplication(django_application)
@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "b2broker.metrics.MetricsMiddleware",
+    "b2broker.db_routers.ReplicaPinMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -85,6 +87,48 @@ DATABASES = {
     }
 }
 
+# Read replicas of the default database, as a comma separated list of hosts
+# in MYSQL_REPLICA_HOSTS. See b2broker.db_routers for what is read from them.
+B2BROKER_READ_REPLICAS = []
+for host in filter(None, os.environ.get("MYSQL_REPLICA_HOSTS", "").split(",")):
+    alias = f"replica_{len(B2BROKER_READ_REPLICAS)}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
+    }
+    B2BROKER_READ_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["b2broker.db_routers.ReplicaRouter"]
+
+# How long a client that wrote keeps reading from the primary.
+B2BROKER_REPLICA_PIN_SECONDS = 5
+
+# Number of hash partitions (by wallet) the transaction table is split into
+# by migration 0006 on MySQL; 0 keeps it unpartitioned. See
+# b2broker.partitioning and the partition_transactions command.
+B2BROKER_TRANSACTION_PARTITIONS = int(
+    os.environ.get("B2BROKER_TRANSACTION_PARTITIONS", "0")
+)
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+
+# The cache every process shares for the response cache and ETag versions,
+# the redis service of docker-compose.
+if os.environ.get("REDIS_URL"):
+    CACHES["shared"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -127,7 +171,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     "PAGE_SIZE": 10,
     "EXCEPTION_HANDLER": "rest_framework_json_api.exceptions.exception_handler",
-    "DEFAULT_PAGINATION_CLASS": "rest_framework_json_api.pagination.JsonApiPageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "b2broker.pagination.JsonApiPagination",
     "DEFAULT_PARSER_CLASSES": (
         "rest_framework_json_api.parsers.JSONParser",
         "rest_framework.parsers.FormParser",
@@ -141,7 +185,7 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "rest_framework_json_api.schemas.openapi.AutoSchema",
     "DEFAULT_FILTER_BACKENDS": (
         "rest_framework_json_api.filters.QueryParameterValidationFilter",
-        "rest_framework_json_api.filters.OrderingFilter",
+        "b2broker.filters.OrderingFilter",
         "rest_framework_json_api.django_filters.DjangoFilterBackend",
     ),
     "TEST_REQUEST_RENDERER_CLASSES": (
@@ -153,3 +197,45 @@ REST_FRAMEWORK = {
 JSON_API_PLURALIZE_TYPES = True
 JSON_API_FORMAT_TYPES = "underscore"
 JSON_API_FORMAT_RELATED_LINKS = "dasherize"
+
+# Serve wallet and transaction reads from the versioned response cache. Only
+# used when B2BROKER_CACHE_ALIAS is a shared backend: invalidations made by
+# other workers and management commands never reach a per-process cache.
+B2BROKER_RESPONSE_CACHE = os.environ.get("B2BROKER_RESPONSE_CACHE") == "1"
+B2BROKER_CACHE_ALIAS = "shared" if "shared" in CACHES else "default"
+B2BROKER_RESPONSE_CACHE_TIMEOUT = 300
+
+# Send ETags and answer If-None-Match with 304. By default only when
+# B2BROKER_CACHE_ALIAS is a shared backend: with a per-process cache, writes
+# of other workers and of management commands would never change the ETag.
+B2BROKER_ETAGS = None
+
+# Render wallet and transaction lists from ``values()`` rows instead of going
+# through the serializers. The output is identical, only cheaper to produce.
+B2BROKER_FAST_LIST = True
+
+# Report the SQL, render and total time of each request in a Server-Timing
+# response header. The same numbers are always collected for /metrics.
+B2BROKER_SERVER_TIMING = os.environ.get("B2BROKER_SERVER_TIMING") == "1"
+
+# Write POST /transactions/ rows in shared database transactions, flushed
+# every B2BROKER_GROUP_COMMIT_INTERVAL_MS milliseconds or as soon as
+# B2BROKER_GROUP_COMMIT_MAX_ROWS rows are queued. Only worth it with threaded
+# or ASGI workers, as batches only group requests served by one process.
+# Requests whose batch has not committed within
+# B2BROKER_GROUP_COMMIT_TIMEOUT seconds get a 503.
+B2BROKER_GROUP_COMMIT = os.environ.get("B2BROKER_GROUP_COMMIT") == "1"
+B2BROKER_GROUP_COMMIT_INTERVAL_MS = 5
+B2BROKER_GROUP_COMMIT_MAX_ROWS = 500
+B2BROKER_GROUP_COMMIT_TIMEOUT = 30
+
+# Seconds an idle transaction stream waits for a notification from this
+# process before sending a keep-alive comment and re-reading the database for
+# the transactions committed by other processes.
+B2BROKER_STREAM_POLL_SECONDS = 15
+
+# Where `manage.py publish_outbox` delivers the ledger change events, a
+# file:///, unix:/// or http(s):// URL, and how many it delivers per batch.
+B2BROKER_OUTBOX_SINK = os.environ.get("B2BROKER_OUTBOX_SINK")
+B2BROKER_OUTBOX_BATCH_SIZE = 500
+B2BROKER_OUTBOX_POLL_SECONDS = 1.0
@@ -0,0 +1,59 @@
+"""
+API-only production settings: the project settings without the parts only
+the browsable API and the admin need (sessions, messages, static files,
+templates, authentication), with DEBUG off and persistent database
+connections.
+
+Use with ``DJANGO_SETTINGS_MODULE=b2broker_test.settings_production`` and a
+``DJANGO_SECRET_KEY`` environment variable. ``python -m benchmarks.cold_start``
+compares its cold start and per-request cost with the default settings.
+"""
+
+import os
+
+from b2broker_test.settings import *  # noqa: F401,F403
+from b2broker_test.settings import DATABASES, REST_FRAMEWORK
+
+SECRET_KEY = os.environ["DJANGO_SECRET_KEY"]
+
+# Also stops Django from keeping every executed query in memory.
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get("DJANGO_ALLOWED_HOSTS", "*").split(",")
+
+INSTALLED_APPS = [
+    "rest_framework",
+    "rest_framework_json_api",
+    "django_filters",
+    "b2broker.apps.B2BrokerConfig",
+]
+
+MIDDLEWARE = [
+    "b2broker.metrics.MetricsMiddleware",
+    "b2broker.db_routers.ReplicaPinMiddleware",
+    "django.middleware.security.SecurityMiddleware",
+    # APPEND_SLASH redirects and DISALLOWED_USER_AGENTS, as in development.
+    "django.middleware.common.CommonMiddleware",
+]
+
+# Error pages fall back to Django's built-in ones.
+TEMPLATES = []
+
+# Reuse database connections across requests, checking them before use.
+for database in DATABASES.values():
+    database["CONN_MAX_AGE"] = int(os.environ.get("DJANGO_CONN_MAX_AGE", "600"))
+    database["CONN_HEALTH_CHECKS"] = True
+
+# No translation catalogs to load, all messages are in English.
+USE_I18N = False
+
+AUTH_PASSWORD_VALIDATORS = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    "DEFAULT_RENDERER_CLASSES": ("rest_framework_json_api.renderers.JSONRenderer",),
+    # The API has no users: skip authentication and the AnonymousUser import.
+    "DEFAULT_AUTHENTICATION_CLASSES": (),
+    "DEFAULT_PERMISSION_CLASSES": (),
+    "UNAUTHENTICATED_USER": None,
+}
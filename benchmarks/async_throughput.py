@@ -0,0 +1,74 @@
+"""
+Compare concurrent read throughput of the WSGI and ASGI deployments.
+
+Start both servers against the same database, e.g.::
+
+    python manage.py runserver 0.0.0.0:8000
+    uvicorn b2broker_test.asgi:application --port 8001
+
+and run::
+
+    python benchmarks/async_throughput.py \\
+        --wsgi http://localhost:8000 --asgi http://localhost:8001
+
+The WSGI server is driven through the DRF viewsets (``/wallets/1/``), the
+ASGI one through the async read path (``/async/wallets/1/``). Only the
+standard library is used on the client side.
+"""
+
+import argparse
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def fetch(url):
+    started = time.perf_counter()
+    with urllib.request.urlopen(url) as response:
+        response.read()
+        status = response.status
+    return status, time.perf_counter() - started
+
+
+def run(url, concurrency, requests):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        results = list(executor.map(fetch, [url] * requests))
+        elapsed = time.perf_counter() - started
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for status, _ in results if status != 200)
+    return {
+        "url": url,
+        "requests": requests,
+        "errors": errors,
+        "throughput": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--wsgi", default="http://localhost:8000")
+    parser.add_argument("--asgi", default="http://localhost:8001")
+    parser.add_argument("--path", default="/wallets/1/")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, url in (
+        ("wsgi", f"{args.wsgi}{args.path}"),
+        ("asgi", f"{args.asgi}/async{args.path}"),
+    ):
+        fetch(url)  # warm up
+        result = run(url, args.concurrency, args.requests)
+        print(
+            f"{name}: {result['throughput']:.1f} req/s, "
+            f"p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+            f"{result['errors']} errors ({result['url']})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Cold start and per-request overhead of two settings modules.
+
+Every run starts a fresh interpreter that measures:
+
+* ``import``: ``django.setup()``, the WSGI application (middleware chain)
+  and the URLconf,
+* ``first response``: the first ``GET /wallets/`` through the WSGI handler,
+* ``request``: the median of later ``GET /wallets/<id>/`` requests, and
+* ``middleware``: how much of it is spent outside the view, measured by
+  calling the view directly with the same request.
+
+By default the project settings are compared with the API-only production
+profile, both on the benchmark SQLite database::
+
+    python -m benchmarks.cold_start --runs 10
+
+Against the MySQL container::
+
+    python -m benchmarks.cold_start --baseline-settings b2broker_test.settings \\
+        --settings b2broker_test.settings_production
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+METRICS = ("import", "first response", "request", "middleware")
+
+
+def wsgi_environ(path):
+    from wsgiref.util import setup_testing_defaults
+
+    environ = {"PATH_INFO": path, "HTTP_ACCEPT": "application/vnd.api+json"}
+    setup_testing_defaults(environ)
+    return environ
+
+
+def call(application, path):
+    def start_response(status, headers, exc_info=None):
+        assert status.startswith("200"), status
+
+    body = application(wsgi_environ(path), start_response)
+    content = b"".join(body)
+    body.close()
+    return content
+
+
+def child(requests):
+    started = time.perf_counter()
+
+    import django
+    from django.core.wsgi import get_wsgi_application
+    from django.urls import resolve
+
+    django.setup()
+    application = get_wsgi_application()
+    resolve("/wallets/")
+    imported = time.perf_counter()
+
+    call(application, "/wallets/")
+    first_response = time.perf_counter()
+
+    from django.core.handlers.wsgi import WSGIRequest
+
+    from b2broker.models import Wallet
+
+    wallet = Wallet.objects.order_by("pk").first() or Wallet.objects.create(
+        label="cold_start"
+    )
+    path = f"/wallets/{wallet.pk}/"
+    match = resolve(path)
+    full, view_only = [], []
+    for _ in range(requests):
+        before = time.perf_counter()
+        call(application, path)
+        full.append(time.perf_counter() - before)
+
+        request = WSGIRequest(wsgi_environ(path))
+        before = time.perf_counter()
+        response = match.func(request, *match.args, **match.kwargs)
+        response.render()
+        view_only.append(time.perf_counter() - before)
+
+    request_time = statistics.median(full)
+    return {
+        "import": imported - started,
+        "first response": first_response - imported,
+        "request": request_time,
+        "middleware": request_time - statistics.median(view_only),
+    }
+
+
+def run(settings, requests):
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings}
+    env.setdefault("DJANGO_SECRET_KEY", "cold-start-benchmark")
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.cold_start", "--child", str(requests)],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def migrate(settings):
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings}
+    env.setdefault("DJANGO_SECRET_KEY", "cold-start-benchmark")
+    subprocess.run(
+        [sys.executable, "manage.py", "migrate", "--verbosity", "0"],
+        env=env,
+        check=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--baseline-settings", default="benchmarks.settings")
+    parser.add_argument("--settings", default="benchmarks.settings_production")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh processes.")
+    parser.add_argument(
+        "--requests", type=int, default=200, help="Timed requests per process."
+    )
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(child(args.child)))
+        return
+
+    modules = (args.baseline_settings, args.settings)
+    for settings in modules:
+        migrate(settings)
+    results = {settings: {metric: [] for metric in METRICS} for settings in modules}
+    # Interleave the runs so that both profiles see the same machine state.
+    for _ in range(args.runs):
+        for settings in modules:
+            for metric, value in run(settings, args.requests).items():
+                results[settings][metric].append(value)
+
+    baseline, profile = (
+        {metric: statistics.median(values) for metric, values in result.items()}
+        for result in results.values()
+    )
+    print(f"{'':16} {args.baseline_settings:>32} {args.settings:>32}")
+    for metric in METRICS:
+        change = (profile[metric] - baseline[metric]) / baseline[metric]
+        print(
+            f"{metric:16} {baseline[metric] * 1000:30.3f}ms "
+            f"{profile[metric] * 1000:30.3f}ms  {change:+7.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare list rendering throughput of the serializer path and the
+``values()`` fast path (``B2BROKER_FAST_LIST``).
+
+Runs in process against a throwaway test database created from the
+configured settings, e.g.::
+
+    python benchmarks/list_serialization.py --transactions 20000
+
+Each case requests the same list page repeatedly through the Django test
+client with the fast path off and on, and reports rows rendered per second.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "b2broker_test.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from b2broker.models import Transaction, Wallet  # noqa: E402
+
+CASES = (
+    "/transactions/?page[size]=100",
+    "/transactions/?page[cursor]=&page[size]=100",
+    "/transactions/?filter[wallet]=1&page[size]=100",
+    "/wallets/?page[size]=100",
+)
+
+
+def seed(wallets, transactions):
+    Wallet.objects.bulk_create(Wallet(label=f"wallet_{i}") for i in range(wallets))
+    wallet_ids = list(Wallet.objects.values_list("id", flat=True))
+    Transaction.objects.bulk_create(
+        (
+            Transaction(
+                wallet_id=wallet_ids[i % len(wallet_ids)],
+                txid=f"tx_{i}",
+                amount=f"{i % 1000}.{i:018d}"[:30],
+            )
+            for i in range(transactions)
+        ),
+        batch_size=2000,
+    )
+    Wallet.objects.rebuild_balances()
+
+
+def measure(client, url, repeat):
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.content
+        rows = len(response.json()["data"])
+    return rows, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--wallets", type=int, default=100)
+    parser.add_argument("--transactions", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        seed(args.wallets, args.transactions)
+        # Keep the response cache out of the measurement.
+        with override_settings(B2BROKER_RESPONSE_CACHE=False):
+            client = Client()
+            for url in CASES:
+                results = {}
+                for fast in (False, True):
+                    with override_settings(B2BROKER_FAST_LIST=fast):
+                        measure(client, url, 5)
+                        rows, timings = measure(client, url, args.repeat)
+                    results[fast] = rows / statistics.median(timings)
+                print(
+                    f"{url:50} serializer {results[False]:10.0f} rows/s  "
+                    f"fast {results[True]:10.0f} rows/s  "
+                    f"x{results[True] / results[False]:.2f}"
+                )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
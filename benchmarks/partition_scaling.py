@@ -0,0 +1,138 @@
+"""
+Show how per-wallet queries scale with the total size of the transaction
+table, with and without the hash partitioned layout.
+
+A probe wallet keeps a fixed number of transactions while filler wallets
+grow the table step by step; at each size the per-wallet reads are timed::
+
+    python -m benchmarks.partition_scaling --steps 100000 1000000 5000000
+    python -m benchmarks.partition_scaling --partitions 16 ...
+
+``--partitions`` needs MySQL; without it the plain layout is measured, which
+also works on SQLite (``--settings benchmarks.settings``).
+"""
+
+import argparse
+import os
+import time
+
+from benchmarks.suite import percentile
+
+
+def grow(total, current, wallet_ids):
+    from b2broker.models import Transaction
+
+    batch = []
+    for i in range(current, total):
+        batch.append(
+            Transaction(
+                wallet_id=wallet_ids[i % len(wallet_ids)],
+                txid=f"filler_{i}",
+                amount="1.5",
+            )
+        )
+        if len(batch) == 5000:
+            Transaction.objects.bulk_create(batch)
+            batch = []
+    Transaction.objects.bulk_create(batch)
+
+
+def measure(client, probe, iterations):
+    from django.db.models import Sum
+
+    from b2broker.models import Transaction, Wallet
+
+    reads = {
+        "filter[wallet] page": lambda: client.get(
+            f"/transactions/?filter[wallet]={probe}&page[size]=100"
+        ),
+        "filter[wallet] last page": lambda: client.get(
+            f"/transactions/?filter[wallet]={probe}&page[size]=100&page[number]=last"
+        ),
+        "ledger sum": lambda: Transaction.objects.filter(wallet_id=probe).aggregate(
+            Sum("amount")
+        ),
+        "ledger balance": lambda: Wallet.objects.get(pk=probe).ledger_balance,
+    }
+    results = {}
+    for name, read in reads.items():
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            read()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        results[name] = (percentile(timings, 50), percentile(timings, 95))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--settings", help="Django settings module to use.")
+    parser.add_argument(
+        "--steps",
+        type=int,
+        nargs="+",
+        default=[10000, 100000, 1000000],
+        help="Total table sizes to measure at.",
+    )
+    parser.add_argument("--probe-rows", type=int, default=1000)
+    parser.add_argument("--filler-wallets", type=int, default=1000)
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=0,
+        help="Hash partition the table into this many partitions (MySQL).",
+    )
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.settings:
+        os.environ["DJANGO_SETTINGS_MODULE"] = args.settings
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "b2broker_test.settings")
+
+    import django
+
+    django.setup()
+
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import setup_test_environment
+
+    from b2broker import partitioning
+    from b2broker.models import Transaction, Wallet
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        if args.partitions:
+            partitioning.partition(args.partitions)
+        probe = Wallet.objects.create(label="probe").pk
+        Transaction.objects.bulk_create(
+            Transaction(wallet_id=probe, txid=f"probe_{i}", amount="1.5")
+            for i in range(args.probe_rows)
+        )
+        Wallet.objects.bulk_create(
+            Wallet(label=f"filler_{i}") for i in range(args.filler_wallets)
+        )
+        filler = list(
+            Wallet.objects.exclude(pk=probe).order_by("pk").values_list("pk", flat=True)
+        )
+        size = args.probe_rows
+        client = Client()
+        layout = f"{args.partitions} partitions" if args.partitions else "plain"
+        with override_settings(B2BROKER_RESPONSE_CACHE=False):
+            for step in sorted(args.steps):
+                grow(step, size, filler)
+                size = max(step, size)
+                for name, (p50, p95) in measure(client, probe, args.iterations).items():
+                    print(
+                        f"{layout:14} {size:>11} rows  {name:26} "
+                        f"p50 {p50 * 1000:8.2f}ms  p95 {p95 * 1000:8.2f}ms"
+                    )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""
+Settings for running the benchmarks without the MySQL container: the project
+settings on top of a file based SQLite database, so that the in-process and
+HTTP runs (which serve from another thread) see the same data.
+"""
+
+from b2broker_test.settings import *  # noqa: F401,F403
+from b2broker_test.settings import BASE_DIR
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "benchmarks" / "bench.sqlite3",
+        "TEST": {"NAME": BASE_DIR / "benchmarks" / "test_bench.sqlite3"},
+    }
+}
+
+B2BROKER_RESPONSE_CACHE = False
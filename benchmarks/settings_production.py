@@ -0,0 +1,14 @@
+"""
+The API-only production settings on the benchmark SQLite database, to compare
+with ``benchmarks.settings`` without the MySQL container.
+"""
+
+from b2broker_test.settings_production import *  # noqa: F401,F403
+from benchmarks.settings import DATABASES as BENCHMARK_DATABASES
+
+DATABASES = {
+    alias: {**database, "CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True}
+    for alias, database in BENCHMARK_DATABASES.items()
+}
+
+B2BROKER_RESPONSE_CACHE = False
@@ -0,0 +1,486 @@
+"""
+Latency, throughput and query count benchmarks of the wallet and transaction
+endpoints.
+
+Seeds a throwaway test database with one of the data shapes below, then
+drives every ``WalletViewSet`` and ``TransactionViewSet`` action in process
+(through the Django test client, counting SQL queries) and over HTTP
+(through a live server thread). Against the MySQL container::
+
+    python -m benchmarks.suite --shape hot-wallets --scale 0.1
+
+or without any network, on SQLite::
+
+    python -m benchmarks.suite --settings benchmarks.settings
+
+Results are written as JSON. ``--update-baseline`` stores them as the
+baseline, later runs given ``--baseline`` exit with status 1 when a case
+runs more queries or its p95 latency grew beyond ``--tolerance``.
+"""
+
+import argparse
+import datetime
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import sys
+import time
+import urllib.error
+import urllib.request
+
+SHAPES = {
+    # Lots of small wallets: list endpoints and per-wallet lookups.
+    "many-wallets": {"wallets": 10000, "transactions": 50000},
+    # A few huge wallets: per-wallet filters, history and exports.
+    "hot-wallets": {"wallets": 3, "transactions": 1000000},
+}
+
+JSON_API = "application/vnd.api+json"
+
+# Makes txids and labels unique across iterations and modes.
+sequence = itertools.count()
+
+
+def transaction_payload(wallet_id, txid, amount="1.5"):
+    return {
+        "type": "transactions",
+        "attributes": {"txid": txid, "amount": amount},
+        "relationships": {"wallet": {"data": {"type": "wallets", "id": wallet_id}}},
+    }
+
+
+class Case:
+    """
+    One benchmarked request. ``prepare`` runs untimed before each request and
+    returns the ``(path, body)`` to send.
+    """
+
+    def __init__(self, name, method, prepare, status=200, content_type=JSON_API):
+        self.name = name
+        self.method = method
+        self.prepare = prepare
+        self.status = status
+        self.content_type = content_type
+
+
+def new_wallet(ctx):
+    from b2broker.models import Wallet
+
+    return Wallet.objects.create(label=f"bench_{next(sequence)}").pk
+
+
+def new_transaction(ctx):
+    from b2broker.models import Transaction
+
+    return Transaction.objects.create(
+        wallet_id=ctx["wallet"], txid=f"bench_{next(sequence)}", amount="1.5"
+    ).pk
+
+
+def bulk_body(ctx):
+    return {
+        "data": [
+            transaction_payload(str(ctx["wallet"]), f"bench_{next(sequence)}")
+            for _ in range(100)
+        ]
+    }
+
+
+CASES = (
+    Case("wallets.list", "GET", lambda ctx: ("/wallets/", None)),
+    Case(
+        "wallets.list.cursor",
+        "GET",
+        lambda ctx: ("/wallets/?page[cursor]=&page[size]=100", None),
+    ),
+    Case("wallets.retrieve", "GET", lambda ctx: (f"/wallets/{ctx['wallet']}/", None)),
+    Case(
+        "wallets.history",
+        "GET",
+        lambda ctx: (f"/wallets/{ctx['wallet']}/history/?interval=month", None),
+    ),
+    Case("wallets.balances", "GET", lambda ctx: ("/wallets/balances.csv", None)),
+    Case(
+        "wallets.balances.ids",
+        "POST",
+        lambda ctx: (
+            "/wallets/balances/",
+            {"data": [{"type": "wallets", "id": str(pk)} for pk in ctx["balance_ids"]]},
+        ),
+    ),
+    Case(
+        "wallets.create",
+        "POST",
+        lambda ctx: (
+            "/wallets/",
+            {"data": {"type": "wallets", "attributes": {"label": "bench"}}},
+        ),
+        status=201,
+    ),
+    Case(
+        "wallets.partial_update",
+        "PATCH",
+        lambda ctx: (
+            f"/wallets/{ctx['wallet']}/",
+            {
+                "data": {
+                    "type": "wallets",
+                    "id": str(ctx["wallet"]),
+                    "attributes": {"label": f"bench_{next(sequence)}"},
+                }
+            },
+        ),
+    ),
+    Case(
+        "wallets.destroy",
+        "DELETE",
+        lambda ctx: (f"/wallets/{new_wallet(ctx)}/", None),
+        status=204,
+    ),
+    Case("transactions.list", "GET", lambda ctx: ("/transactions/", None)),
+    Case(
+        "transactions.list.wallet",
+        "GET",
+        lambda ctx: (
+            f"/transactions/?filter[wallet]={ctx['wallet']}&page[size]=100",
+            None,
+        ),
+    ),
+    Case(
+        "transactions.list.deep_page",
+        "GET",
+        lambda ctx: (f"/transactions/?page[number]={ctx['last_page']}", None),
+    ),
+    Case(
+        "transactions.list.cursor",
+        "GET",
+        lambda ctx: ("/transactions/?page[cursor]=&page[size]=100", None),
+    ),
+    Case(
+        "transactions.retrieve",
+        "GET",
+        lambda ctx: (f"/transactions/{ctx['transaction']}/", None),
+    ),
+    Case(
+        "transactions.create",
+        "POST",
+        lambda ctx: (
+            "/transactions/",
+            {
+                "data": transaction_payload(
+                    str(ctx["wallet"]), f"bench_{next(sequence)}"
+                )
+            },
+        ),
+        status=201,
+    ),
+    Case(
+        "transactions.partial_update",
+        "PATCH",
+        lambda ctx: (
+            f"/transactions/{ctx['transaction']}/",
+            {
+                "data": {
+                    "type": "transactions",
+                    "id": str(ctx["transaction"]),
+                    "attributes": {"amount": "2.5"},
+                }
+            },
+        ),
+    ),
+    Case(
+        "transactions.destroy",
+        "DELETE",
+        lambda ctx: (f"/transactions/{new_transaction(ctx)}/", None),
+        status=204,
+    ),
+    Case(
+        "transactions.bulk", "POST", lambda ctx: ("/transactions/bulk/", bulk_body(ctx))
+    ),
+    Case(
+        "transactions.export",
+        "GET",
+        lambda ctx: (
+            f"/transactions/export.csv?filter[wallet]={ctx['small_wallet']}",
+            None,
+        ),
+    ),
+)
+
+
+def seed(wallets, transactions):
+    """
+    Bulk insert the shape, spreading the transactions over the wallets and
+    the last year, then build the derived balances, rollups and checkpoints.
+    """
+    from django.core.management import call_command
+    from django.utils import timezone
+
+    from b2broker.models import Transaction, Wallet
+
+    Wallet.objects.bulk_create(
+        (Wallet(label=f"wallet_{i}") for i in range(wallets)), batch_size=2000
+    )
+    wallet_ids = list(Wallet.objects.order_by("pk").values_list("pk", flat=True))
+    now = timezone.now()
+    step = datetime.timedelta(days=365) / max(transactions, 1)
+    batch = []
+    for i in range(transactions):
+        batch.append(
+            Transaction(
+                wallet_id=wallet_ids[i % len(wallet_ids)],
+                txid=f"seed_{i}",
+                amount=f"{(i % 2001) - 1000}.{i % 1000000:06d}",
+                created_at=now - step * (transactions - i),
+            )
+        )
+        if len(batch) == 5000:
+            Transaction.objects.bulk_create(batch)
+            batch = []
+    Transaction.objects.bulk_create(batch)
+    call_command("rebuild_balances", stdout=io.StringIO())
+    call_command("advance_balance_checkpoints", stdout=io.StringIO())
+
+    # The wallet with the fewest transactions keeps exports short.
+    return {
+        "wallet": wallet_ids[0],
+        "small_wallet": wallet_ids[-1],
+        "transaction": Transaction.objects.order_by("pk")
+        .values_list("pk", flat=True)
+        .first(),
+        "last_page": max(math.ceil(transactions / 10), 1),
+        "balance_ids": wallet_ids[:1000],
+    }
+
+
+def percentile(sorted_values, p):
+    # Nearest rank.
+    index = max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+def summarize(timings, queries, errors):
+    timings = sorted(timings)
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        "throughput": round(len(timings) / sum(timings), 1),
+        "queries": queries,
+    }
+
+
+def run_in_process(case, ctx, iterations, warmup):
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    client = Client()
+    timings, queries, errors = [], None, 0
+    for i in range(warmup + iterations):
+        path, body = case.prepare(ctx)
+        kwargs = {}
+        if body is not None:
+            kwargs = {"data": json.dumps(body), "content_type": case.content_type}
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.generic(case.method, path, **kwargs)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        if i < warmup:
+            continue
+        timings.append(elapsed)
+        errors += response.status_code != case.status
+        # Report the worst case, e.g. a cache miss rather than a hit.
+        queries = max(queries or 0, len(captured))
+    return summarize(timings, queries, errors)
+
+
+def run_http(case, ctx, iterations, warmup, base_url):
+    timings, errors = [], 0
+    for i in range(warmup + iterations):
+        path, body = case.prepare(ctx)
+        request = urllib.request.Request(
+            base_url + path,
+            method=case.method,
+            data=None if body is None else json.dumps(body).encode(),
+            headers={"Content-Type": case.content_type},
+        )
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            status = exc.code
+        elapsed = time.perf_counter() - started
+        if i < warmup:
+            continue
+        timings.append(elapsed)
+        errors += status != case.status
+    return summarize(timings, None, errors)
+
+
+def start_live_server():
+    from django.test.testcases import LiveServerThread, _StaticFilesHandler
+
+    server = LiveServerThread("localhost", _StaticFilesHandler, port=0)
+    server.daemon = True
+    server.start()
+    server.is_ready.wait()
+    if server.error:
+        raise server.error
+    return server
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return one message per case that regressed against ``baseline``.
+    """
+    regressions = []
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        if (
+            result["queries"] is not None
+            and expected["queries"] is not None
+            and result["queries"] > expected["queries"]
+        ):
+            regressions.append(
+                f"{key}: {result['queries']} queries, baseline {expected['queries']}"
+            )
+        if result["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{key}: p95 {result['p95_ms']}ms, baseline {expected['p95_ms']}ms"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--settings", help="Django settings module to use.")
+    parser.add_argument("--shape", choices=SHAPES, default="many-wallets")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiply the number of wallets and transactions of the shape.",
+    )
+    parser.add_argument("--mode", choices=("inprocess", "http", "both"), default="both")
+    parser.add_argument(
+        "--case", action="append", dest="cases", help="Only run these cases."
+    )
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--output", default="benchmarks/results/latest.json")
+    parser.add_argument("--baseline", help="Compare against this results file.")
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Write the results to --baseline instead of comparing.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative p95 latency growth over the baseline.",
+    )
+    args = parser.parse_args()
+
+    if args.settings:
+        os.environ["DJANGO_SETTINGS_MODULE"] = args.settings
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "b2broker_test.settings")
+
+    import django
+
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    shape = SHAPES[args.shape]
+    wallets = max(int(shape["wallets"] * args.scale), 1)
+    transactions = int(shape["transactions"] * args.scale)
+    cases = [case for case in CASES if not args.cases or case.name in args.cases]
+    modes = ("inprocess", "http") if args.mode == "both" else (args.mode,)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    server = None
+    try:
+        started = time.perf_counter()
+        ctx = seed(wallets, transactions)
+        print(
+            f"Seeded {wallets} wallets and {transactions} transactions "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        results = {}
+        for mode in modes:
+            if mode == "http":
+                server = start_live_server()
+                base_url = f"http://{server.host}:{server.port}"
+            for case in cases:
+                if mode == "http":
+                    result = run_http(case, ctx, args.iterations, args.warmup, base_url)
+                else:
+                    result = run_in_process(case, ctx, args.iterations, args.warmup)
+                results[f"{mode}:{case.name}"] = result
+                print(
+                    f"{mode:10} {case.name:30} p50 {result['p50_ms']:9.2f}ms  "
+                    f"p95 {result['p95_ms']:9.2f}ms  p99 {result['p99_ms']:9.2f}ms  "
+                    f"{result['throughput']:8.1f} req/s  "
+                    f"queries {result['queries'] if result['queries'] is not None else '-':>3}  "
+                    f"errors {result['errors']}"
+                )
+    finally:
+        if server is not None:
+            server.terminate()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    document = {
+        "meta": {
+            "shape": args.shape,
+            "wallets": wallets,
+            "transactions": transactions,
+            "iterations": args.iterations,
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "date": datetime.datetime.now(datetime.UTC).isoformat(),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as output:
+        json.dump(document, output, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(document, output, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as baseline:
+            baseline = json.load(baseline)
+        if baseline["meta"]["shape"] != args.shape:
+            sys.exit(f"Baseline was recorded for the {baseline['meta']['shape']} shape")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+    if any(result["errors"] for result in results.values()):
+        sys.exit("Some requests did not return the expected status.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import pytest
+from django.core.cache import caches
+from django.db import connections
+
+
+@pytest.fixture(scope="session")
+def django_db_modify_db_settings(django_db_modify_db_settings_parallel_suffix):
+    """
+    Add a ``replica`` database alias mirroring the default one, for the read
+    replica routing tests.
+    """
+    default = connections.settings["default"]
+    connections.settings["replica"] = {
+        **default,
+        "TEST": {**default["TEST"], "MIRROR": "default"},
+    }
+
+
+@pytest.fixture
+def shared_cache(settings, tmp_path):
+    """
+    Point the response cache and ETags at a cache shared between processes.
+    """
+    settings.CACHES = {
+        **settings.CACHES,
+        "shared": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": str(tmp_path / "cache"),
+        },
+    }
+    settings.B2BROKER_CACHE_ALIAS = "shared"
+    return caches["shared"]
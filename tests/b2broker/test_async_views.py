@@ -0,0 +1,101 @@
+import pytest
+
+from b2broker.models import Wallet, Transaction
+
+
+@pytest.fixture
+def ledger(db):
+    w = Wallet.objects.create(label="test_wallet")
+    w2 = Wallet.objects.create(label="test_wallet2  ")
+    for i in range(1, 13):
+        Transaction.objects.create(
+            wallet=w if i % 3 else w2,
+            txid=f"transaction_{i}",
+            amount=f"{i}.5",
+        )
+    return w, w2
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/wallets/1/",
+        "/wallets/2/",
+        "/wallets/3/",
+        "/transactions/1/",
+        "/transactions/100/",
+        "/wallets/1/?filter[nope]=1",
+        "/wallets/1/?filter[label]=test_wallet2",
+        "/transactions/1/?sort=nope",
+    ],
+)
+def test_async_detail_matches_sync(client, ledger, url):
+    sync_response = client.get(url)
+    async_response = client.get(f"/async{url}")
+    assert async_response.status_code == sync_response.status_code
+    assert async_response["Content-Type"] == sync_response["Content-Type"]
+    assert async_response.content == sync_response.content
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/wallets/",
+        "/wallets/?filter[label]=test_wallet",
+        "/wallets/?sort=-label",
+        "/transactions/",
+        "/transactions/?filter[wallet]=2",
+        "/transactions/?sort=-amount&page[size]=5&page[number]=2",
+        "/transactions/?page[number]=3",
+        "/transactions/?page[number]=9",
+        "/transactions/?filter[wallet]=abc",
+        "/transactions/?filter[wallet]=99",
+        "/transactions/?filter[id]=abc",
+        "/transactions/?unknown=1",
+        "/transactions/?sort=nope",
+        "/wallets/?filter[nope]=1",
+        "/wallets/?filter[label.gte]=x",
+        "/wallets/?filter[label]=",
+        "/wallets/?filter[balance.gte]=20",
+        "/wallets/?filter[balance.lt]=20&sort=-balance",
+        "/wallets/?filter[balance.lt]=x",
+        "/transactions/?filter[amount]=1",
+    ],
+)
+def test_async_list_matches_sync(client, ledger, url):
+    sync_response = client.get(url)
+    async_response = client.get(f"/async{url}")
+    assert async_response.status_code == sync_response.status_code
+    assert async_response["Content-Type"] == sync_response["Content-Type"]
+    # Pagination links point at the endpoint that served the request.
+    assert async_response.content == sync_response.content.replace(
+        b"http://testserver/wallets/?", b"http://testserver/async/wallets/?"
+    ).replace(
+        b"http://testserver/transactions/?", b"http://testserver/async/transactions/?"
+    )
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_async_views_are_read_only(client, ledger):
+    response = client.post("/async/wallets/", {"label": "new"})
+    assert response.status_code == 405
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/async/wallets/?include=transactions",
+        "/async/wallets/?fields[wallets]=label",
+        "/async/wallets/1/?include=transactions",
+        "/async/transactions/1/?fields[transactions]=txid",
+    ],
+)
+def test_async_views_reject_unsupported_parameters(client, ledger, url):
+    response = client.get(url)
+    assert response.status_code == 400
+    assert "not supported by the async endpoints" in (
+        response.json()["errors"][0]["detail"]
+    )
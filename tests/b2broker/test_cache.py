@@ -0,0 +1,111 @@
+import pytest
+
+from b2broker import cache as response_cache
+from b2broker.models import Wallet, Transaction
+
+
+@pytest.fixture
+def cached_reads(settings, shared_cache):
+    settings.B2BROKER_RESPONSE_CACHE = True
+    response_cache.stats.reset()
+    return response_cache.stats
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_retrieve_is_cached(client, cached_reads, django_assert_num_queries):
+    Wallet.objects.create(label="test_wallet")
+    response = client.get("/wallets/1/")
+    assert response.status_code == 200
+    assert cached_reads.misses == 1
+
+    with django_assert_num_queries(0):
+        cached = client.get("/wallets/1/")
+    assert cached.status_code == 200
+    assert cached.content == response.content
+    for header in ("Content-Type", "Vary", "Allow"):
+        assert cached[header] == response[header]
+    assert cached_reads.hits == 1
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_cache_is_invalidated_by_transaction_writes(client, cached_reads):
+    w = Wallet.objects.create(label="test_wallet")
+    Wallet.objects.create(label="test_wallet2")
+    client.get("/wallets/1/")
+    client.get("/wallets/2/")
+    client.get("/transactions/?filter[wallet]=1")
+
+    t = Transaction.objects.create(wallet=w, txid="123", amount=10)
+    response = client.get("/wallets/1/")
+    assert response.json()["data"]["attributes"]["balance"] == "10.000000000000000000"
+    response = client.get("/transactions/?filter[wallet]=1")
+    assert len(response.json()["data"]) == 1
+    client.get("/wallets/2/")
+    assert cached_reads.hits == 1
+    assert cached_reads.misses == 5
+
+    t.delete()
+    response = client.get("/wallets/1/")
+    assert response.json()["data"]["attributes"]["balance"] == "0.0"
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_retrieve_cache_is_invalidated_by_update(client, cached_reads):
+    w = Wallet.objects.create(label="test_wallet")
+    w2 = Wallet.objects.create(label="test_wallet2")
+    t = Transaction.objects.create(wallet=w, txid="123", amount=10)
+    client.get("/transactions/1/")
+    client.get("/wallets/2/")
+
+    t.wallet = w2
+    t.save()
+    response = client.get("/transactions/1/")
+    assert response.json()["data"]["relationships"]["wallet"]["data"]["id"] == "2"
+    response = client.get("/wallets/2/")
+    assert response.json()["data"]["attributes"]["balance"] == "10.000000000000000000"
+    assert cached_reads.hits == 0
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_retrieve_cache_is_invalidated_by_wallet_delete(
+    client, cached_reads
+):
+    w = Wallet.objects.create(label="test_wallet")
+    Transaction.objects.create(wallet=w, txid="123", amount=10)
+    assert client.get("/transactions/1/").status_code == 200
+
+    w.delete()
+    assert client.get("/transactions/1/").status_code == 404
+    assert cached_reads.hits == 0
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_cache_needs_a_shared_backend(client, settings):
+    settings.B2BROKER_RESPONSE_CACHE = True
+    response_cache.stats.reset()
+    Wallet.objects.create(label="test_wallet")
+    client.get("/wallets/1/")
+    assert response_cache.stats.misses == 0
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_cache_is_disabled_by_default(client):
+    response_cache.stats.reset()
+    Wallet.objects.create(label="test_wallet")
+    client.get("/wallets/1/")
+    client.get("/wallets/1/")
+    assert response_cache.stats.hits == 0
+    assert response_cache.stats.misses == 0
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_retrieve_cache_covers_included_wallet(client, cached_reads):
+    w = Wallet.objects.create(label="test_wallet")
+    Transaction.objects.create(wallet=w, txid="123", amount=10)
+    client.get("/transactions/1/?include=wallet")
+
+    w.label = "renamed"
+    w.save()
+    response = client.get("/transactions/1/?include=wallet")
+    assert response.json()["included"][0]["attributes"]["label"] == "renamed"
+    assert cached_reads.hits == 0
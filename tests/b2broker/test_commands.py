@@ -0,0 +1,188 @@
+import io
+import os
+from decimal import Decimal
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+
+from b2broker import imports
+from b2broker.export import csv_lines, ndjson_lines
+from b2broker.models import BalanceCheckpoint, Wallet, WalletDailyRollup, Transaction
+
+
+@pytest.mark.django_db
+def test_rebuild_balances():
+    wallet = Wallet.objects.create(label="me")
+    empty_wallet = Wallet.objects.create(label="empty")
+    Transaction.objects.create(wallet=wallet, amount=10, txid="123")
+    Transaction.objects.create(wallet=wallet, amount=5, txid="124")
+    Wallet.objects.update(balance=42)
+
+    call_command("rebuild_balances")
+
+    assert Wallet.objects.get(pk=wallet.pk).balance == 15
+    assert Wallet.objects.get(pk=empty_wallet.pk).balance == 0
+
+
+@pytest.mark.django_db
+def test_rebuild_balances_for_single_wallet():
+    wallet = Wallet.objects.create(label="me")
+    other_wallet = Wallet.objects.create(label="other")
+    Transaction.objects.create(wallet=wallet, amount=10, txid="123")
+    Wallet.objects.update(balance=42)
+
+    call_command("rebuild_balances", wallet=[wallet.pk])
+
+    assert Wallet.objects.get(pk=wallet.pk).balance == 10
+    assert Wallet.objects.get(pk=other_wallet.pk).balance == 42
+
+
+@pytest.mark.django_db
+def test_advance_balance_checkpoints():
+    wallet = Wallet.objects.create(label="me")
+    empty_wallet = Wallet.objects.create(label="empty")
+    Transaction.objects.create(wallet=wallet, amount=10, txid="123")
+    last = Transaction.objects.create(wallet=wallet, amount=5, txid="124")
+
+    call_command("advance_balance_checkpoints")
+
+    checkpoint = BalanceCheckpoint.objects.get(wallet=wallet)
+    assert checkpoint.last_transaction_id == last.pk
+    assert checkpoint.balance == 15
+    checkpoint = BalanceCheckpoint.objects.get(wallet=empty_wallet)
+    assert checkpoint.last_transaction_id == 0
+    assert checkpoint.balance == 0
+
+    last = Transaction.objects.create(wallet=wallet, amount=-3, txid="125")
+    call_command("advance_balance_checkpoints", wallet=[wallet.pk])
+
+    checkpoint = BalanceCheckpoint.objects.get(wallet=wallet)
+    assert checkpoint.last_transaction_id == last.pk
+    assert checkpoint.balance == 12
+
+
+@pytest.mark.django_db
+def test_reconcile_balances():
+    wallet = Wallet.objects.create(label="me")
+    other_wallet = Wallet.objects.create(label="other")
+    Transaction.objects.create(wallet=wallet, amount=10, txid="123")
+    Transaction.objects.create(wallet=other_wallet, amount=1, txid="124")
+    BalanceCheckpoint.advance(wallet.pk)
+    Transaction.objects.create(wallet=wallet, amount=5, txid="125")
+    out = io.StringIO()
+    call_command("reconcile_balances", stdout=out)
+    assert "All wallet balances match the ledger." in out.getvalue()
+
+    Wallet.objects.filter(pk=wallet.pk).update(balance=42)
+    out = io.StringIO()
+    with pytest.raises(CommandError, match="1 wallet balance"):
+        call_command("reconcile_balances", stdout=out)
+    assert out.getvalue().startswith(
+        f"Wallet {wallet.pk}: stored balance 42.000000000000000000, ledger balance "
+        "15.000000000000000000."
+    )
+    call_command("reconcile_balances", wallet=[other_wallet.pk], stdout=io.StringIO())
+
+    out = io.StringIO()
+    call_command("reconcile_balances", fix=True, stdout=out)
+    assert "Rebuilt 1 wallet balance(s)." in out.getvalue()
+    assert Wallet.objects.get(pk=wallet.pk).balance == 15
+
+
+def write_lines(path, lines):
+    path.write_text("".join(lines), encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("format", ["csv", "ndjson"])
+def test_import_transactions(tmp_path, format):
+    wallet = Wallet.objects.create(label="me")
+    other_wallet = Wallet.objects.create(label="other")
+    Transaction.objects.create(wallet=wallet, amount=10, txid="existing")
+    rows = [
+        (1, wallet.pk, "existing", Decimal("10")),
+        (2, wallet.pk, "t1", Decimal("1.5")),
+        (3, other_wallet.pk, "t2", Decimal("-0.000000000000000001")),
+        (4, other_wallet.pk, "t1", Decimal("7")),
+        (5, 99, "t3", Decimal("1")),
+    ]
+    lines = list(csv_lines(rows) if format == "csv" else ndjson_lines(rows))
+    path = write_lines(tmp_path / f"ledger.{format}", lines + ["garbage\n"])
+    stdout, stderr = io.StringIO(), io.StringIO()
+
+    call_command(
+        "import_transactions", path, chunk_size=2, stdout=stdout, stderr=stderr
+    )
+
+    assert Transaction.objects.count() == 3
+    assert Wallet.objects.get(pk=wallet.pk).balance == Decimal("11.5")
+    assert Wallet.objects.get(pk=other_wallet.pk).balance == Decimal(
+        "-0.000000000000000001"
+    )
+    assert WalletDailyRollup.objects.get(wallet=wallet).credit_count == 2
+    output = stdout.getvalue()
+    assert "Imported 2 transaction(s) into 2 wallet(s)" in output
+    assert "2 duplicate txid(s), 1 unknown wallet(s) and 1 invalid record(s)" in output
+    assert "unknown wallet 99" in stderr.getvalue()
+    assert not os.path.exists(f"{path}.progress.0")
+
+
+@pytest.mark.django_db
+def test_import_transactions_resumes(tmp_path):
+    wallet = Wallet.objects.create(label="me")
+    rows = [(i, wallet.pk, f"t{i}", Decimal(i)) for i in range(1, 6)]
+    path = write_lines(tmp_path / "ledger.ndjson", ndjson_lines(rows))
+    imports.save_progress(f"{path}.progress", 0, 1, 2)
+    stdout = io.StringIO()
+
+    call_command("import_transactions", path, stdout=stdout)
+
+    assert sorted(Transaction.objects.values_list("txid", flat=True)) == [
+        "t3",
+        "t4",
+        "t5",
+    ]
+    assert Wallet.objects.get().balance == 12
+    assert "Resumed after 2 record(s)" in stdout.getvalue()
+
+    imports.save_progress(f"{path}.progress", 0, 2, 2)
+    with pytest.raises(CommandError, match="same number"):
+        call_command("import_transactions", path, stdout=stdout)
+
+
+@pytest.mark.django_db
+def test_import_transactions_splits_wallets_between_workers(tmp_path):
+    wallets = [Wallet.objects.create(label=f"wallet_{i}") for i in range(4)]
+    rows = [(i, wallets[i % 4].pk, f"t{i}", Decimal(i)) for i in range(1, 41)]
+    path = write_lines(tmp_path / "ledger.csv", csv_lines(rows))
+
+    for worker in range(2):
+        result = imports.import_share(path, "csv", worker=worker, workers=2)
+        assert result.read == result.imported == 20
+        assert result.wallets == 2
+        assert set(Transaction.objects.values_list("wallet_id", flat=True)) == {
+            wallet.pk for wallet in wallets if wallet.pk % 2 <= worker
+        }
+
+    for wallet in wallets:
+        wallet.refresh_from_db()
+        assert wallet.balance == sum(
+            amount for _, wallet_id, _, amount in rows if wallet_id == wallet.pk
+        )
+
+
+@pytest.mark.skipif(
+    connection.vendor == "sqlite", reason="SQLite does not allow concurrent writers"
+)
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_import_transactions_in_parallel(tmp_path):
+    wallets = [Wallet.objects.create(label=f"wallet_{i}") for i in range(4)]
+    rows = [(i, wallets[i % 4].pk, f"t{i}", Decimal(i)) for i in range(1, 41)]
+    path = write_lines(tmp_path / "ledger.csv", csv_lines(rows))
+
+    call_command("import_transactions", path, workers=2, stdout=io.StringIO())
+
+    assert Transaction.objects.count() == 40
+    assert Wallet.objects.get(pk=wallets[0].pk).balance == sum(range(4, 41, 4))
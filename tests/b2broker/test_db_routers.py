@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connections
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from b2broker.db_routers import PIN_COOKIE, ReplicaPinMiddleware
+from b2broker.models import Wallet, Transaction
+
+pytestmark = [
+    pytest.mark.django_db(
+        transaction=True, reset_sequences=True, databases=["default", "replica"]
+    ),
+]
+
+
+@pytest.fixture(autouse=True)
+def replicas():
+    with override_settings(B2BROKER_READ_REPLICAS=["replica"]):
+        yield
+
+
+def get(client, url):
+    with CaptureQueriesContext(connections["default"]) as primary:
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = client.get(url)
+    assert response.status_code == 200
+    return response, len(primary), len(replica)
+
+
+def test_safe_requests_read_from_replica(client):
+    w = Wallet.objects.create(label="test_wallet")
+    Transaction.objects.create(wallet=w, txid="1", amount=1)
+
+    for url in ("/wallets/", "/wallets/1/", "/transactions/", "/transactions/1/"):
+        _, primary, replica = get(client, url)
+        assert primary == 0
+        assert replica > 0
+
+
+def test_writer_is_pinned_to_primary(client):
+    Wallet.objects.create(label="test_wallet")
+    request = {
+        "data": {
+            "type": "transactions",
+            "attributes": {"txid": "123", "amount": "10"},
+            "relationships": {"wallet": {"data": {"type": "wallets", "id": "1"}}},
+        }
+    }
+    with CaptureQueriesContext(connections["replica"]) as replica:
+        response = client.post(
+            "/transactions/", data=request, content_type="application/vnd.api+json"
+        )
+    assert response.status_code == 201
+    assert len(replica) == 0
+    assert response.cookies[PIN_COOKIE]["max-age"] == 5
+
+    # The client keeps the cookie and reads its own write from the primary.
+    response, primary, replica = get(client, "/transactions/1/")
+    assert response.json()["data"]["attributes"]["txid"] == "123"
+    assert primary > 0
+    assert replica == 0
+
+    # Once the pin expires it is back on the replica.
+    del client.cookies[PIN_COOKIE]
+    _, primary, replica = get(client, "/transactions/1/")
+    assert primary == 0
+    assert replica > 0
+
+
+def test_replica_responses_are_not_tagged(client, settings, shared_cache):
+    settings.B2BROKER_RESPONSE_CACHE = True
+    settings.B2BROKER_ETAGS = True
+    Wallet.objects.create(label="test_wallet")
+
+    response, _, _ = get(client, "/wallets/1/")
+    assert "ETag" not in response
+    _, _, replica = get(client, "/wallets/1/")
+    assert replica > 0
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/transactions/export.csv",
+        "/wallets/balances/",
+        "/wallets/balances.csv?filter[id]=1",
+    ],
+)
+def test_streaming_responses_read_from_replica(client, url):
+    w = Wallet.objects.create(label="test_wallet")
+    Transaction.objects.create(wallet=w, txid="1", amount=1)
+
+    with CaptureQueriesContext(connections["default"]) as primary:
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = client.get(url)
+            assert response.streaming
+            content = b"".join(response.streaming_content)
+    assert b"1.000000000000000000" in content
+    assert len(primary) == 0
+    assert len(replica) > 0
+
+
+def test_async_requests_read_from_replica():
+    assert asyncio.iscoroutinefunction(
+        ReplicaPinMiddleware(AsyncClient().handler.get_response_async)
+    )
+    Wallet.objects.create(label="test_wallet")
+    client = AsyncClient()
+
+    with CaptureQueriesContext(connections["default"]) as primary:
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = async_to_sync(client.get)("/async/wallets/1/")
+    assert response.status_code == 200
+    assert len(primary) == 0
+    assert len(replica) > 0
+
+    response = async_to_sync(client.post)("/wallets/", {"label": "test_wallet2"})
+    assert response.status_code == 201
+    assert PIN_COOKIE in response.cookies
+
+
+def test_reads_outside_requests_use_primary():
+    Wallet.objects.create(label="test_wallet")
+    with CaptureQueriesContext(connections["replica"]) as replica:
+        assert Wallet.objects.get().label == "test_wallet"
+    assert len(replica) == 0
+
+
+@override_settings(B2BROKER_READ_REPLICAS=[])
+def test_no_replicas_configured(client):
+    Wallet.objects.create(label="test_wallet")
+    _, primary, replica = get(client, "/wallets/1/")
+    assert primary > 0
+    assert replica == 0
+    response = client.post("/wallets/", {"label": "test_wallet2"})
+    assert PIN_COOKIE not in response.cookies
@@ -0,0 +1,149 @@
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+
+from b2broker.cache import check_shared_cache, etags_enabled
+from b2broker.models import Wallet, Transaction
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(settings):
+    settings.B2BROKER_CACHE_ALIAS = "default"
+    settings.B2BROKER_ETAGS = True
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_retrieve_not_modified(client, django_assert_num_queries):
+    Wallet.objects.create(label="test_wallet")
+    response = client.get("/wallets/1/")
+    assert response.status_code == 200
+    etag = response["ETag"]
+    assert etag.startswith('W/"')
+
+    with django_assert_num_queries(0):
+        response = client.get("/wallets/1/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+    assert response.content == b""
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_etag_changes_on_transaction_write(client):
+    w = Wallet.objects.create(label="test_wallet")
+    Wallet.objects.create(label="test_wallet2")
+    etag = client.get("/wallets/1/")["ETag"]
+    other_etag = client.get("/wallets/2/")["ETag"]
+    list_etag = client.get("/wallets/")["ETag"]
+
+    Transaction.objects.create(wallet=w, txid="123", amount=10)
+
+    response = client.get("/wallets/1/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    response = client.get("/wallets/", HTTP_IF_NONE_MATCH=list_etag)
+    assert response.status_code == 200
+    response = client.get("/wallets/2/", HTTP_IF_NONE_MATCH=other_etag)
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_filtered_transaction_list_not_modified(client):
+    w = Wallet.objects.create(label="test_wallet")
+    w2 = Wallet.objects.create(label="test_wallet2")
+    Transaction.objects.create(wallet=w, txid="123", amount=10)
+    etag = client.get("/transactions/?filter[wallet]=1")["ETag"]
+    assert client.get("/transactions/?filter[wallet]=2")["ETag"] != etag
+
+    Transaction.objects.create(wallet=w2, txid="124", amount=10)
+    response = client.get("/transactions/?filter[wallet]=1", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    Transaction.objects.create(wallet=w, txid="125", amount=10)
+    response = client.get("/transactions/?filter[wallet]=1", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert len(response.json()["data"]) == 2
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/wallets/01/",
+        "/transactions/01/",
+        "/transactions/?filter[wallet]=01",
+    ],
+)
+def test_etag_changes_on_write_for_unnormalised_ids(client, url):
+    w = Wallet.objects.create(label="test_wallet")
+    t = Transaction.objects.create(wallet=w, txid="123", amount=10)
+    etag = client.get(url)["ETag"]
+
+    t.amount = 20
+    t.save()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_etag_changes_on_rebuild_balances(client):
+    w = Wallet.objects.create(label="test_wallet")
+    etag = client.get("/wallets/1/")["ETag"]
+    Transaction.objects.create(wallet=w, txid="123", amount=10)
+    Wallet.objects.update(balance=0)
+    etag = client.get("/wallets/1/")["ETag"]
+
+    call_command("rebuild_balances")
+    response = client.get("/wallets/1/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.json()["data"]["attributes"]["balance"].startswith("10")
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_no_etags_with_a_process_local_cache(client, settings):
+    settings.B2BROKER_ETAGS = None
+    Wallet.objects.create(label="test_wallet")
+    response = client.get("/wallets/1/")
+    assert "ETag" not in response
+    response = client.get("/wallets/1/", HTTP_IF_NONE_MATCH="*")
+    assert response.status_code == 200
+
+
+def test_etags_follow_the_cache_backend(settings, tmp_path):
+    settings.B2BROKER_ETAGS = None
+    assert not etags_enabled()
+    settings.CACHES = {
+        **settings.CACHES,
+        "shared": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": str(tmp_path),
+        },
+    }
+    settings.B2BROKER_CACHE_ALIAS = "shared"
+    assert etags_enabled()
+    settings.B2BROKER_ETAGS = False
+    assert not etags_enabled()
+
+
+def test_process_local_cache_warnings(settings, tmp_path):
+    settings.B2BROKER_RESPONSE_CACHE = True
+    assert [warning.id for warning in check_shared_cache(None)] == [
+        "b2broker.W001",
+        "b2broker.W002",
+    ]
+    settings.B2BROKER_RESPONSE_CACHE = False
+    settings.B2BROKER_ETAGS = None
+    assert check_shared_cache(None) == []
+    settings.CACHES = {
+        **settings.CACHES,
+        "shared": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": str(tmp_path),
+        },
+    }
+    settings.B2BROKER_CACHE_ALIAS = "shared"
+    settings.B2BROKER_RESPONSE_CACHE = True
+    settings.B2BROKER_ETAGS = True
+    assert check_shared_cache(None) == []
@@ -0,0 +1,118 @@
+import pytest
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from b2broker.models import Wallet, Transaction
+from b2broker.serializers import TransactionSerializer, WalletSerializer
+
+
+@pytest.fixture
+def ledger(db):
+    w = Wallet.objects.create(label="test_wallet")
+    w2 = Wallet.objects.create(label="wallet   éè \U0001f4b0")
+    Wallet.objects.create(label="")
+    amounts = ["1.5", "-2.25", "0", "100", "-0.000000000000000001", "12345.6789"]
+    for i in range(1, 25):
+        Transaction.objects.create(
+            wallet=w if i % 3 else w2,
+            txid=f"transaction_{i}",
+            amount=amounts[i % len(amounts)],
+        )
+    return w, w2
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/wallets/",
+        "/wallets/?filter[label]=test_wallet",
+        "/wallets/?sort=-label",
+        "/wallets/?page[size]=2&page[number]=2",
+        "/wallets/?page[cursor]=",
+        "/wallets/?sort=-balance",
+        "/wallets/?filter[balance.lt]=0&page[cursor]=&sort=balance",
+        "/transactions/",
+        "/transactions/?filter[wallet]=2",
+        "/transactions/?sort=-amount&page[size]=5&page[number]=2",
+        "/transactions/?page[number]=3",
+        "/transactions/?page[size]=100",
+        "/transactions/?page[cursor]=&page[size]=7&page[count]=true",
+        "/transactions/?page[cursor]=&filter[wallet]=1",
+        "/transactions/?page[number]=9",
+        "/transactions/?filter[wallet]=99",
+        "/wallets/?fields[wallets]=label",
+        "/wallets/?fields[wallets]=balance,url&sort=-label",
+        "/wallets/?fields[wallets]=",
+        "/wallets/?fields[transactions]=txid",
+        "/transactions/?fields[transactions]=txid",
+        "/transactions/?fields[transactions]=wallet,amount&sort=-amount",
+        "/transactions/?fields[transactions]=txid&sort=-amount&page[cursor]=",
+        "/transactions/?fields[transactions]=nope&page[size]=3",
+    ],
+)
+def test_fast_list_matches_serializers(client, ledger, url):
+    with override_settings(B2BROKER_FAST_LIST=False):
+        expected = client.get(url)
+    response = client.get(url)
+    assert response.status_code == expected.status_code
+    assert response["Content-Type"] == expected["Content-Type"]
+    assert response.content == expected.content
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_fast_list_follows_cursor_links(client, ledger):
+    url = "/transactions/?page[cursor]=&page[size]=5"
+    pages = 0
+    while url:
+        with override_settings(B2BROKER_FAST_LIST=False):
+            expected = client.get(url)
+        response = client.get(url)
+        assert response.content == expected.content
+        url = response.json()["links"]["next"]
+        pages += 1
+    assert pages == 5
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+@pytest.mark.parametrize(
+    "url,fast",
+    [
+        ("/transactions/", True),
+        ("/wallets/", True),
+        ("/wallets/?fields[wallets]=label", True),
+        ("/transactions/?fields[transactions]=txid", True),
+        ("/transactions/?include=wallet", False),
+    ],
+)
+def test_fast_list_skips_serializers(client, ledger, monkeypatch, url, fast):
+    calls = []
+    for serializer_class in (TransactionSerializer, WalletSerializer):
+        original = serializer_class.to_representation
+        monkeypatch.setattr(
+            serializer_class,
+            "to_representation",
+            lambda self, instance, original=original: calls.append(instance)
+            or original(self, instance),
+        )
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert (not calls) == fast
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_fast_list_fetches_only_requested_columns(client, ledger):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get("/wallets/?fields[wallets]=label")
+    assert response.status_code == 200
+    assert all("balance" not in query["sql"] for query in queries)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get("/transactions/?fields[transactions]=amount")
+    assert response.status_code == 200
+    assert all(
+        "txid" not in query["sql"] and "wallet_id" not in query["sql"]
+        for query in queries
+    )
@@ -0,0 +1,159 @@
+import threading
+from decimal import Decimal
+
+import pytest
+from django.db import OperationalError, connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.test import Client
+
+from b2broker import group_commit, metrics
+from b2broker.models import Wallet, Transaction
+
+
+@pytest.fixture
+def grouped(settings):
+    settings.B2BROKER_GROUP_COMMIT = True
+    # Long enough for the concurrent requests below to share batches.
+    settings.B2BROKER_GROUP_COMMIT_INTERVAL_MS = 50
+    metrics.reset()
+    yield
+    group_commit.shutdown()
+    metrics.reset()
+
+
+def post(txid, amount="1.5", wallet="1"):
+    request = {
+        "data": {
+            "type": "transactions",
+            "attributes": {"txid": txid, "amount": amount},
+            "relationships": {"wallet": {"data": {"type": "wallets", "id": wallet}}},
+        }
+    }
+    try:
+        return Client().post(
+            "/transactions/", data=request, content_type="application/vnd.api+json"
+        )
+    finally:
+        connections.close_all()
+
+
+def post_concurrently(txids):
+    responses = [None] * len(txids)
+
+    def worker(index):
+        responses[index] = post(txids[index])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(txids))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_group_commit_creates_transactions(client, grouped):
+    Wallet.objects.create(label="test_wallet")
+
+    responses = post_concurrently([f"tx_{i}" for i in range(20)])
+
+    assert [response.status_code for response in responses] == [201] * 20
+    ids = {response.json()["data"]["id"] for response in responses}
+    assert ids == {str(pk) for pk in Transaction.objects.values_list("pk", flat=True)}
+    for i, response in enumerate(responses):
+        response_data = response.json()["data"]
+        assert response_data["attributes"]["txid"] == f"tx_{i}"
+        assert response_data["attributes"]["amount"] == "1.500000000000000000"
+        assert response_data["relationships"]["wallet"]["data"]["id"] == "1"
+
+    response = client.get("/wallets/1/")
+    assert response.json()["data"]["attributes"]["balance"] == "30.000000000000000000"
+
+    rows, batches = group_commit.batch_size.get()
+    assert rows == 20
+    assert 1 <= batches <= 20
+    assert group_commit.flush_duration.get()[1] == batches
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_group_commit_rejects_duplicate_txid_in_batch(grouped):
+    Wallet.objects.create(label="test_wallet")
+
+    responses = post_concurrently(["123", "123"])
+
+    assert sorted(response.status_code for response in responses) == [201, 400]
+    (rejected,) = [response for response in responses if response.status_code == 400]
+    assert (
+        rejected.json()["errors"][0]["detail"]
+        == "transaction with this txid already exists."
+    )
+    assert Transaction.objects.count() == 1
+    assert Wallet.objects.get().balance == 1.5
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_group_commit_keeps_request_validation(grouped):
+    Wallet.objects.create(label="test_wallet")
+    Transaction.objects.create(wallet_id=1, txid="123", amount=1)
+
+    response = post("123")
+    assert response.status_code == 400
+    response = post("456", wallet="2")
+    assert response.status_code == 400
+    assert Transaction.objects.count() == 1
+    # Rejected requests never reach the queue.
+    assert group_commit.batch_size.get() == (0, 0)
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_group_commit_metrics(client, grouped):
+    Wallet.objects.create(label="test_wallet")
+    assert post("123").status_code == 201
+
+    content = client.get("/metrics").content.decode()
+    assert "b2broker_group_commit_queue_depth 0" in content
+    assert "b2broker_group_commit_batch_size_count 1" in content
+    assert "# TYPE b2broker_group_commit_flush_duration_seconds histogram" in content
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_group_commit_survives_a_failed_batch(grouped, monkeypatch):
+    Wallet.objects.create(label="test_wallet")
+    committer = group_commit.get_committer()
+    failures = [OperationalError("connection lost")]
+
+    close_if_unusable_or_obsolete = BaseDatabaseWrapper.close_if_unusable_or_obsolete
+
+    def fail_once(self):
+        if failures:
+            raise failures.pop()
+        close_if_unusable_or_obsolete(self)
+
+    monkeypatch.setattr(BaseDatabaseWrapper, "close_if_unusable_or_obsolete", fail_once)
+    future = committer.submit({"wallet": 1, "txid": "123", "amount": Decimal(1)})
+    with pytest.raises(OperationalError):
+        future.result(timeout=5)
+
+    assert post("456").status_code == 201
+    assert group_commit.get_committer() is committer
+    assert list(Transaction.objects.values_list("txid", flat=True)) == ["456"]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_group_commit_times_out(grouped, settings, monkeypatch):
+    settings.B2BROKER_GROUP_COMMIT_TIMEOUT = 0.05
+    Wallet.objects.create(label="test_wallet")
+    release = threading.Event()
+    insert_transactions = group_commit.insert_transactions
+
+    def slow_insert(*args):
+        release.wait(5)
+        insert_transactions(*args)
+
+    monkeypatch.setattr(group_commit, "insert_transactions", slow_insert)
+    try:
+        response = post("123")
+    finally:
+        release.set()
+    assert response.status_code == 503
+    assert response.json()["errors"][0]["code"] == "commit_timeout"
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from b2broker import metrics
+from b2broker.models import Wallet, Transaction
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_metrics_record_queries_per_route_and_action(client):
+    w = Wallet.objects.create(label="test_wallet")
+    Transaction.objects.create(wallet=w, txid="1", amount="1.5")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get("/transactions/")
+    assert response.status_code == 200
+    # The next request resets the query log.
+    expected_queries = len(queries)
+    response = client.get("/wallets/1/")
+    assert response.status_code == 200
+
+    total, count = metrics.sql_queries.get("transaction-list", "list")
+    assert (total, count) == (expected_queries, 1)
+    assert metrics.sql_queries.get("wallet-detail", "retrieve")[1] == 1
+    assert metrics.request_duration.get("transaction-list", "list")[1] == 1
+    assert metrics.render_duration.get("wallet-detail", "retrieve")[0] > 0
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_metrics_endpoint_serves_prometheus_text(client):
+    client.get("/wallets/")
+    client.get("/nowhere/")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response["Content-Type"] == metrics.PROMETHEUS_CONTENT_TYPE
+    content = response.content.decode()
+    assert "# TYPE b2broker_request_duration_seconds histogram" in content
+    assert (
+        'b2broker_request_sql_queries_bucket{route="wallet-list",action="list",le="+Inf"} 1'
+        in content
+    )
+    assert 'b2broker_request_sql_queries_count{route="unmatched",action="get"} 1' in (
+        content
+    )
+    assert "# TYPE b2broker_response_cache_hits_total counter" in content
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_server_timing_header(client):
+    response = client.get("/wallets/")
+    assert "Server-Timing" not in response
+
+    with override_settings(B2BROKER_SERVER_TIMING=True):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get("/wallets/")
+    names = [metric.split(";")[0] for metric in response["Server-Timing"].split(", ")]
+    assert names == ["db", "render", "total"]
+    assert f'desc="{len(queries)} queries"' in response["Server-Timing"]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_metrics_of_async_requests(client):
+    Wallet.objects.create(label="test_wallet")
+    assert asyncio.iscoroutinefunction(
+        metrics.MetricsMiddleware(AsyncClient().handler.get_response_async)
+    )
+
+    with CaptureQueriesContext(connection) as queries:
+        response = async_to_sync(AsyncClient().get)("/async/wallets/1/")
+    assert response.status_code == 200
+    total, count = metrics.sql_queries.get("b2broker.async_views.wallet_detail", "get")
+    assert (total, count) == (len(queries), 1)
+    assert total > 0
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test", "Test.", ("route",), (1, 5))
+    for value in (0, 1, 3, 7):
+        histogram.observe(value, 'a"b')
+    assert histogram.collect() == [
+        "# HELP test Test.",
+        "# TYPE test histogram",
+        'test_bucket{route="a\\"b",le="1"} 2',
+        'test_bucket{route="a\\"b",le="5"} 3',
+        'test_bucket{route="a\\"b",le="+Inf"} 4',
+        'test_sum{route="a\\"b"} 11',
+        'test_count{route="a\\"b"} 4',
+    ]
+
+
+def test_histogram_is_thread_safe():
+    histogram = metrics.Histogram("test", "Test.", ("route",), (0.5,))
+
+    def observe():
+        for _ in range(10000):
+            histogram.observe(1, "a")
+
+    threads = [threading.Thread(target=observe) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert histogram.get("a") == (80000, 80000)
@@ -1,7 +1,8 @@
 from decimal import Decimal
 
 import pytest
-from b2broker.models import Wallet, Transaction
+from django.db.models import QuerySet
+from b2broker.models import BalanceCheckpoint, Wallet, Transaction
 
 
 @pytest.mark.django_db
@@ -33,3 +34,120 @@ def test_wallet_balance_precision():
         txid="124",
     )
     assert wallet.balance == Decimal("20.000000000000000002")
+
+
+@pytest.mark.django_db
+def test_wallet_balance_is_stored():
+    wallet = Wallet.objects.create(label="me")
+    Transaction.objects.create(wallet=wallet, amount=10, txid="123")
+
+    assert Wallet.objects.get(pk=wallet.pk).balance == 10
+
+
+@pytest.mark.django_db
+def test_wallet_rename_keeps_concurrent_balance_change():
+    wallet = Wallet.objects.create(label="me")
+    stale = Wallet.objects.get(pk=wallet.pk)
+    Transaction.objects.create(wallet=wallet, amount=5, txid="123")
+
+    stale.label = "renamed"
+    stale.save()
+
+    wallet = Wallet.objects.get(pk=wallet.pk)
+    assert wallet.label == "renamed"
+    assert wallet.balance == 5
+    assert wallet.balance == wallet.ledger_balance
+
+
+@pytest.mark.django_db
+def test_wallet_balance_follows_transaction_update():
+    wallet = Wallet.objects.create(label="me")
+    other_wallet = Wallet.objects.create(label="other")
+    transaction = Transaction.objects.create(wallet=wallet, amount=10, txid="123")
+
+    transaction.amount = 25
+    transaction.save()
+    assert Wallet.objects.get(pk=wallet.pk).balance == 25
+
+    transaction.wallet = other_wallet
+    transaction.save()
+    assert Wallet.objects.get(pk=wallet.pk).balance == 0
+    assert Wallet.objects.get(pk=other_wallet.pk).balance == 25
+
+
+@pytest.mark.django_db
+def test_wallet_balance_follows_transaction_delete():
+    wallet = Wallet.objects.create(label="me")
+    Transaction.objects.create(wallet=wallet, amount=10, txid="123")
+    transaction = Transaction.objects.create(wallet=wallet, amount=5, txid="124")
+
+    transaction.delete()
+    assert Wallet.objects.get(pk=wallet.pk).balance == 10
+
+
+@pytest.mark.django_db
+def test_wallet_ledger_balance_without_checkpoint():
+    wallet = Wallet.objects.create(label="me")
+    assert wallet.ledger_balance == 0
+
+    Transaction.objects.create(wallet=wallet, amount=10, txid="123")
+    Transaction.objects.create(wallet=wallet, amount=5, txid="124")
+    assert wallet.ledger_balance == 15
+
+
+@pytest.mark.django_db
+def test_wallet_ledger_balance_with_checkpoint():
+    wallet = Wallet.objects.create(label="me")
+    first = Transaction.objects.create(wallet=wallet, amount=10, txid="123")
+    BalanceCheckpoint.advance(wallet.pk)
+    checkpoint = BalanceCheckpoint.objects.get(wallet=wallet)
+    assert checkpoint.last_transaction_id == first.pk
+    assert checkpoint.balance == 10
+
+    Transaction.objects.create(wallet=wallet, amount=5, txid="124")
+    assert wallet.ledger_balance == 15
+
+
+@pytest.mark.django_db
+def test_balance_checkpoint_follows_covered_transaction_changes():
+    wallet = Wallet.objects.create(label="me")
+    other_wallet = Wallet.objects.create(label="other")
+    transaction = Transaction.objects.create(wallet=wallet, amount=10, txid="123")
+    Transaction.objects.create(wallet=other_wallet, amount=1, txid="124")
+    BalanceCheckpoint.advance(wallet.pk)
+    BalanceCheckpoint.advance(other_wallet.pk)
+
+    transaction.amount = 25
+    transaction.save()
+    assert BalanceCheckpoint.objects.get(wallet=wallet).balance == 25
+    assert wallet.ledger_balance == 25
+
+    transaction.wallet = other_wallet
+    transaction.save()
+    assert wallet.ledger_balance == 0
+    assert other_wallet.ledger_balance == 26
+
+    transaction.delete()
+    assert other_wallet.ledger_balance == 1
+    assert BalanceCheckpoint.objects.get(wallet=other_wallet).balance == 1
+
+
+@pytest.mark.django_db
+def test_balance_checkpoint_locks_rows_it_reads(monkeypatch):
+    wallet = Wallet.objects.create(label="me")
+    locked = []
+    select_for_update = QuerySet.select_for_update
+
+    def record_lock(self, *args, **kwargs):
+        locked.append(self.model)
+        return select_for_update(self, *args, **kwargs)
+
+    monkeypatch.setattr(QuerySet, "select_for_update", record_lock)
+    BalanceCheckpoint.advance(wallet.pk)
+    assert locked[:2] == [Wallet, BalanceCheckpoint]
+
+    # Not covered by the checkpoint, which is still locked.
+    locked.clear()
+    Transaction.objects.create(wallet=wallet, amount=10, txid="123")
+    assert BalanceCheckpoint in locked
+    assert BalanceCheckpoint.objects.get(wallet=wallet).balance == 0
@@ -0,0 +1,237 @@
+import io
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from b2broker import outbox
+from b2broker.models import OutboxEvent, Wallet, Transaction
+
+
+def resource(pk, txid, amount, wallet_id=1):
+    return {
+        "type": "transactions",
+        "id": str(pk),
+        "attributes": {"txid": txid, "amount": amount},
+        "relationships": {
+            "wallet": {"data": {"type": "wallets", "id": str(wallet_id)}}
+        },
+    }
+
+
+def stored_events():
+    return list(OutboxEvent.objects.order_by("pk").values_list("event_type", "payload"))
+
+
+class FailingSink(outbox.Sink):
+    def send(self, messages):
+        raise outbox.DeliveryError("sink is down")
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_viewset_writes_record_events(client):
+    Wallet.objects.create(label="test_wallet")
+    Wallet.objects.create(label="test_wallet2")
+    response = client.post(
+        "/transactions/",
+        data={
+            "data": {
+                "type": "transactions",
+                "attributes": {"txid": "123", "amount": "10"},
+                "relationships": {"wallet": {"data": {"type": "wallets", "id": "1"}}},
+            }
+        },
+        content_type="application/vnd.api+json",
+    )
+    assert response.status_code == 201
+    response = client.patch(
+        "/transactions/1/",
+        data={
+            "data": {
+                "type": "transactions",
+                "id": "1",
+                "attributes": {"amount": "-2.5"},
+                "relationships": {"wallet": {"data": {"type": "wallets", "id": "2"}}},
+            }
+        },
+        content_type="application/vnd.api+json",
+    )
+    assert response.status_code == 200
+    assert client.delete("/transactions/1/").status_code == 204
+
+    created = resource(1, "123", "10.000000000000000000")
+    updated = resource(1, "123", "-2.500000000000000000", 2)
+    previous = {key: created[key] for key in ("attributes", "relationships")}
+    assert stored_events() == [
+        (OutboxEvent.CREATED, created),
+        (OutboxEvent.UPDATED, {**updated, "meta": {"previous": previous}}),
+        (OutboxEvent.DELETED, updated),
+    ]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_bulk_create_records_events(client):
+    Wallet.objects.create(label="test_wallet")
+    request = {
+        "data": [
+            {
+                "type": "transactions",
+                "attributes": {"txid": txid, "amount": "1"},
+                "relationships": {"wallet": {"data": {"type": "wallets", "id": "1"}}},
+            }
+            for txid in ("123", "124", "123")
+        ]
+    }
+    response = client.post(
+        "/transactions/bulk/", data=request, content_type="application/vnd.api+json"
+    )
+    assert response.json()["meta"]["created"] == 2
+
+    assert stored_events() == [
+        (OutboxEvent.CREATED, resource(1, "123", "1.000000000000000000")),
+        (OutboxEvent.CREATED, resource(2, "124", "1.000000000000000000")),
+    ]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_events_are_written_in_the_change_transaction():
+    wallet = Wallet.objects.create(label="test_wallet")
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            Transaction.objects.create(wallet=wallet, txid="123", amount=1)
+            raise RuntimeError
+    assert not OutboxEvent.objects.exists()
+
+    Transaction.objects.create(wallet=wallet, txid="124", amount=1)
+    Transaction.objects.create(wallet=wallet, txid="125", amount=2)
+    OutboxEvent.objects.all().delete()
+    with CaptureQueriesContext(connection) as queries:
+        wallet.delete()
+    # The transactions are deleted without being read.
+    table = connection.ops.quote_name(Transaction._meta.db_table)
+    assert not any(
+        query["sql"].startswith("SELECT") and table in query["sql"] for query in queries
+    )
+    # One event for the wallet and all of its transactions.
+    assert stored_events() == [
+        (
+            OutboxEvent.WALLET_DELETED,
+            {"type": "wallets", "id": "1", "attributes": {"label": "test_wallet"}},
+        )
+    ]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+@pytest.mark.parametrize("batch_size, concurrency", [(2, 1), (100, 1), (1, 3)])
+def test_publish_outbox_to_file(tmp_path, batch_size, concurrency):
+    if concurrency > 1 and connection.vendor == "sqlite":
+        pytest.skip("SQLite locks the whole database")
+    wallet = Wallet.objects.create(label="test_wallet")
+    for i in range(5):
+        Transaction.objects.create(wallet=wallet, txid=f"tx_{i}", amount=i)
+    Transaction.objects.get(txid="tx_0").delete()
+    path = tmp_path / "events.ndjson"
+    out = io.StringIO()
+
+    call_command(
+        "publish_outbox",
+        sink=f"file://{path}",
+        batch_size=batch_size,
+        concurrency=concurrency,
+        once=True,
+        stdout=out,
+    )
+
+    assert "Published 6 event(s)" in out.getvalue()
+    messages = sorted(
+        (json.loads(line) for line in path.read_text().splitlines()),
+        key=lambda message: message["id"],
+    )
+    assert [message["id"] for message in messages] == [1, 2, 3, 4, 5, 6]
+    assert messages[0]["type"] == OutboxEvent.CREATED
+    assert messages[0]["data"] == resource(1, "tx_0", "0.000000000000000000")
+    assert messages[-1]["type"] == OutboxEvent.DELETED
+    assert messages[-1]["data"] == messages[0]["data"]
+    assert not OutboxEvent.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_publish_outbox_keeps_undelivered_events(settings):
+    settings.B2BROKER_OUTBOX_SINKS = {"failing": f"{__name__}.FailingSink"}
+    wallet = Wallet.objects.create(label="test_wallet")
+    Transaction.objects.create(wallet=wallet, txid="123", amount=1)
+
+    with pytest.raises(CommandError, match="sink is down"):
+        call_command("publish_outbox", sink="failing://", once=True)
+    assert OutboxEvent.objects.count() == 1
+
+    stop = threading.Event()
+    timer = threading.Timer(0.05, stop.set)
+    timer.start()
+    assert outbox.publish(FailingSink("failing://"), 10, stop, 0.01) == 0
+    assert OutboxEvent.objects.count() == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "options, message",
+    [
+        ({}, "Pass --sink"),
+        ({"sink": "ftp://host/events"}, "no sink for 'ftp' URLs"),
+        ({"sink": "file:///nonexistent/events.ndjson"}, "Cannot open the sink"),
+        ({"sink": "file:///tmp/events", "batch_size": 0}, "--batch-size"),
+        ({"sink": "file:///tmp/events", "concurrency": 0}, "--concurrency"),
+    ],
+)
+def test_publish_outbox_arguments(settings, options, message):
+    settings.B2BROKER_OUTBOX_SINK = None
+    with pytest.raises(CommandError, match=message):
+        call_command("publish_outbox", once=True, **options)
+
+
+def test_socket_sink(tmp_path):
+    path = str(tmp_path / "events.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    sink = outbox.get_sink(f"unix://{path}")
+    sink.send([{"id": 1}, {"id": 2}])
+    peer, _ = server.accept()
+    with peer, server:
+        sink.close()
+        assert peer.makefile("rb").read() == b'{"id":1}\n{"id":2}\n'
+
+    with pytest.raises(outbox.DeliveryError):
+        sink.send([{"id": 3}])
+
+
+def test_webhook_sink():
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received.append((self.path, self.headers["Content-Type"], body))
+            self.send_response(500 if len(received) > 1 else 204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        sink = outbox.get_sink(f"http://127.0.0.1:{server.server_port}/events")
+        sink.send([{"id": 1}])
+        with pytest.raises(outbox.DeliveryError):
+            sink.send([{"id": 2}])
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert received[0] == ("/events", "application/json", b'{"events":[{"id":1}]}')
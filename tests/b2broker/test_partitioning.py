@@ -0,0 +1,100 @@
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+
+from b2broker import partitioning
+from b2broker.models import Wallet, Transaction
+
+mysql_only = pytest.mark.skipif(
+    connection.vendor != "mysql", reason="partitioning is implemented for MySQL only"
+)
+
+
+@pytest.fixture
+def partitioned(transactional_db):
+    partitioning.partition(4)
+    yield
+    partitioning.unpartition()
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor == "mysql", reason="MySQL supports it")
+def test_partition_command_requires_mysql():
+    with pytest.raises(CommandError, match="only supported on MySQL"):
+        call_command("partition_transactions", partitions=4)
+
+
+@mysql_only
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_partitioned_layout_keeps_txid_unique(client, partitioned):
+    assert len(partitioning.get_partitions()) == 4
+    w = Wallet.objects.create(label="test_wallet")
+    w2 = Wallet.objects.create(label="test_wallet2")
+    Transaction.objects.create(wallet=w, txid="123", amount=10)
+
+    # Another partition, same txid.
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Transaction.objects.create(wallet=w2, txid="123", amount=10)
+
+    request = {
+        "data": {
+            "type": "transactions",
+            "attributes": {"txid": "123", "amount": "10"},
+            "relationships": {"wallet": {"data": {"type": "wallets", "id": "2"}}},
+        }
+    }
+    response = client.post(
+        "/transactions/", data=request, content_type="application/vnd.api+json"
+    )
+    assert response.status_code == 400
+
+    # Renaming and moving a transaction moves its guard row along.
+    t = Transaction.objects.get()
+    t.txid = "456"
+    t.wallet = w2
+    t.save()
+    Transaction.objects.create(wallet=w, txid="123", amount=1)
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Transaction.objects.create(wallet=w, txid="456", amount=1)
+
+    w2.delete()
+    Transaction.objects.create(wallet=w, txid="456", amount=1)
+    assert Wallet.objects.get().balance == 2
+
+
+@mysql_only
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_partitioned_layout_keeps_wallet_references(partitioned):
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Transaction.objects.bulk_create(
+            [Transaction(wallet_id=99, txid="123", amount=1)]
+        )
+
+
+@mysql_only
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_partitioned_wallet_queries_are_pruned(partitioned):
+    wallets = [Wallet.objects.create(label=f"wallet_{i}") for i in range(8)]
+    Transaction.objects.bulk_create(
+        Transaction(wallet=wallets[i % 8], txid=f"transaction_{i}", amount=i)
+        for i in range(200)
+    )
+    sql, params = (
+        Transaction.objects.filter(wallet=wallets[3])
+        .order_by("id")[:10]
+        .query.sql_with_params()
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN {sql}", params)
+        columns = [column[0].lower() for column in cursor.description]
+        plan = dict(zip(columns, cursor.fetchone()))
+    assert len(plan["partitions"].split(",")) == 1
+
+
+@mysql_only
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_partition_command_resizes(partitioned):
+    call_command("partition_transactions", partitions=6)
+    assert len(partitioning.get_partitions()) == 6
+    call_command("partition_transactions", partitions=2)
+    assert len(partitioning.get_partitions()) == 2
@@ -0,0 +1,129 @@
+"""
+Query plan regression suite.
+
+Every SELECT/UPDATE a viewset request runs is passed through EXPLAIN. Queries
+with a WHERE clause must be answered from an index, and no query may need an
+extra sort pass (MySQL "Using filesort", SQLite "USE TEMP B-TREE FOR ORDER BY").
+"""
+
+import re
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from b2broker.models import Wallet, Transaction
+
+pytestmark = pytest.mark.skipif(
+    connection.vendor not in ("mysql", "sqlite"),
+    reason="query plan checks are implemented for MySQL and SQLite only",
+)
+
+
+def explain(sql):
+    """
+    Return ``(full_scans, filesorts)`` found in the plan of a query.
+    """
+    full_scans, filesorts = [], []
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            cursor.execute(f"EXPLAIN {sql}")
+            columns = [column[0].lower() for column in cursor.description]
+            for row in cursor.fetchall():
+                step = dict(zip(columns, row))
+                if step["type"] == "ALL":
+                    full_scans.append(step["table"])
+                if "Using filesort" in (step["extra"] or ""):
+                    filesorts.append(step["table"])
+        else:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            for row in cursor.fetchall():
+                detail = row[-1]
+                match = re.match(r"^SCAN (\w+)$", detail)
+                if match:
+                    full_scans.append(match.group(1))
+                if detail.startswith("USE TEMP B-TREE FOR ORDER BY"):
+                    filesorts.append(detail)
+    return full_scans, filesorts
+
+
+def assert_indexed_plans(queries):
+    # The captured SQL already has its parameters interpolated.
+    checked = 0
+    for query in queries:
+        sql = query["sql"]
+        if not re.match(r"^\s*(SELECT|UPDATE)\b", sql, re.IGNORECASE):
+            continue
+        full_scans, filesorts = explain(sql)
+        if re.search(r"\bWHERE\b", sql, re.IGNORECASE):
+            assert not full_scans, f"full scan of {full_scans} in: {sql}"
+        assert not filesorts, f"filesort in: {sql}"
+        checked += 1
+    assert checked
+
+
+def capture_request(client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+        if getattr(response, "streaming", False):
+            b"".join(response.streaming_content)
+    assert response.status_code == 200
+    return context.captured_queries
+
+
+@pytest.fixture
+def ledger(db):
+    wallets = [Wallet.objects.create(label=f"wallet_{i}") for i in range(20)]
+    Transaction.objects.bulk_create(
+        Transaction(wallet=wallets[i % 20], txid=f"transaction_{i}", amount=i)
+        for i in range(2000)
+    )
+    if connection.vendor == "mysql":
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE TABLE b2broker_wallet, b2broker_transaction")
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+    return wallets
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/wallets/",
+        "/wallets/?filter[label]=wallet_3",
+        "/wallets/?sort=-id",
+        "/wallets/?sort=-balance&page[size]=5",
+        "/wallets/?filter[balance.gte]=99000&sort=-balance",
+        "/wallets/?page[cursor]=",
+        "/wallets/{wallet}/",
+        "/wallets/{wallet}/history/?interval=week&start=2024-01-01",
+        "/wallets/balances/",
+        "/wallets/balances/?filter[label]=wallet_3",
+        "/transactions/",
+        "/transactions/?filter[wallet]={wallet}",
+        "/transactions/?filter[wallet]={wallet}&sort=-id",
+        "/transactions/?filter[wallet]={wallet}&page[cursor]=",
+        "/transactions/?filter[txid]=transaction_7",
+        "/transactions/?sort=amount",
+        "/transactions/?sort=-amount",
+        "/transactions/?sort=txid",
+        "/transactions/?sort=-txid",
+        "/transactions/?filter[wallet]={wallet}&sort=-amount",
+        "/transactions/{transaction}/",
+        "/transactions/export/?filter[wallet]={wallet}",
+    ],
+)
+def test_viewset_query_plans(client, ledger, url):
+    url = url.format(
+        wallet=ledger[3].pk,
+        transaction=Transaction.objects.filter(wallet=ledger[3]).first().pk,
+    )
+    assert_indexed_plans(capture_request(client, url))
+
+
+def test_rebuild_balances_query_plan(ledger):
+    with CaptureQueriesContext(connection) as context:
+        call_command("rebuild_balances", batch_size=5)
+    assert_indexed_plans(context.captured_queries)
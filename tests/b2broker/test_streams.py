@@ -0,0 +1,345 @@
+import asyncio
+import gc
+import json
+import threading
+
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.test import AsyncClient
+
+from b2broker.async_views import StreamApplication
+from b2broker.models import Wallet, Transaction
+from b2broker.notifier import Notifier, notifier
+
+
+@pytest.fixture
+def wallet(db):
+    w = Wallet.objects.create(label="test_wallet")
+    Transaction.objects.create(wallet=w, txid="transaction_1", amount="1.5")
+    return w
+
+
+def parse_event(block):
+    event = {}
+    for line in block.splitlines():
+        if line.startswith(":"):
+            event.setdefault("comment", line[1:].strip())
+            continue
+        name, _, value = line.partition(": ")
+        event[name] = json.loads(value) if name == "data" else value
+    return event
+
+
+class EventReader:
+    def __init__(self, response):
+        self.chunks = aiter(response.streaming_content)
+        self.buffer = ""
+
+    async def next(self, timeout=5):
+        while "\n\n" not in self.buffer:
+            chunk = await asyncio.wait_for(anext(self.chunks), timeout)
+            self.buffer += chunk.decode()
+        block, self.buffer = self.buffer.split("\n\n", 1)
+        return parse_event(block)
+
+    async def next_event(self, timeout=5):
+        while "comment" in (event := await self.next(timeout)):
+            pass
+        return event
+
+    async def close(self):
+        await self.chunks.aclose()
+
+
+def run(coroutine_function):
+    return async_to_sync(coroutine_function)()
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_stream_sends_new_transactions_and_balances(settings, wallet):
+    settings.B2BROKER_STREAM_POLL_SECONDS = 30
+
+    async def scenario():
+        response = await AsyncClient().get("/wallets/1/transactions/stream")
+        assert response.status_code == 200
+        assert response["Content-Type"] == "text/event-stream"
+        assert response["Cache-Control"] == "no-cache"
+        reader = EventReader(response)
+        try:
+            assert await reader.next() == {
+                "event": "balance",
+                "data": {
+                    "type": "wallets",
+                    "id": "1",
+                    "attributes": {"balance": "1.500000000000000000"},
+                    "links": {"self": "http://testserver/wallets/1/"},
+                },
+            }
+            # Woken up by the notifier, long before the poll interval.
+            await sync_to_async(Transaction.objects.create)(
+                wallet_id=1, txid="transaction_2", amount="2"
+            )
+            event = await reader.next()
+            assert event["id"] == "2"
+            assert event["event"] == "transaction"
+            assert event["data"]["attributes"] == {
+                "txid": "transaction_2",
+                "amount": "2.000000000000000000",
+            }
+            event = await reader.next()
+            assert event["event"] == "balance"
+            assert event["data"]["attributes"] == {"balance": "3.500000000000000000"}
+            assert notifier.subscribers(1) == 1
+        finally:
+            await reader.close()
+        # Like a disconnected client: the stream unsubscribes once collected.
+        del response, reader
+        gc.collect()
+        await asyncio.sleep(0.01)
+        assert notifier.subscribers(1) == 0
+
+    run(scenario)
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_stream_releases_its_connection_between_polls(settings, wallet, monkeypatch):
+    settings.B2BROKER_STREAM_POLL_SECONDS = 30
+    closed_in = []
+    close = BaseDatabaseWrapper.close
+
+    def record_close(self):
+        closed_in.append(threading.current_thread())
+        close(self)
+
+    monkeypatch.setattr(BaseDatabaseWrapper, "close", record_close)
+
+    async def scenario():
+        response = await AsyncClient().get("/wallets/1/transactions/stream")
+        reader = EventReader(response)
+        try:
+            assert (await reader.next())["event"] == "balance"
+        finally:
+            await reader.close()
+
+    run(scenario)
+    # The lookup in the view and the first poll, both off the main thread.
+    assert len(closed_in) == 2
+    assert threading.main_thread() not in closed_in
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_stream_polls_for_writes_of_other_processes(settings, wallet):
+    settings.B2BROKER_STREAM_POLL_SECONDS = 0.05
+
+    async def scenario():
+        response = await AsyncClient().get("/wallets/1/transactions/stream")
+        reader = EventReader(response)
+        try:
+            assert (await reader.next())["event"] == "balance"
+            assert await reader.next() == {"comment": "keep-alive"}
+            # bulk_create notifies nobody, like a commit made elsewhere.
+            await sync_to_async(Transaction.objects.bulk_create)(
+                [Transaction(wallet_id=1, txid="transaction_2", amount="2")]
+            )
+            event = await reader.next_event()
+            assert (event["event"], event["id"]) == ("transaction", "2")
+        finally:
+            await reader.close()
+
+    run(scenario)
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_stream_resumes_after_last_event_id(settings, wallet):
+    settings.B2BROKER_STREAM_POLL_SECONDS = 30
+    for i in range(2, 5):
+        Transaction.objects.create(wallet=wallet, txid=f"transaction_{i}", amount=i)
+
+    async def scenario():
+        response = await AsyncClient().get(
+            "/wallets/1/transactions/stream", headers={"Last-Event-ID": "2"}
+        )
+        reader = EventReader(response)
+        try:
+            events = [await reader.next() for _ in range(3)]
+        finally:
+            await reader.close()
+        assert [(event["event"], event.get("id")) for event in events] == [
+            ("transaction", "3"),
+            ("transaction", "4"),
+            ("balance", None),
+        ]
+
+    run(scenario)
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_stream_ends_when_wallet_is_deleted(settings, wallet):
+    settings.B2BROKER_STREAM_POLL_SECONDS = 30
+
+    async def scenario():
+        response = await AsyncClient().get("/wallets/1/transactions/stream")
+        reader = EventReader(response)
+        assert (await reader.next())["event"] == "balance"
+        await (await Wallet.objects.aget(pk=1)).adelete()
+        with pytest.raises(StopAsyncIteration):
+            await reader.next()
+
+    run(scenario)
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+@pytest.mark.parametrize(
+    "url, headers, status",
+    [
+        ("/wallets/2/transactions/stream", {}, 404),
+        ("/wallets/abc/transactions/stream", {}, 404),
+        ("/wallets/1/transactions/stream", {"Last-Event-ID": "abc"}, 400),
+    ],
+)
+def test_stream_errors(wallet, url, headers, status):
+    response = async_to_sync(AsyncClient().get)(url, headers=headers)
+    assert response.status_code == status
+    assert response.json()["errors"][0]["status"] == str(status)
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_stream_needs_asgi(client, wallet):
+    assert client.get("/wallets/1/transactions/stream").status_code == 501
+    assert client.post("/wallets/1/transactions/stream").status_code == 405
+
+
+class ASGIStream:
+    """
+    One request to an ASGI application, driven by hand.
+    """
+
+    def __init__(self, application, path, method="GET", headers=()):
+        self.application = application
+        self.scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"testserver"), *headers],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        self.disconnected = asyncio.Event()
+        self.messages = asyncio.Queue()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(
+            self.application(self.scope, self.receive, self.messages.put)
+        )
+        return self
+
+    async def receive(self):
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def response(self):
+        start = await asyncio.wait_for(self.messages.get(), 5)
+        return start["status"], dict(start["headers"])
+
+    async def next(self):
+        message = await asyncio.wait_for(self.messages.get(), 5)
+        return parse_event(message["body"].decode().strip())
+
+    async def disconnect(self):
+        self.disconnected.set()
+        await asyncio.wait_for(self.task, 5)
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_stream_application_holds_no_thread_per_stream(settings, wallet):
+    settings.B2BROKER_STREAM_POLL_SECONDS = 30
+    application = StreamApplication(None)
+
+    async def scenario():
+        threads = threading.active_count()
+        streams = [
+            ASGIStream(application, "/wallets/1/transactions/stream").start()
+            for _ in range(40)
+        ]
+        for stream in streams:
+            assert await stream.response() == (
+                200,
+                {
+                    b"content-type": b"text/event-stream",
+                    b"cache-control": b"no-cache",
+                    b"x-accel-buffering": b"no",
+                },
+            )
+            assert (await stream.next())["event"] == "balance"
+        # At most the threads of the shared executor.
+        assert threading.active_count() - threads < len(streams)
+        assert notifier.subscribers(1) == len(streams)
+
+        await sync_to_async(Transaction.objects.create)(
+            wallet_id=1, txid="transaction_2", amount="2"
+        )
+        for stream in streams:
+            event = await stream.next()
+            assert (event["event"], event["id"]) == ("transaction", "2")
+        for stream in streams:
+            await stream.disconnect()
+        assert notifier.subscribers(1) == 0
+
+    run(scenario)
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_stream_application_errors_and_other_requests(wallet):
+    passed = []
+
+    async def django_application(scope, receive, send):
+        passed.append(scope["path"])
+
+    application = StreamApplication(django_application)
+
+    async def scenario():
+        stream = ASGIStream(application, "/wallets/2/transactions/stream").start()
+        assert (await stream.response())[0] == 404
+        body = json.loads((await stream.messages.get())["body"])
+        assert body["errors"][0]["status"] == "404"
+
+        stream = ASGIStream(
+            application, "/wallets/1/transactions/stream", method="POST"
+        ).start()
+        assert await stream.response() == (405, {b"allow": b"GET, HEAD"})
+
+        stream = ASGIStream(
+            application, "/wallets/1/transactions/stream", method="HEAD"
+        ).start()
+        assert (await stream.response())[0] == 200
+        assert (await stream.messages.get())["body"] == b""
+        await asyncio.wait_for(stream.task, 5)
+
+        await ASGIStream(application, "/wallets/1/").start().task
+        assert passed == ["/wallets/1/"]
+
+    run(scenario)
+
+
+def test_notifier():
+    notifier = Notifier()
+
+    async def scenario():
+        with notifier.subscribe("1") as subscription:
+            assert notifier.subscribers(1) == 1
+            assert not await subscription.wait(0.01)
+            await asyncio.to_thread(notifier.notify, [1, 2])
+            assert await subscription.wait(1)
+            subscription.clear()
+            notifier.notify([2])
+            assert not await subscription.wait(0.01)
+        assert notifier.subscribers(1) == 0
+
+    run(scenario)
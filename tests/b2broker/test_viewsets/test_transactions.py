@@ -1,4 +1,9 @@
+import json
+
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 from b2broker.models import Wallet, Transaction
 
 
@@ -353,3 +358,345 @@ def test_transaction_amount_can_be_optional(client):
     assert response_data["attributes"]["amount"] == "0.000000000000000000"
     assert response_data["relationships"]["wallet"]["data"]["type"] == "wallets"
     assert response_data["relationships"]["wallet"]["data"]["id"] == "1"
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_bulk_create(client):
+    Wallet.objects.create(label="test_wallet")
+    Wallet.objects.create(label="test_wallet2")
+    Transaction.objects.create(
+        wallet_id=1,
+        txid="existing",
+        amount=1,
+    )
+    request = {
+        "data": [
+            {
+                "type": "transactions",
+                "attributes": {"txid": "123", "amount": "10"},
+                "relationships": {"wallet": {"data": {"type": "wallets", "id": "1"}}},
+            },
+            {
+                "type": "transactions",
+                "attributes": {"txid": "124", "amount": "-3"},
+                "relationships": {"wallet": {"data": {"type": "wallets", "id": "1"}}},
+            },
+            {
+                "type": "transactions",
+                "attributes": {"txid": "125", "amount": "5"},
+                "relationships": {"wallet": {"data": {"type": "wallets", "id": "2"}}},
+            },
+            {
+                "type": "transactions",
+                "attributes": {"txid": "123", "amount": "10"},
+                "relationships": {"wallet": {"data": {"type": "wallets", "id": "1"}}},
+            },
+            {
+                "type": "transactions",
+                "attributes": {"txid": "existing", "amount": "10"},
+                "relationships": {"wallet": {"data": {"type": "wallets", "id": "1"}}},
+            },
+            {
+                "type": "transactions",
+                "attributes": {"txid": "126", "amount": "10"},
+                "relationships": {"wallet": {"data": {"type": "wallets", "id": "3"}}},
+            },
+            {
+                "type": "transactions",
+                "attributes": {"amount": "10"},
+                "relationships": {"wallet": {"data": {"type": "wallets", "id": "1"}}},
+            },
+        ]
+    }
+    response = client.post(
+        "/transactions/bulk/", data=request, content_type="application/vnd.api+json"
+    )
+    assert response.status_code == 200
+    meta = response.json()["meta"]
+    assert meta["created"] == 3
+    assert meta["failed"] == 4
+    statuses = [result["status"] for result in meta["results"]]
+    assert statuses == ["201", "201", "201", "409", "409", "400", "400"]
+    assert meta["results"][6]["errors"][0]["source"]["pointer"] == (
+        "/data/6/attributes/txid"
+    )
+
+    created_ids = [result["id"] for result in meta["results"][:3]]
+    assert Transaction.objects.filter(pk__in=created_ids).count() == 3
+    assert Wallet.objects.get(pk=1).balance == 8
+    assert Wallet.objects.get(pk=2).balance == 5
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_bulk_create_ndjson(client):
+    Wallet.objects.create(label="test_wallet")
+    lines = [
+        '{"type": "transactions", "attributes": {"txid": "%d", "amount": "1.5"}, '
+        '"relationships": {"wallet": {"data": {"type": "wallets", "id": "1"}}}}' % i
+        for i in range(5)
+    ]
+    response = client.post(
+        "/transactions/bulk/",
+        data="\n".join(lines),
+        content_type="application/x-ndjson",
+    )
+    assert response.status_code == 200
+    assert response.json()["meta"]["created"] == 5
+    assert Transaction.objects.count() == 5
+    assert Wallet.objects.get(pk=1).balance == 7.5
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_bulk_create_rejects_other_types(client):
+    Wallet.objects.create(label="test_wallet")
+    request = {
+        "data": [
+            {
+                "type": resource_type,
+                "attributes": {"txid": txid, "amount": "1"},
+                "relationships": {"wallet": {"data": {"type": "wallets", "id": "1"}}},
+            }
+            for resource_type, txid in (("transactions", "1"), ("wallets", "2"))
+        ]
+        + [{"attributes": {"txid": "3", "amount": "1"}}]
+    }
+    response = client.post(
+        "/transactions/bulk/", data=request, content_type="application/vnd.api+json"
+    )
+    assert response.status_code == 200
+    meta = response.json()["meta"]
+    assert (meta["created"], meta["failed"]) == (1, 2)
+    assert meta["results"][0]["status"] == "201"
+    for index, resource_type in ((1, "wallets"), (2, None)):
+        assert meta["results"][index] == {
+            "status": "409",
+            "errors": [
+                {
+                    "status": "409",
+                    "detail": f"The resource object's type ({resource_type}) is not "
+                    "the type that constitute the collection represented by the "
+                    "endpoint (transactions).",
+                    "source": {"pointer": f"/data/{index}/type"},
+                }
+            ],
+        }
+    assert list(Transaction.objects.values_list("txid", flat=True)) == ["1"]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_bulk_create_rejects_single_resource(client):
+    Wallet.objects.create(label="test_wallet")
+    request = {
+        "data": {
+            "type": "transactions",
+            "attributes": {"txid": "123", "amount": "10"},
+            "relationships": {"wallet": {"data": {"type": "wallets", "id": "1"}}},
+        }
+    }
+    response = client.post(
+        "/transactions/bulk/", data=request, content_type="application/vnd.api+json"
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+@pytest.mark.parametrize("query", ["filter[bogus]=1", "filter[wallet]=abc"])
+def test_transaction_export_errors_are_json_api(client, query):
+    expected = client.get(f"/transactions/?{query}")
+    for url in (f"/transactions/export/?{query}", f"/transactions/export.csv?{query}"):
+        response = client.get(url)
+        assert response.status_code == 400
+        assert response["Content-Type"] == "application/vnd.api+json"
+        assert response.content == expected.content
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_export_ndjson(client, settings):
+    settings.B2BROKER_EXPORT_CHUNK_SIZE = 2
+    w = Wallet.objects.create(label="test_wallet")
+    w2 = Wallet.objects.create(label="test_wallet2")
+    for i in range(1, 6):
+        Transaction.objects.create(wallet=w, txid=f"transaction_{i}", amount=i)
+    Transaction.objects.create(wallet=w2, txid="other", amount=1)
+
+    response = client.get("/transactions/export/?filter[wallet]=1")
+    assert response.status_code == 200
+    assert response.streaming
+    assert response["Content-Type"] == "application/x-ndjson; charset=utf-8"
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    assert len(lines) == 5
+    resources = [json.loads(line) for line in lines]
+    assert [resource["id"] for resource in resources] == ["1", "2", "3", "4", "5"]
+    assert resources[0]["type"] == "transactions"
+    assert resources[0]["attributes"]["txid"] == "transaction_1"
+    assert resources[0]["relationships"]["wallet"]["data"]["id"] == "1"
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_export_csv(client):
+    w = Wallet.objects.create(label="test_wallet")
+    Transaction.objects.create(wallet=w, txid="123", amount=10)
+
+    response = client.get("/transactions/export.csv")
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/csv; charset=utf-8"
+    content = b"".join(response.streaming_content).decode()
+    assert content.splitlines() == [
+        "id,wallet,txid,amount",
+        "1,1,123,10.000000000000000000",
+    ]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_cursor_pagination(client):
+    w = Wallet.objects.create(label="test_wallet")
+    w2 = Wallet.objects.create(label="test_wallet2")
+    for i in range(1, 11):
+        Transaction.objects.create(
+            wallet=w if i % 2 else w2,
+            txid=f"transaction_{i}",
+            amount=10 * i,
+        )
+    response = client.get("/transactions/?filter[wallet]=1&page[size]=2&page[cursor]=")
+    assert response.status_code == 200
+    assert response.json()["meta"]["pagination"] == {}
+    assert response.json()["links"]["prev"] is None
+    response_data = response.json()["data"]
+    assert [resource["id"] for resource in response_data] == ["1", "3"]
+
+    response = client.get(response.json()["links"]["next"])
+    assert response.status_code == 200
+    response_data = response.json()["data"]
+    assert [resource["id"] for resource in response_data] == ["5", "7"]
+
+    response = client.get(response.json()["links"]["next"])
+    assert response.status_code == 200
+    assert response.json()["links"]["next"] is None
+    response_data = response.json()["data"]
+    assert [resource["id"] for resource in response_data] == ["9"]
+
+    response = client.get(response.json()["links"]["prev"])
+    assert response.status_code == 200
+    response_data = response.json()["data"]
+    assert [resource["id"] for resource in response_data] == ["5", "7"]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_cursor_pagination_count_is_optional(client):
+    w = Wallet.objects.create(label="test_wallet")
+    for i in range(1, 4):
+        Transaction.objects.create(wallet=w, txid=f"transaction_{i}", amount=i)
+    response = client.get("/transactions/?page[cursor]=&page[count]=true")
+    assert response.status_code == 200
+    assert response.json()["meta"]["pagination"]["count"] == 3
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_cursor_pagination_invalid_cursor(client):
+    response = client.get("/transactions/?page[cursor]=invalid")
+    assert response.status_code == 404
+
+
+def idempotent_post(client, txid, amount="10", wallet="1", key=None):
+    request = {
+        "data": {
+            "type": "transactions",
+            "attributes": {"txid": txid, "amount": amount},
+            "relationships": {"wallet": {"data": {"type": "wallets", "id": wallet}}},
+        }
+    }
+    return client.post(
+        "/transactions/",
+        data=request,
+        content_type="application/vnd.api+json",
+        headers={"Idempotency-Key": txid if key is None else key},
+    )
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_idempotent_create_retry(client):
+    Wallet.objects.create(label="test_wallet")
+    response = idempotent_post(client, "123")
+    assert response.status_code == 201
+    assert response.json()["data"]["id"] == "1"
+
+    response = idempotent_post(client, "123", amount="10.000")
+    assert response.status_code == 200
+    response_data = response.json()["data"]
+    assert response_data["id"] == "1"
+    assert response_data["attributes"]["txid"] == "123"
+    assert response_data["attributes"]["amount"] == "10.000000000000000000"
+    assert Transaction.objects.count() == 1
+
+    response = client.get("/wallets/1/")
+    assert response.json()["data"]["attributes"]["balance"] == "10.000000000000000000"
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_idempotent_create_conflict(client):
+    Wallet.objects.create(label="test_wallet")
+    Wallet.objects.create(label="test_wallet2")
+    assert idempotent_post(client, "123").status_code == 201
+
+    for response in (
+        idempotent_post(client, "123", amount="11"),
+        idempotent_post(client, "123", wallet="2"),
+    ):
+        assert response.status_code == 409
+        error = response.json()["errors"][0]
+        assert error["status"] == "409"
+        assert error["source"] == {"pointer": "/data/attributes/txid"}
+    assert Transaction.objects.get().amount == 10
+
+    response = client.get("/wallets/2/")
+    assert response.json()["data"]["attributes"]["balance"] == "0.0"
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_idempotent_create_key_must_match_txid(client):
+    Wallet.objects.create(label="test_wallet")
+    response = idempotent_post(client, "123", key="456")
+    assert response.status_code == 400
+    assert (
+        response.json()["errors"][0]["detail"]
+        == "txid must match the Idempotency-Key header."
+    )
+    assert not Transaction.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_transaction_include_wallet(client):
+    for i in range(1, 4):
+        w = Wallet.objects.create(label=f"test_wallet{i}")
+        for j in range(3):
+            Transaction.objects.create(wallet=w, txid=f"transaction_{i}_{j}", amount=i)
+
+    query_counts = []
+    for page_size in (1, 9):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(
+                f"/transactions/?include=wallet&page[size]={page_size}"
+            )
+        assert response.status_code == 200
+        query_counts.append(len(queries))
+    assert query_counts[0] == query_counts[1]
+
+    included = response.json()["included"]
+    assert [resource["id"] for resource in included] == ["1", "2", "3"]
+    assert included[2]["attributes"] == {
+        "label": "test_wallet3",
+        "balance": "9.000000000000000000",
+    }
+
+    response = client.get(
+        "/transactions/4/?include=wallet&fields[transactions]=txid"
+        "&fields[wallets]=label"
+    )
+    assert response.status_code == 200
+    response_data = response.json()
+    assert response_data["data"]["attributes"] == {"txid": "transaction_2_0"}
+    assert "relationships" not in response_data["data"]
+    assert "included" not in response_data
+
+    response = client.get("/transactions/4/?include=wallet&fields[wallets]=label")
+    assert response.json()["included"][0]["attributes"] == {"label": "test_wallet2"}
@@ -1,5 +1,13 @@
+import datetime
+import json
+
 import pytest
-from b2broker.models import Wallet
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from b2broker.models import Wallet, Transaction
+from b2broker.views import WalletViewSet
 
 
 @pytest.mark.django_db(transaction=True, reset_sequences=True)
@@ -39,6 +47,30 @@ def test_wallet_update(client):
     assert response_data["attributes"]["balance"] == "0.0"
 
 
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_update_racing_a_transaction_keeps_balance(client, monkeypatch):
+    Wallet.objects.create(label="test_wallet")
+    get_object = WalletViewSet.get_object
+
+    def get_object_then_write(self):
+        wallet = get_object(self)
+        # Committed after the wallet was loaded, before it is saved.
+        Transaction.objects.create(wallet_id=1, txid="123", amount=5)
+        return wallet
+
+    monkeypatch.setattr(WalletViewSet, "get_object", get_object_then_write)
+    request = {
+        "data": {"type": "wallets", "id": "1", "attributes": {"label": "renamed"}}
+    }
+    response = client.patch(
+        "/wallets/1/", data=request, content_type="application/vnd.api+json"
+    )
+    assert response.status_code == 200
+    wallet = Wallet.objects.get(pk=1)
+    assert wallet.label == "renamed"
+    assert wallet.balance == 5
+
+
 @pytest.mark.django_db(transaction=True, reset_sequences=True)
 def test_wallet_delete(client):
     w = Wallet.objects.create(label="test_wallet")
@@ -129,3 +161,299 @@ def test_wallet_sorting(client):
     assert response_data[9]["type"] == "wallets"
     assert response_data[9]["id"] == "1"
     assert response_data[9]["attributes"]["label"] == "test_wallet1"
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_list_query_count_does_not_grow_with_page_size(client):
+    for i in range(1, 31):
+        w = Wallet.objects.create(label=f"test_wallet{i}")
+        Transaction.objects.create(wallet=w, txid=f"transaction_{i}", amount=i)
+
+    query_counts = []
+    for page_size in (1, 10, 30):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(f"/wallets/?page[size]={page_size}")
+        assert response.status_code == 200
+        assert len(response.json()["data"]) == page_size
+        query_counts.append(len(queries))
+
+    assert query_counts[0] == query_counts[1] == query_counts[2]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_cursor_pagination(client):
+    for i in range(1, 6):
+        Wallet.objects.create(label=f"test_wallet{i}")
+    response = client.get("/wallets/?page[size]=3&page[cursor]=")
+    assert response.status_code == 200
+    response_data = response.json()["data"]
+    assert [resource["id"] for resource in response_data] == ["1", "2", "3"]
+
+    response = client.get(response.json()["links"]["next"])
+    assert response.status_code == 200
+    assert response.json()["links"]["next"] is None
+    response_data = response.json()["data"]
+    assert [resource["id"] for resource in response_data] == ["4", "5"]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_history(client):
+    w = Wallet.objects.create(label="test_wallet")
+    for txid, amount, day in (
+        ("1", 10, 1),
+        ("2", -4, 1),
+        ("3", 5, 2),
+        ("4", 1, 9),
+        ("5", 100, 40),
+    ):
+        t = Transaction.objects.create(wallet=w, txid=txid, amount=amount)
+        # created_at is not editable; move the rows and rollups to a fixed date.
+        Transaction.objects.filter(pk=t.pk).update(
+            created_at=datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+            + datetime.timedelta(days=day - 1)
+        )
+    call_command("rebuild_balances")
+
+    response = client.get("/wallets/1/history/")
+    assert response.status_code == 200
+    buckets = response.json()["meta"]["buckets"]
+    assert [bucket["start"] for bucket in buckets] == [
+        "2024-01-01",
+        "2024-01-02",
+        "2024-01-09",
+        "2024-02-09",
+    ]
+    assert buckets[0]["net_amount"] == "6.000000000000000000"
+    assert buckets[0]["credit_total"] == "10.000000000000000000"
+    assert buckets[0]["debit_total"] == "-4.000000000000000000"
+    assert buckets[0]["credit_count"] == 1
+    assert buckets[0]["debit_count"] == 1
+    assert [bucket["balance"] for bucket in buckets] == [
+        "6.000000000000000000",
+        "11.000000000000000000",
+        "12.000000000000000000",
+        "112.000000000000000000",
+    ]
+
+    response = client.get("/wallets/1/history/?interval=week")
+    assert response.status_code == 200
+    buckets = response.json()["meta"]["buckets"]
+    assert [bucket["start"] for bucket in buckets] == [
+        "2024-01-01",
+        "2024-01-08",
+        "2024-02-05",
+    ]
+    assert buckets[0]["net_amount"] == "11.000000000000000000"
+
+    response = client.get("/wallets/1/history/?interval=month&start=2024-02-01")
+    assert response.status_code == 200
+    buckets = response.json()["meta"]["buckets"]
+    assert [bucket["start"] for bucket in buckets] == ["2024-02-01"]
+    assert buckets[0]["balance"] == "112.000000000000000000"
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_history_is_updated_on_write(client):
+    w = Wallet.objects.create(label="test_wallet")
+    t = Transaction.objects.create(wallet=w, txid="1", amount=10)
+    Transaction.objects.create(wallet=w, txid="2", amount=-3)
+    t.amount = 20
+    t.save()
+
+    response = client.get("/wallets/1/history/")
+    assert response.status_code == 200
+    buckets = response.json()["meta"]["buckets"]
+    assert len(buckets) == 1
+    assert buckets[0]["credit_total"] == "20.000000000000000000"
+    assert buckets[0]["credit_count"] == 1
+    assert buckets[0]["debit_count"] == 1
+    assert buckets[0]["balance"] == "17.000000000000000000"
+
+    t.delete()
+    response = client.get("/wallets/1/history/")
+    buckets = response.json()["meta"]["buckets"]
+    assert buckets[0]["credit_count"] == 0
+    assert buckets[0]["balance"] == "-3.000000000000000000"
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_history_invalid_interval(client):
+    Wallet.objects.create(label="test_wallet")
+    response = client.get("/wallets/1/history/?interval=year")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_include_transactions(client):
+    for i in range(1, 4):
+        w = Wallet.objects.create(label=f"test_wallet{i}")
+        for j in range(i * 5):
+            Transaction.objects.create(wallet=w, txid=f"transaction_{i}_{j}", amount=1)
+
+    query_counts = []
+    for page_size in (1, 3):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(
+                f"/wallets/?include=transactions&page[size]={page_size}"
+            )
+        assert response.status_code == 200
+        query_counts.append(len(queries))
+    assert query_counts[0] == query_counts[1]
+
+    response_data = response.json()
+    relationship = response_data["data"][2]["relationships"]["transactions"]
+    assert len(relationship["data"]) == 10
+    assert relationship["data"][0] == {"type": "transactions", "id": "30"}
+    included = {resource["id"]: resource for resource in response_data["included"]}
+    assert len(included) == 5 + 10 + 10
+    assert included["30"]["attributes"]["txid"] == "transaction_3_14"
+    assert included["30"]["relationships"]["wallet"]["data"]["id"] == "3"
+
+    response = client.get("/wallets/1/?include=transactions")
+    assert response.status_code == 200
+    assert len(response.json()["included"]) == 5
+
+    # Not part of the document unless included.
+    response = client.get("/wallets/1/")
+    assert "relationships" not in response.json()["data"]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_sparse_fieldset(client):
+    Wallet.objects.create(label="test_wallet")
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get("/wallets/1/?fields[wallets]=label")
+    assert response.status_code == 200
+    assert response.json()["data"]["attributes"] == {"label": "test_wallet"}
+    assert all("balance" not in query["sql"] for query in queries)
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_balances(client, settings):
+    settings.B2BROKER_EXPORT_CHUNK_SIZE = 2
+    for i in range(1, 6):
+        w = Wallet.objects.create(label="odd" if i % 2 else "even")
+        Transaction.objects.create(wallet=w, txid=f"transaction_{i}", amount=i)
+
+    response = client.get("/wallets/balances/?filter[label]=odd")
+    assert response.status_code == 200
+    assert response.streaming
+    assert response["Content-Type"] == "application/x-ndjson; charset=utf-8"
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    resources = [json.loads(line) for line in lines]
+    assert [resource["id"] for resource in resources] == ["1", "3", "5"]
+    assert resources[2] == {
+        "type": "wallets",
+        "id": "5",
+        "attributes": {"balance": "5.000000000000000000"},
+    }
+
+    response = client.get("/wallets/balances.csv")
+    assert response["Content-Type"] == "text/csv; charset=utf-8"
+    content = b"".join(response.streaming_content).decode()
+    assert content.splitlines()[:3] == [
+        "id,balance",
+        "1,1.000000000000000000",
+        "2,2.000000000000000000",
+    ]
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_balances_by_id(client, settings):
+    settings.B2BROKER_EXPORT_CHUNK_SIZE = 2
+    for i in range(1, 6):
+        w = Wallet.objects.create(label=f"test_wallet{i}")
+        Transaction.objects.create(wallet=w, txid=f"transaction_{i}", amount=i)
+    request = {
+        "data": [{"type": "wallets", "id": str(pk)} for pk in (4, 99, 1, 2, 4, 5)]
+    }
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(
+            "/wallets/balances/", data=request, content_type="application/vnd.api+json"
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+    assert response.status_code == 200
+    assert [json.loads(line)["id"] for line in lines] == ["1", "2", "4", "5"]
+    # One query per chunk of two ids.
+    assert len(queries) == 3
+
+    ndjson = '{"type": "wallets", "id": "3"}\n'
+    response = client.post(
+        "/wallets/balances.csv", data=ndjson, content_type="application/x-ndjson"
+    )
+    content = b"".join(response.streaming_content).decode()
+    assert content.splitlines() == ["id,balance", "3,3.000000000000000000"]
+
+    request = {"data": [{"type": "transactions", "id": "1"}]}
+    response = client.post(
+        "/wallets/balances/", data=request, content_type="application/vnd.api+json"
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_balances_errors_are_json_api(client):
+    response = client.get("/wallets/balances.csv?filter[bogus]=1")
+    assert response.status_code == 400
+    assert response["Content-Type"] == "application/vnd.api+json"
+    assert response.content == client.get("/wallets/?filter[bogus]=1").content
+
+    response = client.post(
+        "/wallets/balances/", data="{", content_type="application/x-ndjson"
+    )
+    assert response.status_code == 400
+    assert response["Content-Type"] == "application/vnd.api+json"
+    assert response.json()["errors"][0]["code"] == "parse_error"
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+def test_wallet_balance_filtering_and_sorting(client):
+    for i, amount in enumerate(["5", "-1.5", "100", "0.000000000000000001"], start=1):
+        w = Wallet.objects.create(label=f"test_wallet{i}")
+        Transaction.objects.create(wallet=w, txid=f"transaction_{i}", amount=amount)
+
+    response = client.get("/wallets/?sort=-balance")
+    assert response.status_code == 200
+    assert [resource["id"] for resource in response.json()["data"]] == [
+        "3",
+        "1",
+        "4",
+        "2",
+    ]
+
+    response = client.get("/wallets/?filter[balance.gte]=5&sort=balance")
+    assert [resource["id"] for resource in response.json()["data"]] == ["1", "3"]
+    response = client.get("/wallets/?filter[balance.gt]=0&filter[balance.lt]=5")
+    assert [resource["id"] for resource in response.json()["data"]] == ["4"]
+    response = client.get("/wallets/?filter[balance.lte]=-1.5")
+    assert [resource["id"] for resource in response.json()["data"]] == ["2"]
+
+    response = client.get("/wallets/?filter[balance.gte]=abc")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db(transaction=True, reset_sequences=True)
+@pytest.mark.parametrize(
+    "sort, tiebreaker",
+    [("balance", "ASC"), ("-balance", "DESC"), ("label,id", None)],
+)
+@pytest.mark.parametrize("prefix", ["", "/async"])
+def test_wallet_sorting_breaks_ties_by_id(client, prefix, sort, tiebreaker):
+    id_column = connection.ops.quote_name("id")
+    for i in range(5):
+        Wallet.objects.create(label="test_wallet")
+
+    ids = []
+    for page in (1, 2, 3):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(
+                f"{prefix}/wallets/?sort={sort}&page[size]=2&page[number]={page}"
+            )
+        assert response.status_code == 200
+        ids += [resource["id"] for resource in response.json()["data"]]
+        order_by = queries[-1]["sql"].rpartition("ORDER BY")[2]
+        if tiebreaker:
+            assert order_by.split(" LIMIT")[0].endswith(f"{id_column} {tiebreaker}")
+        assert order_by.count(id_column) == 1
+    assert sorted(ids) == ["1", "2", "3", "4", "5"]